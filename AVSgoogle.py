@@ -3,6 +3,8 @@ import io
 from fpdf import FPDF
 import google.generativeai as genai  # --- Gemini Change ---
 import traceback
+from avs_config import load_config
+from freetext_parse import extract_inputs, is_structured_enough
 
 # --- Custom CSS for UI Style and Print ---
 st.markdown(
@@ -45,13 +47,14 @@ st.markdown(
 )
 
 # --- API Keys and Model Selection ---
-GEMINI_API_KEY = st.secrets["general"]["GEMINI_API_KEY"]  # Get Gemini key from secrets
+config = load_config()  # Resolved once per process, reloaded when secrets.toml changes
+GEMINI_API_KEY = config.gemini_api_key
 
 USE_GEMINI = True  # --- Gemini Change --- Set to True to use Gemini
 
 if USE_GEMINI:  # --- Gemini Change ---
     genai.configure(api_key=GEMINI_API_KEY)  # --- Gemini Change ---
-    gemini_model = genai.GenerativeModel('gemini-1.5-pro')  # --- Gemini Change --- Or use 'gemini-pro' if 1.5 is unavailable
+    gemini_model = genai.GenerativeModel(config.gemini_model)  # --- Gemini Change --- Set GEMINI_MODEL to 'gemini-pro' if 1.5 is unavailable
 
 # --- PDF Generation Function ---
 def generate_pdf(text: str) -> io.BytesIO:
@@ -220,11 +223,12 @@ def main():
                     file_name="AVS_Summary.pdf",
                     mime="application/pdf"
                 )
+                summary_html = summary_text.replace("\n", "<br>")
                 st.markdown(
                     f"""
                     <div id="printable">
                     <h3>Generated AVS Summary</h3>
-                    <p>{summary_text.replace("\n", "<br>")}</p>
+                    <p>{summary_html}</p>
                     </div>
                     """,
                     unsafe_allow_html=True
@@ -236,7 +240,10 @@ def main():
         st.sidebar.subheader("Free Text Command")
         free_text_command = st.sidebar.text_area("Enter your free text command for the AVS summary:", height=200)
         if st.sidebar.button("Generate AVS Summary"):
-            prompt = free_text_command
+            # Use the structured prompt when the command names at least the CKD stage
+            extracted, found = extract_inputs(free_text_command)
+            # extract_inputs already carries the original wording in additional_comments
+            prompt = build_prompt(extracted) if is_structured_enough(found) else free_text_command
             st.info("Generating AVS summary from free text command, please wait...")
             summary_text = generate_avs_summary(prompt)
             if summary_text:
@@ -249,11 +256,12 @@ def main():
                     file_name="AVS_Summary.pdf",
                     mime="application/pdf"
                 )
+                summary_html = summary_text.replace("\n", "<br>")
                 st.markdown(
                     f"""
                     <div id="printable">
                     <h3>Generated AVS Summary</h3>
-                    <p>{summary_text.replace("\n", "<br>")}</p>
+                    <p>{summary_html}</p>
                     </div>
                     """,
                     unsafe_allow_html=True
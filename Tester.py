@@ -1,5 +1,7 @@
 import streamlit as st
 import openai
+from avs_config import load_config
+from input_validation import parse_a1c, parse_bp
 from fpdf import FPDF
 from io import BytesIO
 
@@ -44,7 +46,7 @@ st.markdown(
 )
 
 # --- Set OpenAI API Key ---
-openai.api_key = st.secrets["general"]["MY_API_KEY"]
+openai.api_key = load_config().openai_api_key
 
 # --- PDF Generation Function ---
 def generate_pdf(text: str) -> BytesIO:
@@ -92,13 +94,13 @@ def build_prompt(inputs: dict) -> str:
 def generate_avs_summary(prompt: str) -> str:
     try:
         response = openai.ChatCompletion.create(
-            model="gpt-4",
+            model=load_config().openai_model,
             messages=[
                 {"role": "system", "content": "You are a knowledgeable medical assistant."},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=512,
-            temperature=0.7
+            max_tokens=load_config().max_tokens,
+            temperature=load_config().temperature
         )
         return response.choices[0].message.content.strip()
     except Exception as e:
@@ -125,13 +127,20 @@ def main():
         # Diabetes & HTN
         bp_status = st.sidebar.radio("Blood Pressure Status", 
                                       ["At Goal", "Above Goal"], key="bp_status")
+        input_errors = []
         if bp_status == "Above Goal":
-            bp_reading = st.sidebar.text_input("Enter BP Reading", key="bp_reading")
+            bp_reading, error = parse_bp(st.sidebar.text_input("Enter BP Reading", key="bp_reading"))
+            if error:
+                st.sidebar.error(error)
+                input_errors.append(error)
         else:
             bp_reading = "At Goal"
         diabetes_status = st.sidebar.radio("Diabetes Control", 
                                            ["Controlled", "Uncontrolled"], key="diabetes_status")
-        a1c_level = st.sidebar.text_input("Enter A1c Level (if available)", key="a1c_level")
+        a1c_level, error = parse_a1c(st.sidebar.text_input("Enter A1c Level (if available)", key="a1c_level"))
+        if error:
+            st.sidebar.error(error)
+            input_errors.append(error)
         
         # Labs
         st.sidebar.markdown("### Labs")
@@ -177,7 +186,7 @@ def main():
         else:
             med_change_types = []
         
-        structured_submit = st.sidebar.button("Generate AVS Summary")
+        structured_submit = st.sidebar.button("Generate AVS Summary", disabled=bool(input_errors))
     
     else:  # Free Text Command Mode
         st.sidebar.header("Free Text Input")
@@ -219,11 +228,12 @@ def main():
                 file_name="AVS_Summary.pdf",
                 mime="application/pdf"
             )
+            summary_html = summary_text.replace("\n", "<br>")
             st.markdown(
                 f"""
                 <div id="printable">
                 <h3>Generated AVS Summary</h3>
-                <p>{summary_text.replace("\n", "<br>")}</p>
+                <p>{summary_html}</p>
                 </div>
                 """,
                 unsafe_allow_html=True
@@ -246,11 +256,12 @@ def main():
                 file_name="AVS_Summary.pdf",
                 mime="application/pdf"
             )
+            summary_html = summary_text.replace("\n", "<br>")
             st.markdown(
                 f"""
                 <div id="printable">
                 <h3>Generated AVS Summary</h3>
-                <p>{summary_text.replace("\n", "<br>")}</p>
+                <p>{summary_html}</p>
                 </div>
                 """,
                 unsafe_allow_html=True
@@ -1,9 +1,37 @@
 import streamlit as st
-import openai
-from fpdf import FPDF
-from io import BytesIO
+import hmac
+import os
+import tempfile
+import threading
+import pandas as pd
+from datetime import date, timedelta
+from visit_history import VisitHistory
+from avs_sections import generate_sections, join_sections, regenerate_incrementally
+from avs_pdf import generate_pdf, generate_sections_pdf, merge_summaries, zip_summaries
+from print_view import render_print_view
+from avs_prompt import build_prompt
+from providers import provider_from_config
+from async_generation import AsyncGenerationCore
+from speculative import SpeculativeGenerator
+from med_education import splice_education
+from avs_config import load_config
+from lab_ingest import classify_panel, load_lab_csv
+from egfr import EGFRTrendCache, derive_stage_and_trend
+from freetext_parse import extract_inputs, is_structured_enough
+from translation import SUPPORTED_LANGUAGES, TranslationMemory, make_llm_translator, translate_sections, translate_texts
+from job_queue import FAILED, FINISHED_STATES, JobQueue
+from cache_backend import make_backend
+from priority_scheduler import INTERACTIVE
+from consistency_check import STATS as CONSISTENCY_STATS, review_notes, verify_and_repair
+from input_validation import parse_a1c, parse_bp
+from avs_options import (BP_OPTIONS, CKD_STAGES, DIABETES_OPTIONS, KIDNEY_TRENDS, LAB_LEVELS, MED_CHANGE_OPTIONS,
+                         MED_CHANGE_TYPES, PROTEINURIA_OPTIONS)
+from batch_generation import DeferredQueue, make_batch_client, poll_and_ingest, submit_pending
+from cache_warmer import rank_profiles, warm_cache
+from fhir_export import export_ndjson
+from request_profiler import RequestProfiler, list_profiles, profile_scope, profiled
 
-# --- Custom CSS for UI Style and Print ---
+# --- Custom CSS for UI Style ---
 st.markdown(
     """
     <style>
@@ -24,140 +52,391 @@ st.markdown(
         border: none;
         border-radius: 4px;
     }
-    /* Print styles: Only display the #printable div */
-    @media print {
-      body * {
-        visibility: hidden;
-      }
-      #printable, #printable * {
-        visibility: visible;
-      }
-      #printable {
-        position: absolute;
-        left: 0;
-        top: 0;
-      }
-    }
     </style>
     """,
     unsafe_allow_html=True
 )
 
-# --- Set OpenAI API Key ---
-openai.api_key = st.secrets["general"]["MY_API_KEY"]
+NUMERIC_LAB_LABELS = {
+    "hemoglobin": "Hemoglobin (g/dL)",
+    "iron": "Iron Saturation (TSAT %)",
+    "potassium": "Potassium (mmol/L)",
+    "bicarbonate": "Bicarbonate (mmol/L)",
+    "sodium": "Sodium (mmol/L)",
+    "pth": "PTH (pg/mL)",
+    "vitamin_d": "Vitamin D, 25-OH (ng/mL)",
+    "calcium": "Calcium (mg/dL)",
+}
 
-# --- PDF Generation Function with Header Formatting ---
-def generate_pdf(text: str) -> BytesIO:
-    pdf = FPDF()
-    pdf.add_page()
-    
-    # Header
-    pdf.set_font("Arial", "B", 16)
-    pdf.cell(0, 10, "Nephrology Associates of Lexington P.S.C", ln=1, align="C")
-    
-    # Sub-heading
-    pdf.set_font("Arial", "B", 14)
-    pdf.cell(0, 10, "After Visit Summary", ln=1, align="C")
-    
-    # Spacing
-    pdf.ln(10)
-    
-    # Content
-    pdf.set_font("Arial", "", 12)
-    pdf.multi_cell(0, 10, text)
-    
-    pdf_bytes = pdf.output(dest="S").encode("latin1")
-    return BytesIO(pdf_bytes)
-
-# --- Build Prompt from Structured Inputs ---
-def build_prompt(inputs: dict) -> str:
-    lines = [
-        "Generate an AVS summary for the following patient details. Structure the response using the following headings:",
-        "",
-        "1. CKD Stage & Kidney Function:",
-        "   - Summarize the CKD stage and the kidney function trend.",
-        "",
-        "2. Proteinuria:",
-        "   - Describe the proteinuria status if provided.",
-        "",
-        "3. HTN & DM:",
-        "   - Summarize the patient's blood pressure status and diabetes control, including any details like BP readings or A1c levels.",
-        "",
-        "4. Labs:",
-        "   - Summarize key lab results including details on anemia, electrolyte levels, and bone mineral disease findings.",
-        "",
-        "5. Suggestions:",
-        "   - Provide 1-2 concise lines of recommendations or next steps based on the provided data.",
-        "",
-        "Patient Details:"
-    ]
-    
-    # Patient Details
-    lines.append(f"- CKD Stage: {inputs.get('ckd_stage', 'Not Provided')}")
-    lines.append(f"- Kidney Function Trend: {inputs.get('kidney_trend', 'Not Provided')}")
-    
-    if inputs.get("proteinuria_status", "None") not in ["None", "N/A"]:
-        lines.append(f"- Proteinuria: {inputs['proteinuria_status']}")
-    
-    if inputs.get("bp_status", "None") not in ["None", "N/A"]:
-        lines.append(f"- Blood Pressure Status: {inputs['bp_status']}")
-        if inputs['bp_status'] == "Above Goal":
-            lines.append(f"  - BP Reading: {inputs['bp_reading']}")
-    
-    if inputs.get("diabetes_status", "None") not in ["None", "N/A"]:
-        lines.append(f"- Diabetes Control: {inputs['diabetes_status']}")
-        if inputs['diabetes_status'] == "Uncontrolled":
-            lines.append(f"  - A1c Level: {inputs['a1c_level']}")
-    
-    # Labs Section
-    lines.append("Labs:")
-    if inputs.get("anemia_included", False):
-        lines.append(f"  - Hemoglobin: {inputs.get('hemoglobin_status', 'Not Provided')}")
-        lines.append(f"  - Iron: {inputs.get('iron_status', 'Not Provided')}")
-    
-    if inputs.get("electrolyte_included", False):
-        lines.append(f"  - Potassium: {inputs.get('potassium_status', 'Not Provided')}")
-        lines.append(f"  - Bicarbonate: {inputs.get('bicarbonate_status', 'Not Provided')}")
-        lines.append(f"  - Sodium: {inputs.get('sodium_status', 'Not Provided')}")
-    
-    if inputs.get("bone_included", False):
-        lines.append(f"  - PTH: {inputs.get('pth_status', 'Not Provided')}")
-        lines.append(f"  - Vitamin D: {inputs.get('vitamin_d_status', 'Not Provided')}")
-        lines.append(f"  - Calcium: {inputs.get('calcium_status', 'Not Provided')}")
-    
-    # Medication Change Section
-    lines.append(f"- Medication Change: {inputs.get('med_change', 'No')}")
-    if inputs.get("med_change", "No") == "Yes" and inputs.get("med_change_types"):
-        lines.append(f"  - Medication Changes: {', '.join(inputs['med_change_types'])}")
-    
-    # Additional Clinical Comments
-    if inputs.get("additional_comments", "").strip():
-        lines.append("")
-        lines.append("Additional Clinical Comments:")
-        lines.append(inputs["additional_comments"])
-    
-    lines.append("")
-    lines.append("Please generate the AVS summary following the above structure. Each section should begin with the designated heading, and the final section (Suggestions) should include 1–2 lines of clinical recommendations based on the data.")
-    
-    return "\n".join(lines)
+# --- Visit History Store (one per process) ---
+@st.cache_resource
+def get_visit_history() -> VisitHistory:
+    return VisitHistory()
+
+# --- eGFR trend cache (one per process), seeded from a patient's stored visits on first use ---
+@st.cache_resource
+def get_egfr_trend_cache() -> EGFRTrendCache:
+    return EGFRTrendCache()
+
+def get_egfr_cache(patient_id: str) -> EGFRTrendCache:
+    cache = get_egfr_trend_cache()
+    if patient_id and patient_id not in cache:
+        for visit in get_visit_history().visits_for_patient(patient_id):
+            if visit["inputs"].get("egfr") is not None:
+                cache.add(patient_id, visit["visit_date"], visit["inputs"]["egfr"])
+    return cache
+
+# --- Pick the selectbox index for a value carried over from a prior visit ---
+def option_index(options: list, value) -> int:
+    return options.index(value) if value in options else 0
 
-# --- Generate AVS Summary from OpenAI ---
-def generate_avs_summary(prompt: str) -> str:
+# --- Free-form entry checked by a parser: shows the problem (and blocks Generate) or the canonical value ---
+def validated_text_input(label: str, parse, errors: list, placeholder: str = "") -> str:
+    raw = st.text_input(label, placeholder=placeholder)
+    value, error = parse(raw)
+    if error:
+        st.error(error)
+        errors.append(label)
+        return ""
+    if value and value != raw.strip():
+        st.caption(f"Using {value}")
+    return value
+
+# --- Numeric lab entry (typed values or a clinic CSV export), classified against CKD-stage ranges ---
+def numeric_lab_entry(patient_id: str, ckd_stage: str) -> dict:
+    uploaded = st.file_uploader("Import Lab Export (CSV with patient_id column)", type="csv")
+    imported = {}
+    if uploaded is not None:
+        panels = load_lab_csv(uploaded)
+        if "patient_id" in panels:
+            match = panels[panels["patient_id"].astype(str) == patient_id]
+            if not match.empty:
+                imported = match.iloc[-1].to_dict()
+    values = {}
+    for analyte, label in NUMERIC_LAB_LABELS.items():
+        default = imported.get(analyte)
+        raw = st.text_input(label, value="" if default is None or pd.isna(default) else str(default))
+        try:
+            values[analyte] = float(raw) if raw.strip() else None
+        except ValueError:
+            st.warning(f"{label}: '{raw}' is not a number and was ignored.")
+            values[analyte] = None
+    return classify_panel(values, ckd_stage)
+
+# --- Queue the summaries for printing and render the client-side print view ---
+def clear_print_queue():
+    st.session_state["print_queue"] = []
+
+def show_print_view(*summary_texts: str):
+    queue = st.session_state.setdefault("print_queue", [])
+    # Showing the same job again (the Job Queue "Show" button) must not queue its summary twice
+    summary_texts = [text for text in summary_texts if text]
+    if not summary_texts:
+        return
+    positions = {item["text"]: i for i, item in enumerate(queue)}
+    for text in summary_texts:
+        if text not in positions:
+            positions[text] = len(queue)
+            queue.append({"title": f"Generated AVS Summary ({len(queue) + 1})", "text": text})
+    # The job being shown (its translation when there is one) is the summary on screen and printed,
+    # wherever it sits in the queue
+    current = positions[summary_texts[-1]]
+    render_print_view(queue, load_config().clinic_name, current)
+    # Cleared in the callback: the rerun the click causes may not display a job again
+    if len(queue) > 1:
+        st.button("Clear Print Queue", on_click=clear_print_queue)
+
+# --- Translation memory (one per process) ---
+@st.cache_resource
+def get_translation_memory() -> TranslationMemory:
+    return TranslationMemory()
+
+# --- Translate a generated summary (sections or plain text) and offer its PDF ---
+def show_translation(summary, language: str):
+    translator = make_llm_translator(generate_avs_summary)
+    memory = get_translation_memory()
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a knowledgeable medical assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=550,
-            temperature=0.6
-        )
-        return response.choices[0].message.content.strip()
+        title = translate_texts(["After Visit Summary"], language, memory, translator)[0]
+        if isinstance(summary, dict):
+            translated_sections = translate_sections(summary, language, memory, translator)
+            translated_text = join_sections(translated_sections)
+            pdf_data = generate_sections_pdf(translated_sections, title)
+        else:
+            translated_text = translate_texts([summary], language, memory, translator)[0]
+            pdf_data = generate_pdf(translated_text, title)
+    except (ValueError, KeyError) as e:
+        st.error(f"Error translating summary: {e}")
+        return ""
+    st.subheader(f"{language} Summary")
+    st.download_button(
+        label=f"Download {language} Summary as PDF",
+        data=pdf_data.getvalue(),
+        file_name=f"AVS_Summary_{language.split()[0]}.pdf",
+        mime="application/pdf"
+    )
+    return translated_text
+
+# --- Generation stack for the current config version: provider, cache backend, core, speculator ---
+# One stack per process. On a config change the new stack is built and the old one is retired
+# in the background: speculation cancelled, in-flight calls drained, loop and pools stopped.
+# A "local" provider keeps the loaded model and its single worker across stacks.
+@st.cache_resource
+def get_generation_stacks() -> dict:
+    return {"lock": threading.Lock(), "version": None, "stack": None}
+
+def build_generation_stack(config) -> dict:
+    # A redis:// cache_url shares replies and the rate limit across replicas
+    core = AsyncGenerationCore(provider_from_config(config), cache=make_backend(config.cache_url),
+                               requests_per_minute=config.requests_per_minute,
+                               cache_ttl=config.cache_ttl_seconds)
+    speculator = None
+    if config.speculative_max_per_hour > 0:
+        speculator = SpeculativeGenerator(core, debounce_seconds=config.speculative_debounce_seconds,
+                                          max_per_hour=config.speculative_max_per_hour)
+    return {"core": core, "speculator": speculator}
+
+def retire_generation_stack(stack: dict):
+    if stack["speculator"]:
+        stack["speculator"].close()
+    stack["core"].close()
+    stack["core"].cache.close()
+
+def get_generation_stack(config_version: int) -> dict:
+    stacks = get_generation_stacks()
+    with stacks["lock"]:
+        if stacks["version"] != config_version:
+            previous = stacks["stack"]
+            stacks["stack"], stacks["version"] = build_generation_stack(load_config()), config_version
+            if previous:
+                threading.Thread(target=retire_generation_stack, args=(previous,), name="avs-retire-stack",
+                                 daemon=True).start()
+        return stacks["stack"]
+
+# --- Shared asyncio generation core; every session's provider calls run on its loop ---
+def get_generation_core(config_version: int) -> AsyncGenerationCore:
+    return get_generation_stack(config_version)["core"]
+
+# --- Speculative pre-generation (None when speculative_max_per_hour is 0) ---
+def get_speculator(config_version: int):
+    return get_generation_stack(config_version)["speculator"]
+
+# --- Generate AVS Summary from the configured provider ---
+@profiled("generate_avs_summary")
+def generate_avs_summary(prompt: str, json_mode: bool = False) -> str:
+    try:
+        return get_generation_core(load_config().version).generate(prompt, json_mode=json_mode)
     except Exception as e:
         st.error(f"Error generating summary: {e}")
         return ""
 
+# --- Job handlers: run on the queue's worker threads, so they raise instead of calling st.error ---
+# Jobs are checkouts waiting on screen, so they run at interactive priority; the browser
+# session stands in for the clinician when sharing capacity fairly
+@profiled("generate_avs_summary")
+def generate_for_job(prompt: str, json_mode: bool = False, clinician: str = "") -> str:
+    core = get_generation_core(load_config().version)
+    return core.generate(prompt, json_mode=json_mode, priority=INTERACTIVE, clinician=clinician)
+
+def render_pdf_for_job(content) -> bytes:
+    core = get_generation_core(load_config().version)
+    return core.run(core.arender_pdf(content))
+
+def consistency_notes(report: dict) -> list:
+    notes = []
+    if report["repaired"]:
+        notes.append(f"Corrected sections that misstated an input: {', '.join(report['repaired'])}")
+    notes.extend(review_notes(report["unresolved"]))
+    return notes
+
+def run_structured_job(payload: dict, report_progress) -> tuple:
+    inputs, prompt, previous = payload["inputs"], payload["prompt"], payload["previous"]
+    speculator = get_speculator(load_config().version)
+    report_progress("Checking speculative result")
+    sections = speculator.take(payload["session_id"], prompt) if speculator else None
+    speculated = bool(sections)
+    if speculated:
+        regenerated, notes = [], ["Served from speculative pre-generation."]
+    else:
+        report_progress("Generating sections")
+        # Reuse sections from the previous generation whose inputs did not change
+        sections, regenerated = regenerate_incrementally(
+            prompt, inputs, previous, lambda p: generate_for_job(p, json_mode=True, clinician=payload["session_id"])
+        )
+        notes = []
+    if not sections:
+        raise ValueError("the model returned no summary")
+    # A speculative result is a full generation, so there is no incremental reuse to report
+    if previous and not speculated and len(regenerated) < 5:
+        notes.append(f"Regenerated sections: {', '.join(regenerated) or 'none (inputs unchanged)'}")
+    report_progress("Checking summary against inputs")
+    sections, report = verify_and_repair(
+        prompt, sections, inputs, lambda p: generate_for_job(p, json_mode=True, clinician=payload["session_id"])
+    )
+    notes.extend(consistency_notes(report))
+    generated = sections
+    sections = splice_education(sections, inputs)
+    summary_text = join_sections(sections)
+    report_progress("Rendering PDF")
+    pdf_bytes = render_pdf_for_job(sections)
+    if payload["patient_id"]:
+        get_visit_history().save_visit(payload["patient_id"], inputs, prompt, summary_text,
+                                       pdf_bytes, visit_date=date.today().isoformat())
+    result = {"sections": sections, "summary_text": summary_text, "notes": notes,
+              "last_structured": {"inputs": inputs, "sections": generated}}
+    return result, pdf_bytes
+
+def run_free_text_job(payload: dict, report_progress) -> tuple:
+    # Pull structured fields out locally so free text can use the structured prompt
+    extracted, found = extract_inputs(payload["text"])
+    report_progress("Generating summary")
+    generate = lambda p: generate_for_job(p, json_mode=True, clinician=payload["session_id"])
+    if is_structured_enough(found):
+        notes = [f"Recognised from free text: {', '.join(found)}"]
+        prompt = build_prompt(extracted, compact=load_config().prompt_mode == "compact")
+        sections = generate_sections(prompt, generate)
+        if sections:
+            sections, report = verify_and_repair(prompt, sections, extracted, generate)
+            notes.extend(consistency_notes(report))
+        sections = splice_education(sections, extracted) if sections else None
+        summary_text = join_sections(sections) if sections else ""
+    else:
+        notes, sections = [], None
+        summary_text = generate_for_job(payload["text"], clinician=payload["session_id"])
+    if not summary_text:
+        raise ValueError("the model returned no summary")
+    report_progress("Rendering PDF")
+    pdf_bytes = render_pdf_for_job(sections or summary_text)
+    return {"sections": sections, "summary_text": summary_text, "notes": notes}, pdf_bytes
+
+def run_batch_merge_job(payload: dict, report_progress) -> tuple:
+    report_progress("Merging stored summaries")
+    visits = get_visit_history().iter_visits_between(payload["start"], payload["end"])
+    merged = merge_summaries(v["summary"] for v in visits)
+    return {"start": payload["start"], "end": payload["end"]}, merged.getvalue()
+
+def run_warm_cache_job(payload: dict, report_progress) -> tuple:
+    config = load_config()
+    report_progress("Ranking input profiles")
+    profiles = rank_profiles(get_visit_history(), compact=config.prompt_mode == "compact")
+    stats = warm_cache(get_generation_core(config.version), profiles, config.warm_budget_usd,
+                       config.max_tokens, report_progress=report_progress)
+    return stats, None
+
+# --- Session jobs run in the submitting session's profile scope ---
+def session_scoped(handler):
+    def run_in_session(payload: dict, report_progress) -> tuple:
+        with profile_scope(payload["session_id"]):
+            return handler(payload, report_progress)
+    return run_in_session
+
+# --- Durable job queue (one per process); finished results and PDFs survive disconnects ---
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    queue = JobQueue()
+    queue.register("structured", session_scoped(run_structured_job))
+    queue.register("free_text", session_scoped(run_free_text_job))
+    queue.register("batch_merge", session_scoped(run_batch_merge_job))
+    queue.register("warm_cache", run_warm_cache_job, background=True)
+    return queue
+
+# --- Visits deferred to the overnight provider batch (one store per process) ---
+@st.cache_resource
+def get_deferred_queue() -> DeferredQueue:
+    return DeferredQueue()
+
+# --- Sidebar panel to submit deferred visits, ingest finished batches and warm the cache ---
+def overnight_batch_panel(session_id: str):
+    deferred = get_deferred_queue()
+    with st.sidebar.expander("Overnight Batch", expanded=False):
+        counts = deferred.counts()
+        st.caption(" | ".join(f"{state.title()}: {counts.get(state, 0)}"
+                              for state in ("pending", "claimed", "submitted", "ingested", "failed")))
+        try:
+            if st.button("Submit Pending Visits"):
+                batch_id = submit_pending(deferred, make_batch_client())
+                st.write(f"Submitted batch {batch_id}" if batch_id else "No pending visits.")
+            if st.button("Check Batches"):
+                totals = poll_and_ingest(deferred, make_batch_client(), get_visit_history())
+                st.write(f"Ingested {totals['ingested']}, failed {totals['failed']}, still running {totals['open']}.")
+        except Exception as e:
+            st.error(f"Batch request failed: {e}")
+        # Warming runs on the queue's background worker at batch priority, so it neither holds an
+        # interactive worker nor competes with clinic traffic for the provider
+        if st.button("Warm Response Cache"):
+            job_id = get_job_queue().submit("warm_cache", session_id, {})
+            st.write(f"Warming job {job_id[:8]} queued (budget ${load_config().warm_budget_usd:.2f}).")
+
+# --- Session token kept in the URL so a reconnecting browser reattaches to its jobs until it expires ---
+def get_session_id() -> str:
+    queue = get_job_queue()
+    token = st.query_params.get("session")
+    # An unknown or expired link starts a fresh session instead of reopening old summaries
+    if not token or not queue.session_valid(token):
+        token = queue.new_session()
+        st.query_params["session"] = token
+    return token
+
+# --- Block the rerun on a job, showing its progress, and return the finished job ---
+def wait_for_job(job_id: str) -> dict:
+    status = st.empty()
+    while True:
+        job = get_job_queue().wait(job_id, timeout=0.5)
+        if job["state"] in FINISHED_STATES:
+            status.empty()
+            return job
+        status.info(f"Job {job_id[:8]} {job['state']}: {job['progress'] or 'waiting for a worker'}...")
+
+# --- Sidebar panel listing this session's jobs; returns a job id the user asked to show ---
+def job_queue_panel(session_id: str) -> str:
+    queue = get_job_queue()
+    with st.sidebar.expander("Job Queue", expanded=False):
+        counts = queue.counts()
+        st.caption(f"Queued: {counts.get('queued', 0)} | Running: {counts.get('running', 0)}")
+        rates = CONSISTENCY_STATS.rates()
+        st.caption(f"Consistency: {rates['checked']} checked, {rates['mismatch_rate']:.0%} mismatched, "
+                   f"{rates['repair_rate']:.0%} of those repaired")
+        delays = get_generation_core(load_config().version).queue_stats()
+        st.caption("Provider queue p95 wait: " + " | ".join(
+            f"{name} {stats['p95_delay']:.1f}s ({stats['waiting']} waiting)" for name, stats in delays.items()))
+        st.button("Refresh", key="refresh_jobs")
+        selected = None
+        for job in queue.jobs_for_session(session_id, limit=10):
+            label = f"{job['kind']} {job['id'][:8]}: {job['state']}"
+            if job["state"] not in FINISHED_STATES and job["progress"]:
+                label += f" ({job['progress']})"
+            st.write(label)
+            if job["state"] in FINISHED_STATES and st.button("Show", key=f"show_{job['id']}"):
+                selected = job["id"]
+    return selected
+
+# --- Display a finished job: summary PDF, translation and print view, or a batch download ---
+def show_job_result(job: dict, language: str):
+    if job["state"] == FAILED:
+        st.error(f"Error generating summary: {job['error']}")
+        return
+    result = job["result"]
+    if job["kind"] == "warm_cache":
+        st.write(f"Cache warming: {result['warmed']} warmed, {result['already_cached']} already cached, "
+                 f"{result['failed']} failed, about ${result['estimated_usd']:.2f} spent.")
+        return
+    if job["kind"] == "batch_merge":
+        st.download_button("Download Merged PDF", data=job["pdf"], key=f"pdf_{job['id']}",
+                           file_name=f"AVS_Batch_{result['start']}_{result['end']}.pdf", mime="application/pdf")
+        return
+    for note in result["notes"]:
+        st.caption(note)
+    st.subheader("Generated AVS Summary")
+    st.download_button(
+        label="Download Summary as PDF",
+        data=job["pdf"],
+        file_name="AVS_Summary.pdf",
+        mime="application/pdf",
+        key=f"pdf_{job['id']}"
+    )
+    summary = result["sections"] or result["summary_text"]
+    translated_text = show_translation(summary, language) if language != "English" else ""
+    show_print_view(result["summary_text"], translated_text)
+
 # --- Main App Function with Sidebar Expanders ---
 def main():
     st.title("AVS Summary Generator")
@@ -165,93 +444,130 @@ def main():
     
     # Input mode selection in sidebar
     input_mode = st.sidebar.radio("Select Input Mode", ["Structured Input", "Free Text Command"])
+    language = st.sidebar.selectbox("Summary Language", SUPPORTED_LANGUAGES)
+    session_id = get_session_id()
+    queue = get_job_queue()
+    shown_job = job_queue_panel(session_id)
     
     if input_mode == "Structured Input":
         # Patient Details Section
         with st.sidebar.expander("Patient Details", expanded=True):
-            ckd_stage = st.selectbox("CKD Stage", ["I", "II", "IIIa", "IIIb", "IV", "V", "N/A"])
-            kidney_trend = st.selectbox("Kidney Function Trend", ["Stable", "Worsening", "Improving", "N/A"])
-            proteinuria_status = st.selectbox("Proteinuria Status (if applicable)", ["None", "Not Present", "Improving", "Worsening"])
-            bp_status = st.selectbox("Blood Pressure Status", ["None", "At Goal", "Above Goal"])
-            bp_reading = st.text_input("Enter BP Reading", value="At Goal") if bp_status == "Above Goal" else "At Goal"
-            diabetes_status = st.selectbox("Diabetes Control", ["None", "Controlled", "Uncontrolled"])
+            patient_id = st.text_input("Patient ID (optional, enables visit history)").strip()
+            prior = get_visit_history().prefill_inputs(patient_id) if patient_id else {}
+            if prior:
+                st.caption("Prefilled from the most recent visit.")
+            egfr_value = None
+            if st.checkbox("Derive stage and trend from creatinine"):
+                creatinine = st.number_input("Serum Creatinine (mg/dL)", min_value=0.1, max_value=25.0, value=1.0, step=0.1)
+                age = st.number_input("Age (years)", min_value=18, max_value=120, value=60)
+                sex = st.radio("Sex", ["F", "M"], horizontal=True)
+                derived = derive_stage_and_trend(get_egfr_cache(patient_id), patient_id, creatinine, age, sex)
+                egfr_value = derived["egfr"]
+                st.caption(f"eGFR (CKD-EPI 2021): {egfr_value} mL/min/1.73m²")
+                # The derived values win over the prior visit's selections
+                prior = {**prior, "ckd_stage": derived["ckd_stage"], "kidney_trend": derived["kidney_trend"]}
+            ckd_stage = st.selectbox("CKD Stage", CKD_STAGES, index=option_index(CKD_STAGES, prior.get("ckd_stage")))
+            kidney_trend = st.selectbox("Kidney Function Trend", KIDNEY_TRENDS,
+                                        index=option_index(KIDNEY_TRENDS, prior.get("kidney_trend")))
+            proteinuria_status = st.selectbox("Proteinuria Status (if applicable)", PROTEINURIA_OPTIONS,
+                                              index=option_index(PROTEINURIA_OPTIONS, prior.get("proteinuria_status")))
+            bp_status = st.selectbox("Blood Pressure Status", BP_OPTIONS, index=option_index(BP_OPTIONS, prior.get("bp_status")))
+            input_errors = []
+            if bp_status == "Above Goal":
+                bp_reading = validated_text_input("Enter BP Reading", parse_bp, input_errors, placeholder="e.g. 150/90")
+            else:
+                bp_reading = "At Goal"
+            diabetes_status = st.selectbox("Diabetes Control", DIABETES_OPTIONS,
+                                           index=option_index(DIABETES_OPTIONS, prior.get("diabetes_status")))
             if diabetes_status == "Uncontrolled":
-                a1c_level = st.text_input("Enter A1c Level")
+                a1c_level = validated_text_input("Enter A1c Level", parse_a1c, input_errors,
+                                                 placeholder="e.g. 8.2 or 66 mmol/mol")
             else:
                 a1c_level = ""
         
         # Labs Section with Dynamic Components
         with st.sidebar.expander("Labs", expanded=True):
-            st.subheader("Anemia Labs")
-            anemia_included = st.checkbox("Include Anemia Labs")
-            if anemia_included:
-                hemoglobin_available = st.checkbox("Include Hemoglobin?")
-                if hemoglobin_available:
-                    hemoglobin_status = st.selectbox("Hemoglobin", ["Low", "Normal", "High"])
-                else:
-                    hemoglobin_status = "Not Provided"
-                iron_available = st.checkbox("Include Iron?")
-                if iron_available:
-                    iron_status = st.selectbox("Iron", ["Low", "Normal", "High"])
-                else:
-                    iron_status = "Not Provided"
+            lab_entry = st.radio("Lab Entry", ["Select Status", "Numeric Values"], horizontal=True)
+            if lab_entry == "Numeric Values":
+                lab_fields = numeric_lab_entry(patient_id, ckd_stage)
+                hemoglobin_status, iron_status = lab_fields["hemoglobin_status"], lab_fields["iron_status"]
+                potassium_status = lab_fields["potassium_status"]
+                bicarbonate_status = lab_fields["bicarbonate_status"]
+                sodium_status = lab_fields["sodium_status"]
+                pth_status, vitamin_d_status = lab_fields["pth_status"], lab_fields["vitamin_d_status"]
+                calcium_status = lab_fields["calcium_status"]
+                anemia_included = lab_fields["anemia_included"]
+                electrolyte_included = lab_fields["electrolyte_included"]
+                bone_included = lab_fields["bone_included"]
             else:
-                hemoglobin_status = "Not Reviewed"
-                iron_status = "Not Reviewed"
-            
-            st.subheader("Electrolyte Labs")
-            electrolyte_included = st.checkbox("Include Electrolyte Labs")
-            if electrolyte_included:
-                potassium_available = st.checkbox("Include Potassium?")
-                if potassium_available:
-                    potassium_status = st.selectbox("Potassium", ["Low", "Normal", "High"])
-                else:
-                    potassium_status = "Not Provided"
-                bicarbonate_available = st.checkbox("Include Bicarbonate?")
-                if bicarbonate_available:
-                    bicarbonate_status = st.selectbox("Bicarbonate", ["Low", "Normal", "High"])
-                else:
-                    bicarbonate_status = "Not Provided"
-                sodium_available = st.checkbox("Include Sodium?")
-                if sodium_available:
-                    sodium_status = st.selectbox("Sodium", ["Low", "Normal", "High"])
+                st.subheader("Anemia Labs")
+                anemia_included = st.checkbox("Include Anemia Labs")
+                if anemia_included:
+                    hemoglobin_available = st.checkbox("Include Hemoglobin?")
+                    if hemoglobin_available:
+                        hemoglobin_status = st.selectbox("Hemoglobin", LAB_LEVELS)
+                    else:
+                        hemoglobin_status = "Not Provided"
+                    iron_available = st.checkbox("Include Iron?")
+                    if iron_available:
+                        iron_status = st.selectbox("Iron", LAB_LEVELS)
+                    else:
+                        iron_status = "Not Provided"
                 else:
-                    sodium_status = "Not Provided"
-            else:
-                potassium_status = "Not Reviewed"
-                bicarbonate_status = "Not Reviewed"
-                sodium_status = "Not Reviewed"
+                    hemoglobin_status = "Not Reviewed"
+                    iron_status = "Not Reviewed"
             
-            st.subheader("Bone Mineral Disease Labs")
-            bone_included = st.checkbox("Include Bone Mineral Disease Labs")
-            if bone_included:
-                pth_available = st.checkbox("Include PTH?")
-                if pth_available:
-                    pth_status = st.selectbox("PTH", ["Low", "Normal", "High"])
-                else:
-                    pth_status = "Not Provided"
-                vitamin_d_available = st.checkbox("Include Vitamin D?")
-                if vitamin_d_available:
-                    vitamin_d_status = st.selectbox("Vitamin D", ["Low", "Normal", "High"])
+                st.subheader("Electrolyte Labs")
+                electrolyte_included = st.checkbox("Include Electrolyte Labs")
+                if electrolyte_included:
+                    potassium_available = st.checkbox("Include Potassium?")
+                    if potassium_available:
+                        potassium_status = st.selectbox("Potassium", LAB_LEVELS)
+                    else:
+                        potassium_status = "Not Provided"
+                    bicarbonate_available = st.checkbox("Include Bicarbonate?")
+                    if bicarbonate_available:
+                        bicarbonate_status = st.selectbox("Bicarbonate", LAB_LEVELS)
+                    else:
+                        bicarbonate_status = "Not Provided"
+                    sodium_available = st.checkbox("Include Sodium?")
+                    if sodium_available:
+                        sodium_status = st.selectbox("Sodium", LAB_LEVELS)
+                    else:
+                        sodium_status = "Not Provided"
                 else:
-                    vitamin_d_status = "Not Provided"
-                calcium_available = st.checkbox("Include Calcium?")
-                if calcium_available:
-                    calcium_status = st.selectbox("Calcium", ["Low", "Normal", "High"])
+                    potassium_status = "Not Reviewed"
+                    bicarbonate_status = "Not Reviewed"
+                    sodium_status = "Not Reviewed"
+            
+                st.subheader("Bone Mineral Disease Labs")
+                bone_included = st.checkbox("Include Bone Mineral Disease Labs")
+                if bone_included:
+                    pth_available = st.checkbox("Include PTH?")
+                    if pth_available:
+                        pth_status = st.selectbox("PTH", LAB_LEVELS)
+                    else:
+                        pth_status = "Not Provided"
+                    vitamin_d_available = st.checkbox("Include Vitamin D?")
+                    if vitamin_d_available:
+                        vitamin_d_status = st.selectbox("Vitamin D", LAB_LEVELS)
+                    else:
+                        vitamin_d_status = "Not Provided"
+                    calcium_available = st.checkbox("Include Calcium?")
+                    if calcium_available:
+                        calcium_status = st.selectbox("Calcium", LAB_LEVELS)
+                    else:
+                        calcium_status = "Not Provided"
                 else:
-                    calcium_status = "Not Provided"
-            else:
-                pth_status = "Not Reviewed"
-                vitamin_d_status = "Not Reviewed"
-                calcium_status = "Not Reviewed"
+                    pth_status = "Not Reviewed"
+                    vitamin_d_status = "Not Reviewed"
+                    calcium_status = "Not Reviewed"
         
         # Medication Section
         with st.sidebar.expander("Medication", expanded=True):
-            med_change = st.radio("Medication Change?", ["No", "Yes", "N/A"])
+            med_change = st.radio("Medication Change?", MED_CHANGE_OPTIONS)
             if med_change == "Yes":
-                meds = ["BP Medication", "Diabetes Medication", "Diuretic", "Potassium Binder",
-                        "Iron Supplement", "ESA Therapy", "Vitamin D Supplement", "Bicarbonate Supplement"]
-                med_change_types = st.multiselect("Select Medication Changes", meds)
+                med_change_types = st.multiselect("Select Medication Changes", MED_CHANGE_TYPES)
             else:
                 med_change_types = []
         
@@ -259,86 +575,137 @@ def main():
         with st.sidebar.expander("Additional Clinical Comments", expanded=True):
             additional_comments = st.text_area("Enter any extra clinical details (e.g., dialysis discussion, referrals, transplant evaluation, etc.)", height=100)
         
+        # Collected on every rerun so a speculative generation can start before the click
+        inputs = {
+            "ckd_stage": ckd_stage,
+            "kidney_trend": kidney_trend,
+            "egfr": egfr_value,
+            "proteinuria_status": proteinuria_status,
+            "bp_status": bp_status,
+            "bp_reading": bp_reading,
+            "diabetes_status": diabetes_status,
+            "a1c_level": a1c_level,
+            "anemia_included": anemia_included,
+            "hemoglobin_status": hemoglobin_status,
+            "iron_status": iron_status,
+            "electrolyte_included": electrolyte_included,
+            "potassium_status": potassium_status,
+            "bicarbonate_status": bicarbonate_status,
+            "sodium_status": sodium_status,
+            "bone_included": bone_included,
+            "pth_status": pth_status,
+            "vitamin_d_status": vitamin_d_status,
+            "calcium_status": calcium_status,
+            "med_change": med_change,
+            "med_change_types": med_change_types,
+            "additional_comments": additional_comments
+        }
+        prompt = build_prompt(inputs, compact=load_config().prompt_mode == "compact")  # Build the prompt from inputs
+        previous = st.session_state.get("last_structured")
+        speculator = get_speculator(load_config().version)
+        if speculator and not (previous and previous["inputs"] == inputs):
+            speculator.observe(session_id, prompt)
+
         # Generate Summary Button
-        if st.sidebar.button("Generate AVS Summary"):
-            inputs = {
-                "ckd_stage": ckd_stage,
-                "kidney_trend": kidney_trend,
-                "proteinuria_status": proteinuria_status,
-                "bp_status": bp_status,
-                "bp_reading": bp_reading,
-                "diabetes_status": diabetes_status,
-                "a1c_level": a1c_level,
-                "anemia_included": anemia_included,
-                "hemoglobin_status": hemoglobin_status,
-                "iron_status": iron_status,
-                "electrolyte_included": electrolyte_included,
-                "potassium_status": potassium_status,
-                "bicarbonate_status": bicarbonate_status,
-                "sodium_status": sodium_status,
-                "bone_included": bone_included,
-                "pth_status": pth_status,
-                "vitamin_d_status": vitamin_d_status,
-                "calcium_status": calcium_status,
-                "med_change": med_change,
-                "med_change_types": med_change_types,
-                "additional_comments": additional_comments
-            }
-            prompt = build_prompt(inputs)  # Build the prompt from inputs
+        if input_errors:
+            st.sidebar.warning(f"Fix {' and '.join(input_errors)} before generating.")
+        if st.sidebar.button("Generate AVS Summary", disabled=bool(input_errors)):
             st.info("Generating AVS summary, please wait...")
-            summary_text = generate_avs_summary(prompt)
-            if summary_text:
-                st.subheader("Generated AVS Summary")
-                st.text_area("", value=summary_text, height=300)
-                pdf_data = generate_pdf(summary_text)
-                st.download_button(
-                    label="Download Summary as PDF",
-                    data=pdf_data.getvalue(),
-                    file_name="AVS_Summary.pdf",
-                    mime="application/pdf"
-                )
-                st.markdown(
-                    f"""
-                    <div id="printable">
-                    <h3>Generated AVS Summary</h3>
-                    <p>{summary_text.replace("\n", "<br>")}</p>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
-                )
-                st.markdown("### Printing Instructions")
-                st.write("To print only the AVS summary, use your browser's print function (Ctrl+P or Cmd+P).")
+            job_id = queue.submit("structured", session_id, {
+                "patient_id": patient_id, "inputs": inputs, "prompt": prompt,
+                "previous": previous, "session_id": session_id,
+            })
+            shown_job = job_id
+
+        # Scheduled visits can wait for the cheaper overnight batch instead
+        scheduled_date = st.sidebar.date_input("Scheduled Visit Date", value=date.today() + timedelta(days=1))
+        if st.sidebar.button("Defer to Overnight Batch", disabled=bool(input_errors)):
+            if patient_id:
+                get_deferred_queue().defer(patient_id, scheduled_date.isoformat(), inputs, prompt)
+                st.success(f"Queued for the overnight batch; the summary will appear in visit history for {scheduled_date}.")
+            else:
+                st.warning("Enter a Patient ID to defer a visit; results are stored in visit history.")
     
     else:  # Free Text Command Mode
         with st.sidebar.expander("Free Text Command", expanded=True):
             free_text_command = st.text_area("Enter your free text command for the AVS summary:", height=200)
         if st.sidebar.button("Generate AVS Summary"):
-            prompt = free_text_command
             st.info("Generating AVS summary from free text command, please wait...")
-            summary_text = generate_avs_summary(prompt)
-            if summary_text:
-                st.subheader("Generated AVS Summary")
-                st.text_area("", value=summary_text, height=300)
-                pdf_data = generate_pdf(summary_text)
-                st.download_button(
-                    label="Download Summary as PDF",
-                    data=pdf_data.getvalue(),
-                    file_name="AVS_Summary.pdf",
-                    mime="application/pdf"
-                )
-                st.markdown(
-                    f"""
-                    <div id="printable">
-                    <h3>Generated AVS Summary</h3>
-                    <p>{summary_text.replace("\n", "<br>")}</p>
-                    </div>
-                    """,
-                    unsafe_allow_html=True
+            shown_job = queue.submit("free_text", session_id, {"text": free_text_command, "session_id": session_id})
+
+    # Batch Printing for Stored Visits
+    with st.sidebar.expander("Batch Print", expanded=False):
+        batch_start = st.date_input("From", value=date.today(), key="batch_start").isoformat()
+        batch_end = st.date_input("To", value=date.today(), key="batch_end").isoformat()
+        history = get_visit_history()
+        if st.button("Build Merged PDF"):
+            shown_job = queue.submit("batch_merge", session_id,
+                                     {"start": batch_start, "end": batch_end, "session_id": session_id})
+        if st.button("Build ZIP of PDFs"):
+            visits = history.iter_visits_between(batch_start, batch_end, include_pdf=True)
+            with tempfile.TemporaryFile() as archive:
+                count = zip_summaries(
+                    ((f"AVS_{v['patient_id']}_{v['visit_date']}_{v['id']}.pdf", v["pdf"] or v["summary"]) for v in visits),
+                    archive,
                 )
-                st.markdown("### Printing Instructions")
-                st.write("To print only the AVS summary, use your browser's print function (Ctrl+P or Cmd+P).")
-                
+                archive.seek(0)
+                st.download_button(f"Download ZIP ({count} summaries)", data=archive.read(),
+                                   file_name=f"AVS_Batch_{batch_start}_{batch_end}.zip", mime="application/zip")
+        if st.button("Build FHIR Export"):
+            with tempfile.TemporaryFile() as export:
+                count = export_ndjson(history, batch_start, batch_end, export)
+                export.seek(0)
+                st.download_button(f"Download NDJSON ({count} documents)", data=export.read(),
+                                   file_name=f"AVS_DocumentReference_{batch_start}_{batch_end}.ndjson",
+                                   mime="application/fhir+ndjson")
+
+    overnight_batch_panel(session_id)
+
+    # Jobs keep running if the page disconnects; a finished one is shown here or from the Job Queue panel
+    if shown_job:
+        job = wait_for_job(shown_job)
+        if job["kind"] == "structured" and job["state"] != FAILED:
+            st.session_state["last_structured"] = job["result"]["last_structured"]
+        show_job_result(job, language)
+
     st.sidebar.markdown("### Use the sidebar to input patient details or a free text command.")
 
+# --- Per-session profiling: an admin's ?profile=<profile_token> (or profiling = "all") samples the rerun ---
+def is_profile_admin() -> bool:
+    token = load_config().profile_token
+    return bool(token) and hmac.compare_digest(st.query_params.get("profile", ""), token)
+
+def profiling_requested() -> bool:
+    mode = load_config().profiling
+    return mode == "all" or (mode == "query" and is_profile_admin())
+
+def show_profile(profiler: RequestProfiler, path: str):
+    with st.expander("Profile", expanded=True):
+        totals = profiler.span_totals()
+        st.caption(f"Rerun {profiler.finished - profiler.started:.2f}s | " + " | ".join(
+            f"{name} {seconds:.2f}s" for name, seconds in sorted(totals.items())))
+        st.markdown(f"Saved to `{path}`. Open it at [speedscope.app](https://www.speedscope.app).")
+        for recent in list_profiles(load_config().profile_dir, limit=5):
+            with open(recent, "rb") as f:
+                st.download_button(os.path.basename(recent), data=f.read(), mime="application/json",
+                                   file_name=os.path.basename(recent), key=f"profile_{recent}")
+
+def run():
+    session_id = get_session_id()
+    with profile_scope(session_id):
+        if not profiling_requested():
+            main()
+            return
+        profiler = RequestProfiler(f"rerun-{session_id[:8]}", scope=session_id)
+        profiler.start()
+        try:
+            main()
+        finally:
+            profiler.stop()
+            path = profiler.save(load_config().profile_dir)
+    # Saved profiles hold other patients' timings, so only an admin sees them
+    if is_profile_admin():
+        show_profile(profiler, path)
+
 if __name__ == "__main__":
-    main()
+    run()
@@ -1,23 +1,18 @@
 import streamlit as st
 import openai
+from avs_config import load_config
 
-# Debug: Print the entire st.secrets object to see its structure
-st.write("DEBUG: st.secrets content:", st.secrets)
+# Debug: show which settings were resolved and from where, with key values masked
+config = load_config()
+st.write("DEBUG: configuration loaded from:", config.source or "environment only")
+st.write("DEBUG: resolved settings:", config.masked())
 
-# Check for the key in two possible locations:
-if "OPENAI_API_KEY" in st.secrets:
-    st.write("DEBUG: OPENAI_API_KEY is loaded at the top level.")
-elif "general" in st.secrets and "OPENAI_API_KEY" in st.secrets["general"]:
-    st.write("DEBUG: OPENAI_API_KEY is loaded under 'general'.")
+if config.openai_api_key:
+    st.write("DEBUG: OpenAI API key is loaded.")
 else:
-    st.write("DEBUG: OPENAI_API_KEY is NOT loaded.")
+    st.write("DEBUG: OpenAI API key is NOT loaded.")
 
-# Set the API key from the appropriate location
-if "OPENAI_API_KEY" in st.secrets:
-    openai.api_key = st.secrets["OPENAI_API_KEY"]
-elif "general" in st.secrets and "OPENAI_API_KEY" in st.secrets["general"]:
-    openai.api_key = st.secrets["general"]["OPENAI_API_KEY"]
-else:
-    openai.api_key = None  # Or handle the missing key appropriately
+# Set the API key from the resolved configuration
+openai.api_key = config.openai_api_key or None
 
 st.write("DEBUG: OpenAI API key has been set.")
@@ -1,6 +1,7 @@
 import streamlit as st
 import streamlit.components.v1 as components
 import openai
+from avs_config import load_config
 from fpdf import FPDF
 from io import BytesIO
 
@@ -22,7 +23,7 @@ st.markdown(
 )
 
 # --- Set OpenAI API Key from your secrets.toml ---
-openai.api_key = st.secrets["general"]["MY_API_KEY"]
+openai.api_key = load_config().openai_api_key
 
 # --- PDF Generation Function ---
 def generate_pdf(text: str) -> BytesIO:
@@ -74,13 +75,13 @@ def build_prompt(inputs: dict) -> str:
 def generate_avs_summary(prompt: str) -> str:
     try:
         response = openai.ChatCompletion.create(
-            model="gpt-4",
+            model=load_config().openai_model,
             messages=[
                 {"role": "system", "content": "You are a knowledgeable medical assistant."},
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=512,
-            temperature=0.7
+            max_tokens=load_config().max_tokens,
+            temperature=load_config().temperature
         )
         return response.choices[0].message.content.strip()
     except Exception as e:
@@ -191,11 +192,12 @@ def main():
                         file_name="AVS_Summary.pdf",
                         mime="application/pdf"
                     )
+                    summary_html = summary_text.replace("\n", "<br>")
                     st.markdown(
                         f"""
                         <div id="printable">
                         <h3>Generated AVS Summary</h3>
-                        <p>{summary_text.replace("\n", "<br>")}</p>
+                        <p>{summary_html}</p>
                         </div>
                         """,
                         unsafe_allow_html=True
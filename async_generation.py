@@ -0,0 +1,153 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import json
+from avs_config import load_config
+from avs_pdf import generate_pdf, generate_sections_pdf
+from avs_sections import agenerate_sections
+from cache_backend import DEFAULT_TTL_SECONDS, pdf_key, response_key
+from priority_scheduler import INTERACTIVE, PriorityScheduler
+
+# --- Default in-flight limits per provider (requests awaiting a reply) ---
+DEFAULT_PROVIDER_LIMITS = {"openai": 64, "gemini": 32, "local": 8}
+# How long a retired core lets in-flight calls finish before its loop is stopped
+DRAIN_SECONDS = 120.0
+
+
+# --- Asyncio Generation Core ---
+# One event loop per process runs every provider call; Streamlit's script threads only
+# hand coroutines to it. Each provider's in-flight limit is handed out by a priority
+# scheduler (interactive ahead of speculative ahead of batch), and FPDF rendering (CPU
+# bound) goes to a small thread pool so it never stalls the loop.
+# With a cache backend, replies and PDFs are looked up there first and provider calls
+# draw from a token bucket shared by every replica using the same backend.
+class AsyncGenerationCore:
+    def __init__(self, provider, limits: dict = None, pdf_workers: int = 4, cache=None,
+                 requests_per_minute: int = 0, cache_ttl: int = DEFAULT_TTL_SECONDS):
+        self.provider = provider
+        self.limits = dict(DEFAULT_PROVIDER_LIMITS, **(limits or {}))
+        self.cache = cache
+        self.requests_per_minute = requests_per_minute
+        self.cache_ttl = cache_ttl
+        self._schedulers = {}
+        self._pdf_pool = ThreadPoolExecutor(max_workers=pdf_workers, thread_name_prefix="avs-pdf")
+        # Backend calls block on a socket, so they get their own small pool
+        self._cache_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="avs-cache")
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._closed = False
+
+    # --- Awaitable API ---
+    async def agenerate(self, prompt: str, json_mode: bool = False, priority: str = INTERACTIVE,
+                        clinician: str = "") -> str:
+        key = response_key(self.provider.name, self.provider.model, prompt, json_mode)
+        cached = await self._cache_call(self.cache.get, key) if self.cache else None
+        if cached is not None:
+            return cached.decode("utf-8")
+        async with self._scheduler(self.provider.name).slot(priority, clinician):
+            await self._take_token()
+            reply = await self.provider.agenerate(prompt, json_mode=json_mode)
+        if self.cache and reply:
+            await self._cache_call(self.cache.set, key, reply.encode("utf-8"), self.cache_ttl)
+        return reply
+
+    async def agenerate_sections(self, prompt: str, headings: list = None, kept_sections: dict = None,
+                                 priority: str = INTERACTIVE, clinician: str = "") -> dict:
+        return await agenerate_sections(
+            prompt, lambda p: self.agenerate(p, json_mode=True, priority=priority, clinician=clinician),
+            headings, kept_sections,
+        )
+
+    async def arender_pdf(self, content) -> bytes:
+        render = generate_sections_pdf if isinstance(content, dict) else generate_pdf
+        key = pdf_key(f"{render.__name__}:{load_config().pdf_mode}", json.dumps(content))
+        cached = await self._cache_call(self.cache.get, key) if self.cache else None
+        if cached is not None:
+            return cached
+        loop = asyncio.get_running_loop()
+        # The render runs in the caller's context so it is profiled under the caller's session
+        pdf = (await loop.run_in_executor(self._pdf_pool, contextvars.copy_context().run, render,
+                                          content)).getvalue()
+        if self.cache:
+            await self._cache_call(self.cache.set, key, pdf, self.cache_ttl)
+        return pdf
+
+    async def agenerate_avs(self, prompt: str, priority: str = INTERACTIVE, clinician: str = "") -> tuple:
+        sections = await self.agenerate_sections(prompt, priority=priority, clinician=clinician)
+        if not sections:
+            return None, None
+        return sections, await self.arender_pdf(sections)
+
+    # An unreachable cache degrades to uncached, unlimited generation rather than failing
+    async def _cache_call(self, method, *args):
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._cache_pool, method, *args)
+        except (OSError, RuntimeError):
+            return None
+
+    # Waits (without holding a thread) until the shared bucket grants a request
+    async def _take_token(self):
+        if not (self.cache and self.requests_per_minute > 0):
+            return
+        rate = self.requests_per_minute / 60.0
+        while True:
+            wait = await self._cache_call(self.cache.acquire_tokens, self.provider.name, rate,
+                                          float(self.requests_per_minute))
+            if wait is None or wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def _scheduler(self, name: str) -> PriorityScheduler:
+        if name not in self._schedulers:
+            self._schedulers[name] = PriorityScheduler(self.limits.get(name, 16))
+        return self._schedulers[name]
+
+    async def _queue_stats(self) -> dict:
+        return self._scheduler(self.provider.name).stats()
+
+    # --- Sync shim for main() and other blocking callers ---
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    def generate(self, prompt: str, json_mode: bool = False, priority: str = INTERACTIVE, clinician: str = "") -> str:
+        return self.run(self.agenerate(prompt, json_mode=json_mode, priority=priority, clinician=clinician))
+
+    # Queueing delay and occupancy per priority class for the active provider
+    def queue_stats(self) -> dict:
+        return self.run(self._queue_stats())
+
+    def call_soon(self, callback, *args):
+        self._ensure_loop().call_soon_threadsafe(callback, *args)
+
+    # --- Shutdown after a config reload: in-flight calls finish, then the loop and pools stop ---
+    # Blocks until drained, so an old core is retired from a background thread.
+    def close(self, timeout: float = DRAIN_SECONDS):
+        with self._loop_lock:
+            loop, self._closed = self._loop, True
+        if loop is not None:
+            asyncio.run_coroutine_threadsafe(self._drain(timeout), loop).result()
+        self._pdf_pool.shutdown(wait=False)
+        self._cache_pool.shutdown(wait=False)
+
+    async def _drain(self, timeout: float):
+        current = asyncio.current_task()
+        pending = [task for task in asyncio.all_tasks() if task is not current]
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+        loop = asyncio.get_running_loop()
+        loop.call_soon(loop.stop)
+
+    def _run_loop(self, loop: asyncio.AbstractEventLoop):
+        loop.run_forever()
+        loop.close()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._closed:
+                raise RuntimeError("generation core was closed after a config reload")
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._run_loop, args=(self._loop,), name="avs-event-loop",
+                                 daemon=True).start()
+        return self._loop
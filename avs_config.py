@@ -0,0 +1,175 @@
+import logging
+import os
+import threading
+import time
+import tomllib
+from dataclasses import dataclass, field, fields
+
+# --- Where secrets/config are read from, first existing file wins ---
+CONFIG_PATHS = [
+    os.environ.get("AVS_CONFIG_PATH", ""),
+    os.path.join(".streamlit", "secrets.toml"),
+    os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml"),
+]
+RELOAD_POLL_SECONDS = 2.0
+
+logger = logging.getLogger("avs.config")
+
+# Each setting may appear under several names, at the top level or in [general]
+_ALIASES = {
+    "provider": ["AVS_PROVIDER"],
+    "openai_api_key": ["MY_API_KEY", "OPENAI_API_KEY"],
+    "gemini_api_key": ["GEMINI_API_KEY"],
+    "local_model_path": ["LOCAL_MODEL_PATH"],
+    "openai_model": ["OPENAI_MODEL"],
+    "openai_batch_api_base": ["OPENAI_BATCH_API_BASE"],
+    "gemini_model": ["GEMINI_MODEL"],
+    "max_tokens": ["MAX_TOKENS"],
+    "temperature": ["TEMPERATURE"],
+    "clinic_name": ["CLINIC_NAME"],
+    "speculative_max_per_hour": ["SPECULATIVE_MAX_PER_HOUR"],
+    "speculative_debounce_seconds": ["SPECULATIVE_DEBOUNCE_SECONDS"],
+    "cache_url": ["AVS_CACHE_URL", "CACHE_URL"],
+    "cache_ttl_seconds": ["CACHE_TTL_SECONDS"],
+    "requests_per_minute": ["REQUESTS_PER_MINUTE"],
+    "prompt_mode": ["PROMPT_MODE"],
+    "warm_budget_usd": ["WARM_BUDGET_USD"],
+    "pdf_mode": ["PDF_MODE"],
+    "profiling": ["AVS_PROFILING"],
+    "profile_dir": ["AVS_PROFILE_DIR"],
+    "profile_token": ["AVS_PROFILE_TOKEN"],
+}
+_SECRET_FIELDS = {"openai_api_key", "gemini_api_key", "profile_token"}
+
+
+@dataclass(frozen=True)
+class AVSConfig:
+    provider: str = "openai"
+    openai_api_key: str = field(default="", repr=False)
+    gemini_api_key: str = field(default="", repr=False)
+    local_model_path: str = ""
+    openai_model: str = "gpt-4"
+    # Where deferred batches are sent; point at mock_batch_server.py for local runs
+    openai_batch_api_base: str = "https://api.openai.com"
+    gemini_model: str = "gemini-1.5-pro"
+    max_tokens: int = 550
+    temperature: float = 0.6
+    clinic_name: str = "Nephrology Associates of Lexington P.S.C"
+    # Speculative pre-generation spends provider calls before Generate is clicked, so it is
+    # opt-in: 0 turns it off, a positive number caps the speculative generations per hour
+    speculative_max_per_hour: int = 0
+    speculative_debounce_seconds: float = 2.5
+    # "" keeps the cache in-process; redis://host:port/db shares it across replicas
+    cache_url: str = ""
+    cache_ttl_seconds: int = 7 * 24 * 3600
+    # Provider calls per minute across every replica sharing the cache (0 = unlimited)
+    requests_per_minute: int = 0
+    # "compact" sends the terse key:value prompt instead of the verbose one
+    prompt_mode: str = "verbose"
+    # Estimated spend allowed per off-hours cache warming run
+    warm_budget_usd: float = 5.0
+    # "compact" recompresses PDFs and slims embedded fonts for EHR upload and fax
+    pdf_mode: str = "standard"
+    # "query" profiles admin sessions opened with ?profile=<profile_token>, "all" records every
+    # rerun to profile_dir, "off" never. Only ?profile=<profile_token> shows profiles on the page.
+    profiling: str = "query"
+    profile_dir: str = "profiles"
+    # Admin token for profiling; empty disables the toggle and the listing
+    profile_token: str = field(default="", repr=False)
+    # Bumped on every reload so caches keyed on it pick up the new settings
+    version: int = 0
+    source: str = ""
+
+    # Safe to display: key values are reduced to a presence marker
+    def masked(self) -> dict:
+        shown = {}
+        for f in fields(self):
+            value = getattr(self, f.name)
+            shown[f.name] = ("set" if value else "missing") if f.name in _SECRET_FIELDS else value
+        return shown
+
+
+def _lookup(raw: dict, names: list):
+    general = raw.get("general", {})
+    for name in names:
+        # Environment first, then [general], then the top level (the layouts debug.py used to probe)
+        for source in (os.environ, general, raw):
+            if name in source and source[name] not in ("", None):
+                return source[name]
+    return None
+
+
+def _parse(raw: dict, version: int, source: str) -> AVSConfig:
+    values = {}
+    for f in fields(AVSConfig):
+        if f.name not in _ALIASES:
+            continue
+        value = _lookup(raw, _ALIASES[f.name])
+        if value is not None:
+            values[f.name] = type(f.default)(value)
+    return AVSConfig(version=version, source=source, **values)
+
+
+# --- Process-wide config, loaded once and reloaded when the file changes ---
+# A file that cannot be read or parsed is logged and skipped: at startup the defaults are used,
+# later the last good config stays. Either way the next change to the file is picked up.
+class ConfigStore:
+    def __init__(self, paths: list = None, poll_seconds: float = RELOAD_POLL_SECONDS):
+        self.paths = [p for p in (paths or CONFIG_PATHS) if p]
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        # (path, mtime) of the last file read, good or bad
+        self._seen = None
+        try:
+            self._config = self._load(version=1)
+        except (OSError, tomllib.TOMLDecodeError, ValueError) as e:
+            logger.error("config: %s is invalid, using defaults: %s", self._seen[0] if self._seen else "", e)
+            self._config = AVSConfig(version=1)
+        self._watcher = threading.Thread(target=self._watch, name="avs-config-watcher", daemon=True)
+        self._watcher.start()
+
+    @property
+    def config(self) -> AVSConfig:
+        return self._config
+
+    def _current_file(self) -> str:
+        return next((p for p in self.paths if os.path.exists(p)), "")
+
+    def _load(self, version: int) -> AVSConfig:
+        path = self._current_file()
+        raw = {}
+        if path:
+            mtime = os.path.getmtime(path)
+            self._seen = (path, mtime)
+            with open(path, "rb") as f:
+                raw = tomllib.load(f)
+        else:
+            self._seen = ("", None)
+        return _parse(raw, version, path)
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                path = self._current_file()
+                mtime = os.path.getmtime(path) if path else None
+                if (path, mtime) == self._seen:
+                    continue
+                with self._lock:
+                    self._config = self._load(version=self._config.version + 1)
+            except (OSError, tomllib.TOMLDecodeError, ValueError) as e:
+                # A half-written or deleted file keeps the last good config until it changes again
+                logger.error("config: reload failed, keeping version %d: %s", self._config.version, e)
+
+
+_STORE = None
+_STORE_LOCK = threading.Lock()
+
+
+def load_config() -> AVSConfig:
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = ConfigStore()
+    return _STORE.config
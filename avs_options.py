@@ -0,0 +1,11 @@
+# --- Option lists for the structured sidebar widgets ---
+# Shared by main() and anything that enumerates the input space (e.g. the cache warmer).
+CKD_STAGES = ["I", "II", "IIIa", "IIIb", "IV", "V", "N/A"]
+KIDNEY_TRENDS = ["Stable", "Worsening", "Improving", "N/A"]
+PROTEINURIA_OPTIONS = ["None", "Not Present", "Improving", "Worsening"]
+BP_OPTIONS = ["None", "At Goal", "Above Goal"]
+DIABETES_OPTIONS = ["None", "Controlled", "Uncontrolled"]
+LAB_LEVELS = ["Low", "Normal", "High"]
+MED_CHANGE_OPTIONS = ["No", "Yes", "N/A"]
+MED_CHANGE_TYPES = ["BP Medication", "Diabetes Medication", "Diuretic", "Potassium Binder",
+                    "Iron Supplement", "ESA Therapy", "Vitamin D Supplement", "Bicarbonate Supplement"]
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import zipfile
+from io import BytesIO
+import fpdf
+from fpdf import FPDF
+from avs_config import load_config
+from pdf_optimize import optimize_pdf
+from request_profiler import profiled
+
+# --- Unicode font for text outside Latin-1 (translations, smart quotes, dashes) ---
+# FPDF embeds only the glyphs used, and caches parsed font metrics in the temp dir.
+UNICODE_FONT_FILES = {
+    "": os.environ.get("AVS_UNICODE_FONT", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"),
+    "B": os.environ.get("AVS_UNICODE_FONT_BOLD", "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"),
+}
+UNICODE_FAMILY = "DejaVu"
+fpdf.set_global("FPDF_CACHE_MODE", 2)
+fpdf.set_global("FPDF_CACHE_DIR", tempfile.gettempdir())
+
+# Typographic characters models like to emit, mapped for the core Latin-1 fonts
+_LATIN1_FALLBACKS = str.maketrans({"\u2013": "-", "\u2014": "-", "\u2018": "'", "\u2019": "'",
+                                   "\u201c": '"', "\u201d": '"', "\u2022": "-", "\u2026": "...", "\u00b2": "2"})
+
+
+def _needs_unicode(text: str) -> bool:
+    try:
+        text.encode("latin1")
+        return False
+    except UnicodeEncodeError:
+        return True
+
+
+# Picks one font family for everything on a page and returns it with a function that
+# prepares each string for that family.
+def _font_for(pdf: FPDF, texts: list) -> tuple:
+    combined = " ".join(texts)
+    if not _needs_unicode(combined):
+        return "Arial", lambda t: t
+    if not _needs_unicode(combined.translate(_LATIN1_FALLBACKS)):
+        return "Arial", lambda t: t.translate(_LATIN1_FALLBACKS)
+    if all(os.path.exists(path) for path in UNICODE_FONT_FILES.values()):
+        if UNICODE_FAMILY.lower() not in pdf.fonts:
+            for style, path in UNICODE_FONT_FILES.items():
+                pdf.add_font(UNICODE_FAMILY, style, path, uni=True)
+        return UNICODE_FAMILY, lambda t: t
+    # No Unicode font installed: keep the document renderable rather than failing
+    return "Arial", lambda t: t.translate(_LATIN1_FALLBACKS).encode("latin1", "replace").decode("latin1")
+
+
+# --- Letterhead drawn at the top of each summary ---
+def draw_letterhead(pdf: FPDF, family: str = "Arial", title: str = "After Visit Summary"):
+    # Header
+    pdf.set_font(family, "B", 16)
+    pdf.cell(0, 10, load_config().clinic_name, ln=1, align="C")
+
+    # Sub-heading
+    pdf.set_font(family, "B", 14)
+    pdf.cell(0, 10, title, ln=1, align="C")
+
+    # Spacing
+    pdf.ln(10)
+
+
+# --- Render one summary starting on a fresh page of an existing document ---
+def render_summary(pdf: FPDF, text: str, title: str = "After Visit Summary"):
+    family, prepare = _font_for(pdf, [title, text])
+    pdf.add_page()
+    draw_letterhead(pdf, family, prepare(title))
+
+    # Content
+    pdf.set_font(family, "", 12)
+    pdf.multi_cell(0, 10, prepare(text))
+
+
+# --- Serialize a finished document in the configured pdf_mode ---
+def pdf_bytes(pdf: FPDF) -> bytes:
+    data = pdf.output(dest="S").encode("latin1")
+    return optimize_pdf(data) if load_config().pdf_mode == "compact" else data
+
+
+# --- PDF Generation Function with Header Formatting ---
+@profiled("generate_pdf")
+def generate_pdf(text: str, title: str = "After Visit Summary") -> BytesIO:
+    pdf = FPDF()
+    render_summary(pdf, text, title)
+    return BytesIO(pdf_bytes(pdf))
+
+
+# --- Render structured sections with the headings laid out directly ---
+def render_sections(pdf: FPDF, sections: dict, title: str = "After Visit Summary"):
+    family, prepare = _font_for(pdf, [title, *sections, *sections.values()])
+    pdf.add_page()
+    draw_letterhead(pdf, family, prepare(title))
+    for heading, body in sections.items():
+        pdf.set_font(family, "B", 12)
+        pdf.cell(0, 8, prepare(heading), ln=1)
+        pdf.set_font(family, "", 12)
+        pdf.multi_cell(0, 8, prepare(body))
+        pdf.ln(3)
+
+
+@profiled("generate_sections_pdf")
+def generate_sections_pdf(sections: dict, title: str = "After Visit Summary") -> BytesIO:
+    pdf = FPDF()
+    render_sections(pdf, sections, title)
+    return BytesIO(pdf_bytes(pdf))
+
+
+# --- Merged Print Job: every summary in one paginated document ---
+# All pages share one font/resource dictionary. FPDF 1.7.2 keeps page content
+# in memory until output, so this holds text streams only (no per-patient PDFs).
+def merge_summaries(summaries) -> BytesIO:
+    pdf = FPDF()
+    pdf.set_title("After Visit Summaries")
+    for text in summaries:
+        render_summary(pdf, text)
+    if pdf.page == 0:
+        pdf.add_page()
+    return BytesIO(pdf_bytes(pdf))
+
+
+# --- ZIP Export: one PDF per summary, written incrementally ---
+# `items` is an iterable of (file_name, summary_text or pdf_bytes). Only one PDF
+# is held in memory at a time, so a generator keeps memory flat for any batch size.
+def zip_summaries(items, target) -> int:
+    count = 0
+    with zipfile.ZipFile(target, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for file_name, content in items:
+            if isinstance(content, str):
+                content = generate_pdf(content).getvalue()
+            archive.writestr(file_name, content)
+            count += 1
+    return count
@@ -0,0 +1,137 @@
+from avs_sections import SECTION_HEADINGS
+from med_education import MED_CODES, prompt_reference
+from request_profiler import profiled
+
+# Per-section guidance for the compact prompt, in heading order
+COMPACT_GUIDANCE = [
+    "stage and trend",
+    "status if given",
+    "BP and diabetes control, with any reading or A1c",
+    "anemia, electrolyte and bone mineral findings",
+    "1-2 lines of next steps",
+]
+
+# Short lab keys for the compact prompt
+COMPACT_LAB_KEYS = [
+    ("anemia_included", [("hemoglobin_status", "Hgb"), ("iron_status", "Iron")]),
+    ("electrolyte_included", [("potassium_status", "K"), ("bicarbonate_status", "HCO3"), ("sodium_status", "Na")]),
+    ("bone_included", [("pth_status", "PTH"), ("vitamin_d_status", "VitD"), ("calcium_status", "Ca")]),
+]
+ELIDED_VALUES = {"", "None", "N/A", "Not Provided", "Not Reviewed"}
+
+
+# --- Build Prompt from Structured Inputs ---
+@profiled("build_prompt")
+def build_prompt(inputs: dict, compact: bool = False) -> str:
+    if compact:
+        return build_compact_prompt(inputs)
+    lines = [
+        "Generate an AVS summary for the following patient details. Structure the response using the following headings:",
+        "",
+        "1. CKD Stage & Kidney Function:",
+        "   - Summarize the CKD stage and the kidney function trend.",
+        "",
+        "2. Proteinuria:",
+        "   - Describe the proteinuria status if provided.",
+        "",
+        "3. HTN & DM:",
+        "   - Summarize the patient's blood pressure status and diabetes control, including any details like BP readings or A1c levels.",
+        "",
+        "4. Labs:",
+        "   - Summarize key lab results including details on anemia, electrolyte levels, and bone mineral disease findings.",
+        "",
+        "5. Suggestions:",
+        "   - Provide 1-2 concise lines of recommendations or next steps based on the provided data.",
+        "",
+        "Patient Details:"
+    ]
+    
+    # Patient Details
+    lines.append(f"- CKD Stage: {inputs.get('ckd_stage', 'Not Provided')}")
+    lines.append(f"- Kidney Function Trend: {inputs.get('kidney_trend', 'Not Provided')}")
+    if inputs.get("egfr") is not None:
+        lines.append(f"  - eGFR: {inputs['egfr']} mL/min/1.73m²")
+    
+    if inputs.get("proteinuria_status", "None") not in ["None", "N/A"]:
+        lines.append(f"- Proteinuria: {inputs['proteinuria_status']}")
+    
+    if inputs.get("bp_status", "None") not in ["None", "N/A"]:
+        lines.append(f"- Blood Pressure Status: {inputs['bp_status']}")
+        if inputs['bp_status'] == "Above Goal" and inputs.get("bp_reading"):
+            lines.append(f"  - BP Reading: {inputs['bp_reading']}")
+    
+    if inputs.get("diabetes_status", "None") not in ["None", "N/A"]:
+        lines.append(f"- Diabetes Control: {inputs['diabetes_status']}")
+        if inputs['diabetes_status'] == "Uncontrolled" and inputs.get("a1c_level"):
+            lines.append(f"  - A1c Level: {inputs['a1c_level']}")
+    
+    # Labs Section
+    lines.append("Labs:")
+    if inputs.get("anemia_included", False):
+        lines.append(f"  - Hemoglobin: {inputs.get('hemoglobin_status', 'Not Provided')}")
+        lines.append(f"  - Iron: {inputs.get('iron_status', 'Not Provided')}")
+    
+    if inputs.get("electrolyte_included", False):
+        lines.append(f"  - Potassium: {inputs.get('potassium_status', 'Not Provided')}")
+        lines.append(f"  - Bicarbonate: {inputs.get('bicarbonate_status', 'Not Provided')}")
+        lines.append(f"  - Sodium: {inputs.get('sodium_status', 'Not Provided')}")
+    
+    if inputs.get("bone_included", False):
+        lines.append(f"  - PTH: {inputs.get('pth_status', 'Not Provided')}")
+        lines.append(f"  - Vitamin D: {inputs.get('vitamin_d_status', 'Not Provided')}")
+        lines.append(f"  - Calcium: {inputs.get('calcium_status', 'Not Provided')}")
+    
+    # Medication Change Section
+    lines.append(f"- Medication Change: {inputs.get('med_change', 'No')}")
+    if inputs.get("med_change", "No") == "Yes" and inputs.get("med_change_types"):
+        lines.append(f"  - Medication Changes: {', '.join(inputs['med_change_types'])}")
+        reference = prompt_reference(inputs["med_change_types"])
+        if reference:
+            lines.append(reference)
+    
+    # Additional Clinical Comments
+    if inputs.get("additional_comments", "").strip():
+        lines.append("")
+        lines.append("Additional Clinical Comments:")
+        lines.append(inputs["additional_comments"])
+    
+    lines.append("")
+    lines.append("Please generate the AVS summary following the above structure. Each section should begin with the designated heading, and the final section (Suggestions) should include 1–2 lines of clinical recommendations based on the data.")
+    
+    return "\n".join(lines)
+
+
+# --- Compact encoding: one instruction block, terse key:value data, unset fields left out ---
+def build_compact_prompt(inputs: dict) -> str:
+    lines = ["Write a patient-friendly After Visit Summary with exactly these sections:"]
+    lines += [f"{heading} {guidance}" for heading, guidance in zip(SECTION_HEADINGS, COMPACT_GUIDANCE)]
+    lines.append("Patient data (fields not listed were not provided):")
+
+    def add(key: str, value):
+        if value is not None and str(value).strip() not in ELIDED_VALUES:
+            lines.append(f"{key}:{value}")
+
+    add("ckd", inputs.get("ckd_stage"))
+    add("trend", inputs.get("kidney_trend"))
+    add("egfr", inputs.get("egfr"))
+    add("proteinuria", inputs.get("proteinuria_status"))
+    bp_status = inputs.get("bp_status", "None")
+    if bp_status == "Above Goal" and inputs.get("bp_reading"):
+        bp_status += f" {inputs['bp_reading']}"
+    add("bp", bp_status)
+    dm_status = inputs.get("diabetes_status", "None")
+    if dm_status == "Uncontrolled" and inputs.get("a1c_level"):
+        dm_status += f" A1c {inputs['a1c_level']}"
+    add("dm", dm_status)
+    labs = [f"{key} {inputs[field]}" for included, fields in COMPACT_LAB_KEYS if inputs.get(included)
+            for field, key in fields if inputs.get(field, "Not Provided") not in ELIDED_VALUES]
+    add("labs", ", ".join(labs))
+    if inputs.get("med_change") == "Yes" and inputs.get("med_change_types"):
+        add("meds", "changed " + ", ".join(inputs["med_change_types"]))
+        codes = [MED_CODES[c] for c in inputs["med_change_types"] if c in MED_CODES]
+        if codes:
+            lines.append(f"education {', '.join(codes)} is appended by the clinic; do not write medication education")
+    elif inputs.get("med_change") == "No":
+        lines.append("meds:no change")
+    add("notes", inputs.get("additional_comments", "").strip())
+    return "\n".join(lines)
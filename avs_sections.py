@@ -0,0 +1,135 @@
+import json
+import re
+
+# --- AVS Section Headings (must match the headings requested by build_prompt) ---
+SECTION_HEADINGS = [
+    "1. CKD Stage & Kidney Function:",
+    "2. Proteinuria:",
+    "3. HTN & DM:",
+    "4. Labs:",
+    "5. Suggestions:",
+]
+SUGGESTIONS_HEADING = SECTION_HEADINGS[-1]
+
+# --- Which input fields each section depends on ---
+SECTION_DEPENDENCIES = {
+    "1. CKD Stage & Kidney Function:": ["ckd_stage", "kidney_trend", "egfr"],
+    "2. Proteinuria:": ["proteinuria_status"],
+    "3. HTN & DM:": ["bp_status", "bp_reading", "diabetes_status", "a1c_level"],
+    "4. Labs:": [
+        "anemia_included", "hemoglobin_status", "iron_status",
+        "electrolyte_included", "potassium_status", "bicarbonate_status", "sodium_status",
+        "bone_included", "pth_status", "vitamin_d_status", "calcium_status",
+    ],
+    "5. Suggestions:": ["med_change", "med_change_types"],
+}
+
+# Free-form fields can touch any section, so a change there regenerates everything
+GLOBAL_DEPENDENCIES = ["additional_comments"]
+
+_HEADING_PATTERN = re.compile(
+    r"^\s*(?:\*\*|#+\s*)?(" + "|".join(re.escape(h.rstrip(":")) for h in SECTION_HEADINGS) + r"):?(?:\*\*)?\s*$",
+    re.MULTILINE,
+)
+
+
+# --- Split a generated summary into {heading: body} ---
+def split_sections(summary_text: str) -> dict:
+    matches = list(_HEADING_PATTERN.finditer(summary_text))
+    sections = {}
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(summary_text)
+        sections[match.group(1) + ":"] = summary_text[match.end():end].strip()
+    return sections
+
+
+# --- Join sections back into a summary in heading order ---
+# Generated headings come first in their fixed order, then any spliced-in blocks
+def join_sections(sections: dict) -> str:
+    ordered = [h for h in SECTION_HEADINGS if h in sections] + [h for h in sections if h not in SECTION_HEADINGS]
+    return "\n\n".join(f"{h}\n{sections[h]}" for h in ordered)
+
+
+# --- Work out which sections need regenerating after an edit ---
+def changed_sections(previous_inputs: dict, inputs: dict) -> list:
+    changed_fields = {k for k in set(previous_inputs) | set(inputs) if previous_inputs.get(k) != inputs.get(k)}
+    if not changed_fields:
+        return []
+    if changed_fields & set(GLOBAL_DEPENDENCIES):
+        return list(SECTION_HEADINGS)
+    stale = [h for h in SECTION_HEADINGS if changed_fields & set(SECTION_DEPENDENCIES[h])]
+    # Suggestions are based on the whole picture, so they follow any change
+    if SUGGESTIONS_HEADING not in stale:
+        stale.append(SUGGESTIONS_HEADING)
+    return stale
+
+
+# --- Structured Output: ask for a JSON object keyed by heading ---
+def build_json_prompt(full_prompt: str, headings: list = None, kept_sections: dict = None) -> str:
+    headings = headings or SECTION_HEADINGS
+    lines = [full_prompt, ""]
+    if kept_sections:
+        lines.append("The following sections are already written and must not be repeated:")
+        lines.append(json.dumps(kept_sections, ensure_ascii=False))
+        lines.append("")
+    lines.append("Respond with only a JSON object. Its keys must be exactly these headings: "
+                 + json.dumps(headings, ensure_ascii=False)
+                 + ". Each value is that section's text as a plain string, without the heading.")
+    return "\n".join(lines)
+
+
+# Schema check: an object with exactly the expected heading keys and string values
+def parse_sections_json(raw: str, headings: list = None) -> dict:
+    headings = headings or SECTION_HEADINGS
+    raw = raw.strip()
+    if raw.startswith("```"):
+        raw = raw.strip("`")
+        raw = raw[raw.find("{"):]
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or set(data) != set(headings):
+        return None
+    if not all(isinstance(data[h], str) for h in headings):
+        return None
+    return {h: data[h].strip() for h in headings}
+
+
+# --- Generate the given sections; JSON first, heading scan only as a fallback ---
+def generate_sections(full_prompt: str, generate, headings: list = None, kept_sections: dict = None) -> dict:
+    headings = headings or SECTION_HEADINGS
+    return sections_from_reply(generate(build_json_prompt(full_prompt, headings, kept_sections)), headings)
+
+
+async def agenerate_sections(full_prompt: str, agenerate, headings: list = None, kept_sections: dict = None) -> dict:
+    headings = headings or SECTION_HEADINGS
+    return sections_from_reply(await agenerate(build_json_prompt(full_prompt, headings, kept_sections)), headings)
+
+
+def sections_from_reply(raw: str, headings: list) -> dict:
+    if not raw:
+        return None
+    sections = parse_sections_json(raw, headings)
+    if sections is None:
+        scanned = split_sections(raw)
+        if not all(h in scanned for h in headings):
+            return None
+        sections = {h: scanned[h] for h in headings}
+    return sections
+
+
+# --- Regenerate only what changed; returns (sections, regenerated_headings) ---
+# `previous` is {"inputs": ..., "sections": ...} from the last generation, or None.
+def regenerate_incrementally(full_prompt: str, inputs: dict, previous: dict, generate) -> tuple:
+    if previous and previous.get("sections"):
+        stale = changed_sections(previous["inputs"], inputs)
+        if not stale:
+            return previous["sections"], []
+        if len(stale) < len(SECTION_HEADINGS):
+            kept = {h: previous["sections"][h] for h in SECTION_HEADINGS if h not in stale}
+            new_sections = generate_sections(full_prompt, generate, stale, kept)
+            if new_sections:
+                kept.update(new_sections)
+                return {h: kept[h] for h in SECTION_HEADINGS}, stale
+    return generate_sections(full_prompt, generate), list(SECTION_HEADINGS)
@@ -0,0 +1,268 @@
+import argparse
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import requests
+from avs_config import load_config
+from avs_pdf import generate_sections_pdf
+from avs_sections import SECTION_HEADINGS, build_json_prompt, join_sections, sections_from_reply
+from med_education import splice_education
+from providers import LEGACY_OPENAI_MODELS, SYSTEM_PROMPT
+from visit_history import VisitHistory
+
+DEFAULT_DB_PATH = "avs_batches.db"
+CHAT_ENDPOINT = "/v1/chat/completions"
+
+# --- Deferred visit states ---
+PENDING = "pending"
+CLAIMED = "claimed"      # taken by one submitter, being uploaded
+SUBMITTED = "submitted"
+INGESTED = "ingested"
+FAILED = "failed"
+
+# Provider batch states that will not change any more
+BATCH_DONE_STATES = ("completed", "failed", "expired", "cancelled")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deferred_visits (
+    id TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    visit_date TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    batch_id TEXT,
+    state TEXT NOT NULL,
+    error TEXT,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE INDEX IF NOT EXISTS idx_deferred_state ON deferred_visits (state);
+CREATE INDEX IF NOT EXISTS idx_deferred_batch ON deferred_visits (batch_id);
+CREATE TABLE IF NOT EXISTS batches (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    request_count INTEGER NOT NULL,
+    submitted_at REAL NOT NULL,
+    finished_at REAL
+);
+"""
+
+
+# --- Visits waiting for the overnight batch ---
+class DeferredQueue:
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def defer(self, patient_id: str, visit_date: str, inputs: dict, prompt: str) -> str:
+        visit_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO deferred_visits (id, patient_id, visit_date, inputs, prompt, state) VALUES (?, ?, ?, ?, ?, ?)",
+                (visit_id, patient_id, visit_date, json.dumps(inputs), prompt, PENDING),
+            )
+            self._conn.commit()
+        return visit_id
+
+    def visits(self, state: str = None, batch_id: str = None) -> list:
+        query, params = "SELECT * FROM deferred_visits WHERE 1 = 1", []
+        if state:
+            query += " AND state = ?"
+            params.append(state)
+        if batch_id:
+            query += " AND batch_id = ?"
+            params.append(batch_id)
+        with self._lock:
+            rows = self._conn.execute(query + " ORDER BY created_at", params).fetchall()
+        return [{**dict(row), "inputs": json.loads(row["inputs"])} for row in rows]
+
+    def open_batches(self) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM batches WHERE status NOT IN ({','.join('?' * len(BATCH_DONE_STATES))})",
+                BATCH_DONE_STATES,
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM deferred_visits GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    # --- Submission: pending rows are claimed in one UPDATE, so two sessions or processes ---
+    # sharing the database never upload the same visit. The claim id stands in as batch_id
+    # until the provider returns the real one.
+    def claim_pending(self) -> tuple:
+        claim_id = f"claim-{uuid.uuid4().hex}"
+        with self._lock:
+            self._conn.execute("UPDATE deferred_visits SET state = ?, batch_id = ? WHERE state = ?",
+                               (CLAIMED, claim_id, PENDING))
+            self._conn.commit()
+        return claim_id, self.visits(state=CLAIMED, batch_id=claim_id)
+
+    # The upload failed before a batch existed: the visits go back for the next submit
+    def release_claim(self, claim_id: str):
+        with self._lock:
+            self._conn.execute("UPDATE deferred_visits SET state = ?, batch_id = NULL WHERE state = ? AND batch_id = ?",
+                               (PENDING, CLAIMED, claim_id))
+            self._conn.commit()
+
+    def mark_submitted(self, batch_id: str, claim_id: str, request_count: int):
+        with self._lock:
+            self._conn.execute("INSERT INTO batches (id, status, request_count, submitted_at) VALUES (?, ?, ?, ?)",
+                               (batch_id, "validating", request_count, time.time()))
+            self._conn.execute("UPDATE deferred_visits SET state = ?, batch_id = ? WHERE state = ? AND batch_id = ?",
+                               (SUBMITTED, batch_id, CLAIMED, claim_id))
+            self._conn.commit()
+
+    def set_batch_status(self, batch_id: str, status: str):
+        finished = time.time() if status in BATCH_DONE_STATES else None
+        with self._lock:
+            self._conn.execute("UPDATE batches SET status = ?, finished_at = ? WHERE id = ?", (status, finished, batch_id))
+            self._conn.commit()
+
+    def finish_visit(self, visit_id: str, state: str, error: str = None):
+        with self._lock:
+            self._conn.execute("UPDATE deferred_visits SET state = ?, error = ? WHERE id = ?", (state, error, visit_id))
+            self._conn.commit()
+
+
+# --- Minimal client for the OpenAI Files + Batches REST API ---
+# openai==0.28 predates the Batch API, so these calls go over requests directly.
+# api_base can point at mock_batch_server.py for local runs.
+class OpenAIBatchClient:
+    def __init__(self, api_key: str, api_base: str = "https://api.openai.com", timeout: float = 60.0):
+        self.api_base = api_base.rstrip("/")
+        self.timeout = timeout
+        self._session = requests.Session()
+        self._session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def upload_file(self, content: bytes, filename: str = "avs_batch.jsonl") -> str:
+        response = self._session.post(f"{self.api_base}/v1/files", data={"purpose": "batch"},
+                                      files={"file": (filename, content, "application/jsonl")}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["id"]
+
+    def create_batch(self, input_file_id: str) -> dict:
+        response = self._session.post(f"{self.api_base}/v1/batches", json={
+            "input_file_id": input_file_id, "endpoint": CHAT_ENDPOINT, "completion_window": "24h",
+        }, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def get_batch(self, batch_id: str) -> dict:
+        response = self._session.get(f"{self.api_base}/v1/batches/{batch_id}", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def file_content(self, file_id: str) -> bytes:
+        response = self._session.get(f"{self.api_base}/v1/files/{file_id}/content", timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+
+# --- One JSONL line per deferred visit, asking for the sections as JSON ---
+def build_batch_file(visits: list, model: str, max_tokens: int, temperature: float) -> bytes:
+    lines = []
+    for visit in visits:
+        body = {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": build_json_prompt(visit["prompt"])}
+            ],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        }
+        if model not in LEGACY_OPENAI_MODELS:
+            body["response_format"] = {"type": "json_object"}
+        lines.append(json.dumps({"custom_id": visit["id"], "method": "POST", "url": CHAT_ENDPOINT, "body": body}))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+# A crash after create_batch leaves its visits "claimed": resubmitting them could bill the
+# batch twice, so they are left for an operator to check against the provider's batch list.
+def submit_pending(queue: DeferredQueue, client: OpenAIBatchClient, config=None) -> str:
+    config = config or load_config()
+    claim_id, visits = queue.claim_pending()
+    if not visits:
+        return None
+    try:
+        content = build_batch_file(visits, config.openai_model, config.max_tokens, config.temperature)
+        batch = client.create_batch(client.upload_file(content))
+    except Exception:
+        queue.release_claim(claim_id)
+        raise
+    queue.mark_submitted(batch["id"], claim_id, len(visits))
+    return batch["id"]
+
+
+# --- Poll open batches; finished results go through the same sections/PDF/history path ---
+def poll_and_ingest(queue: DeferredQueue, client: OpenAIBatchClient, history: VisitHistory) -> dict:
+    totals = {"ingested": 0, "failed": 0, "open": 0}
+    for batch_row in queue.open_batches():
+        batch = client.get_batch(batch_row["id"])
+        if batch["status"] not in BATCH_DONE_STATES:
+            queue.set_batch_status(batch["id"], batch["status"])
+            totals["open"] += 1
+            continue
+        replies = {}
+        for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+            if file_id:
+                for line in client.file_content(file_id).decode("utf-8").splitlines():
+                    if line.strip():
+                        record = json.loads(line)
+                        replies[record["custom_id"]] = record
+        for visit in queue.visits(state=SUBMITTED, batch_id=batch["id"]):
+            error = ingest_reply(visit, replies.get(visit["id"]), history)
+            queue.finish_visit(visit["id"], FAILED if error else INGESTED, error)
+            totals["failed" if error else "ingested"] += 1
+        queue.set_batch_status(batch["id"], batch["status"])
+    return totals
+
+
+def ingest_reply(visit: dict, record: dict, history: VisitHistory) -> str:
+    if record is None:
+        return "no result in the batch output"
+    response = record.get("response") or {}
+    if record.get("error") or response.get("status_code") != 200:
+        return json.dumps(record.get("error") or response.get("body"))
+    raw = response["body"]["choices"][0]["message"]["content"].strip()
+    sections = sections_from_reply(raw, SECTION_HEADINGS)
+    if not sections:
+        return "reply did not contain the summary sections"
+    sections = splice_education(sections, visit["inputs"])
+    history.save_visit(visit["patient_id"], visit["inputs"], visit["prompt"], join_sections(sections),
+                       generate_sections_pdf(sections).getvalue(), visit_date=visit["visit_date"])
+    return None
+
+
+def make_batch_client(config=None) -> OpenAIBatchClient:
+    config = config or load_config()
+    return OpenAIBatchClient(config.openai_api_key, config.openai_batch_api_base)
+
+
+# --- Overnight CLI: run "submit" in the evening and "poll" from cron until everything is ingested ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Deferred AVS generation through the OpenAI Batch API")
+    parser.add_argument("action", choices=["submit", "poll", "status"])
+    parser.add_argument("--wait", type=float, default=0, help="With poll: keep polling every N seconds until done")
+    args = parser.parse_args()
+    deferred, client = DeferredQueue(), make_batch_client()
+    if args.action == "submit":
+        print(f"Submitted batch: {submit_pending(deferred, client)}")
+    elif args.action == "poll":
+        history = VisitHistory()
+        while True:
+            totals = poll_and_ingest(deferred, client, history)
+            print(totals)
+            if not args.wait or not totals["open"]:
+                break
+            time.sleep(args.wait)
+    else:
+        print(deferred.counts())
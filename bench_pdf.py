@@ -0,0 +1,92 @@
+import argparse
+import statistics
+import time
+from fpdf import FPDF
+from avs_pdf import render_sections, render_summary
+from avs_sections import SECTION_HEADINGS
+from pdf_optimize import optimize_pdf
+from visit_history import VisitHistory
+
+# --- Representative summaries: English renders in core Arial, the translations embed DejaVu ---
+SAMPLE_SUMMARIES = [
+    ["Your kidney disease is CKD stage IIIa and your kidney function has stayed stable since your last visit.",
+     "There is no protein in your urine.",
+     "Your blood pressure is at goal. Your diabetes is controlled.",
+     "Your potassium is a little high, so limit bananas, oranges and potatoes.",
+     "Keep taking your medicines as prescribed. Repeat labs in 3 months."],
+    ["Su enfermedad renal es etapa IV y la función renal ha empeorado desde la última visita.",
+     "Hay más proteína en la orina que antes.",
+     "Su presión arterial fue 152/94, por encima de la meta. Su A1c es 8.4%.",
+     "Su hemoglobina está baja; comenzamos hierro.",
+     "Hablamos sobre las opciones de diálisis. Regrese en 6 semanas."],
+    ["Ваша болезнь почек — стадия IIIb, функция почек стабильна.",
+     "Белка в моче нет.",
+     "Давление 148/92 — выше цели. Диабет под контролем.",
+     "Уровень бикарбоната низкий, мы назначили добавку.",
+     "Сдайте анализы через 3 месяца."],
+]
+
+
+def load_corpus(history_path: str, limit: int) -> list:
+    if history_path:
+        visits = VisitHistory(history_path).iter_visits_between("0000-01-01", "9999-12-31")
+        return [visit["summary"] for _, visit in zip(range(limit), visits)]
+    return [dict(zip(SECTION_HEADINGS, sample)) for sample in SAMPLE_SUMMARIES]
+
+
+def render(summaries: list) -> bytes:
+    pdf = FPDF()
+    for summary in summaries:
+        if isinstance(summary, dict):
+            render_sections(pdf, summary)
+        else:
+            render_summary(pdf, summary)
+    return pdf.output(dest="S").encode("latin1")
+
+
+# --- Size and time per document, standard output vs pdf_mode "compact" ---
+def measure(corpus: list) -> dict:
+    results = {"standard": {"sizes": [], "times": []}, "compact": {"sizes": [], "times": []}}
+    for summary in corpus:
+        start = time.perf_counter()
+        data = render([summary])
+        rendered = time.perf_counter()
+        compact = optimize_pdf(data)
+        optimized = time.perf_counter()
+        results["standard"]["sizes"].append(len(data))
+        results["standard"]["times"].append(rendered - start)
+        results["compact"]["sizes"].append(len(compact))
+        results["compact"]["times"].append(optimized - start)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare standard and compact PDF output size and render time.")
+    parser.add_argument("--history", default="", help="visit history database to draw stored summaries from")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the built-in samples")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.history, args.limit)
+    if not args.history:
+        corpus = corpus * args.repeat
+    results = measure(corpus)
+    for mode, result in results.items():
+        times = sorted(result["times"])
+        p95 = times[min(len(times) - 1, int(0.95 * len(times)))]
+        print(f"{mode:8s} n={len(times):4d}  mean size={statistics.mean(result['sizes']) / 1024:6.1f} KB  "
+              f"total={sum(result['sizes']) / 1024:8.1f} KB  mean={statistics.mean(times) * 1000:6.1f}ms  "
+              f"p95={p95 * 1000:6.1f}ms")
+    saved = 1 - sum(results["compact"]["sizes"]) / sum(results["standard"]["sizes"])
+    print(f"per-document reduction: {saved:.1%}")
+
+    # One merged print job: fonts and resources are shared by every page
+    merged = render(corpus)
+    start = time.perf_counter()
+    compact = optimize_pdf(merged)
+    print(f"merged   {len(corpus)} summaries: standard={len(merged) / 1024:.1f} KB  "
+          f"compact={len(compact) / 1024:.1f} KB  optimize={(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
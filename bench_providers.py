@@ -0,0 +1,66 @@
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from avs_prompt import build_prompt
+from providers import make_provider
+
+# --- Representative structured visits used for the latency comparison ---
+SAMPLE_INPUTS = [
+    {"ckd_stage": "IIIa", "kidney_trend": "Stable", "proteinuria_status": "None", "bp_status": "At Goal",
+     "bp_reading": "At Goal", "diabetes_status": "Controlled", "a1c_level": "", "med_change": "No"},
+    {"ckd_stage": "IV", "kidney_trend": "Worsening", "proteinuria_status": "Worsening", "bp_status": "Above Goal",
+     "bp_reading": "152/94", "diabetes_status": "Uncontrolled", "a1c_level": "8.4",
+     "electrolyte_included": True, "potassium_status": "High", "bicarbonate_status": "Low", "sodium_status": "Normal",
+     "med_change": "Yes", "med_change_types": ["Potassium Binder", "Bicarbonate Supplement"]},
+    {"ckd_stage": "V", "kidney_trend": "Worsening", "proteinuria_status": "Not Present", "bp_status": "None",
+     "diabetes_status": "None", "anemia_included": True, "hemoglobin_status": "Low", "iron_status": "Low",
+     "bone_included": True, "pth_status": "High", "vitamin_d_status": "Low", "calcium_status": "Normal",
+     "med_change": "Yes", "med_change_types": ["ESA Therapy", "Iron Supplement"],
+     "additional_comments": "Discussed dialysis options and transplant referral."},
+]
+
+
+def time_provider(provider, prompts: list, concurrency: int) -> list:
+    def timed(prompt):
+        start = time.perf_counter()
+        provider.generate(prompt)
+        return time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(timed, prompts))
+
+
+def report(name: str, latencies: list, wall: float):
+    latencies = sorted(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    print(f"{name:8s} n={len(latencies):3d}  mean={statistics.mean(latencies):6.2f}s  "
+          f"p50={statistics.median(latencies):6.2f}s  p95={p95:6.2f}s  throughput={len(latencies) / wall:5.2f}/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare AVS generation latency across providers.")
+    parser.add_argument("--providers", default="local,openai", help="comma-separated: local, openai, gemini")
+    parser.add_argument("--model-path", default=os.environ.get("LOCAL_MODEL_PATH", ""))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=1)
+    args = parser.parse_args()
+
+    prompts = [build_prompt(inputs) for inputs in SAMPLE_INPUTS] * args.repeat
+    for name in args.providers.split(","):
+        if name == "local":
+            start = time.perf_counter()
+            provider = make_provider("local", model_path=args.model_path)
+            print(f"local    warm load: {time.perf_counter() - start:.2f}s")
+        elif name == "openai":
+            provider = make_provider("openai", api_key=os.environ["OPENAI_API_KEY"])
+        else:
+            provider = make_provider("gemini", api_key=os.environ["GEMINI_API_KEY"])
+        start = time.perf_counter()
+        latencies = time_provider(provider, prompts, args.concurrency)
+        report(name, latencies, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
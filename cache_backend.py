@@ -0,0 +1,232 @@
+import hashlib
+import socket
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+
+# Key prefixes shared by every replica
+RESPONSE_PREFIX = "avs:response:"
+PDF_PREFIX = "avs:pdf:"
+BUCKET_PREFIX = "avs:bucket:"
+
+
+def response_key(provider_name: str, model: str, prompt: str, json_mode: bool) -> str:
+    digest = hashlib.sha256(f"{provider_name}\0{model}\0{int(json_mode)}\0{prompt}".encode("utf-8")).hexdigest()
+    return RESPONSE_PREFIX + digest
+
+
+def pdf_key(renderer: str, content: str) -> str:
+    return PDF_PREFIX + hashlib.sha256(f"{renderer}\0{content}".encode("utf-8")).hexdigest()
+
+
+# --- Token bucket arithmetic shared by both backends ---
+# State is "tokens:timestamp". Returns the new state and how long to wait (0.0 when granted).
+def _take_tokens(state: bytes, now: float, rate: float, capacity: float, cost: float) -> tuple:
+    if state:
+        tokens, stamp = (float(v) for v in state.decode("ascii").split(":"))
+        tokens = min(capacity, tokens + max(0.0, now - stamp) * rate)
+    else:
+        tokens = capacity
+    if tokens >= cost:
+        return f"{tokens - cost}:{now}".encode("ascii"), 0.0
+    return f"{tokens}:{now}".encode("ascii"), (cost - tokens) / rate
+
+
+# --- In-process backend (single replica, or when no cache_url is configured) ---
+# Replies and PDFs are kept least recently used first up to `max_entries` and `max_bytes`;
+# expired entries are swept on writes at most every SWEEP_SECONDS. Token buckets are kept
+# apart so eviction never refills a rate limit.
+DEFAULT_MAX_ENTRIES = 10_000
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+SWEEP_SECONDS = 60.0
+
+
+class InProcessBackend:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._size = 0
+        self._buckets = {}
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes:
+        return self.get_many([key])[0]
+
+    def set(self, key: str, value: bytes, ttl: int = DEFAULT_TTL_SECONDS):
+        self.set_many({key: value}, ttl)
+
+    def get_many(self, keys: list) -> list:
+        now = time.time()
+        with self._lock:
+            values = []
+            for key in keys:
+                value, expires = self._data.get(key, (None, 0))
+                if value is not None and expires and expires <= now:
+                    self._remove(key)
+                    value = None
+                elif value is not None:
+                    self._data.move_to_end(key)
+                values.append(value)
+            return values
+
+    def set_many(self, items: dict, ttl: int = DEFAULT_TTL_SECONDS):
+        now = time.time()
+        expires = now + ttl if ttl else 0
+        with self._lock:
+            if now >= self._next_sweep:
+                self._sweep(now)
+            for key, value in items.items():
+                value = _to_bytes(value)
+                if key in self._data:
+                    self._remove(key)
+                self._data[key] = (value, expires)
+                self._size += len(value)
+            while self._data and (len(self._data) > self.max_entries or self._size > self.max_bytes):
+                self._remove(next(iter(self._data)))
+
+    def _remove(self, key: str):
+        value, _ = self._data.pop(key)
+        self._size -= len(value)
+
+    def _sweep(self, now: float):
+        for key in [key for key, (_, expires) in self._data.items() if expires and expires <= now]:
+            self._remove(key)
+        self._next_sweep = now + SWEEP_SECONDS
+
+    def acquire_tokens(self, bucket: str, rate: float, capacity: float, cost: float = 1.0) -> float:
+        with self._lock:
+            self._buckets[bucket], wait = _take_tokens(self._buckets.get(bucket), time.time(), rate, capacity, cost)
+        return wait
+
+    # Nothing to release; present so a retired generation core can close either backend
+    def close(self):
+        pass
+
+
+# --- Redis-protocol backend (RESP2 over a plain socket, no client library needed) ---
+# Works against Redis, Valkey, KeyDB or the local stand-in in redis_standin.py.
+class RedisBackend:
+    def __init__(self, url: str = "redis://localhost:6379/0", timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._sock = None
+        self._reader = None
+
+    def get(self, key: str) -> bytes:
+        return self.get_many([key])[0]
+
+    def set(self, key: str, value: bytes, ttl: int = DEFAULT_TTL_SECONDS):
+        self.set_many({key: value}, ttl)
+
+    # One MGET round trip for any number of keys
+    def get_many(self, keys: list) -> list:
+        if not keys:
+            return []
+        return self.pipeline([["MGET", *keys]])[0]
+
+    # All SETs are written in one go and their replies read back together
+    def set_many(self, items: dict, ttl: int = DEFAULT_TTL_SECONDS):
+        if items:
+            expiry = ["EX", ttl] if ttl else []
+            self.pipeline([["SET", key, value, *expiry] for key, value in items.items()])
+
+    # WATCH/MULTI/EXEC so concurrent replicas never both spend the same tokens
+    def acquire_tokens(self, bucket: str, rate: float, capacity: float, cost: float = 1.0) -> float:
+        key = BUCKET_PREFIX + bucket
+        ttl = max(1, int(capacity / rate) + 1)
+        # WATCH belongs to the connection, so the whole transaction holds the socket
+        with self._lock:
+            while True:
+                state = self.pipeline([["WATCH", key], ["GET", key]])[1]
+                new_state, wait = _take_tokens(state, time.time(), rate, capacity, cost)
+                replies = self.pipeline([["MULTI"], ["SET", key, new_state, "EX", ttl], ["EXEC"]])
+                if replies[-1] is not None:
+                    return wait
+
+    def pipeline(self, commands: list) -> list:
+        payload = b"".join(_encode(command) for command in commands)
+        with self._lock:
+            try:
+                self._connection().sendall(payload)
+                replies = [self._read_reply() for _ in commands]
+            except OSError:
+                self._close()
+                raise
+        errors = [r for r in replies if isinstance(r, RuntimeError)]
+        if errors:
+            raise errors[0]
+        return replies
+
+    def _connection(self) -> socket.socket:
+        if self._sock is None:
+            self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self._reader = self._sock.makefile("rb")
+            setup = ([["AUTH", self.password]] if self.password else []) + ([["SELECT", self.db]] if self.db else [])
+            for command in setup:
+                self._sock.sendall(_encode(command))
+                reply = self._read_reply()
+                if isinstance(reply, RuntimeError):
+                    self._close()
+                    raise reply
+        return self._sock
+
+    def _close(self):
+        if self._sock is not None:
+            self._sock.close()
+        self._sock = self._reader = None
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line:
+            raise ConnectionError("Cache server closed the connection")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode("utf-8")
+        if kind == b"-":
+            return RuntimeError(f"Cache server error: {body.decode('utf-8')}")
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2]
+        if kind == b"*":
+            count = int(body)
+            return None if count < 0 else [self._read_reply() for _ in range(count)]
+        raise ConnectionError(f"Unexpected reply from cache server: {line!r}")
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+
+def _to_bytes(value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode("utf-8")
+
+
+def _encode(command: list) -> bytes:
+    parts = [_to_bytes(arg) for arg in command]
+    return b"*%d\r\n" % len(parts) + b"".join(b"$%d\r\n%s\r\n" % (len(p), p) for p in parts)
+
+
+# --- Backend Factory: "" or "memory://" stays in-process, redis:// is shared by all replicas ---
+def make_backend(url: str = ""):
+    if not url or url.startswith("memory://"):
+        return InProcessBackend()
+    if url.startswith(("redis://", "valkey://")):
+        return RedisBackend(url)
+    raise ValueError(f"Unknown cache backend URL: {url}")
@@ -0,0 +1,157 @@
+import argparse
+import itertools
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from avs_config import load_config
+from avs_options import BP_OPTIONS, CKD_STAGES, DIABETES_OPTIONS, KIDNEY_TRENDS, PROTEINURIA_OPTIONS
+from avs_prompt import build_prompt
+from avs_sections import build_json_prompt, generate_sections
+from cache_backend import response_key
+from consistency_check import verify_and_repair
+from eval_prompts import make_token_counter
+from freetext_parse import DEFAULT_INPUTS
+from med_education import splice_education
+from priority_scheduler import BATCH
+from visit_history import VisitHistory
+
+# USD per 1K (input, output) tokens; unknown models are priced as gpt-4 so the budget errs low
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-turbo": (0.01, 0.03),
+    "gpt-4o": (0.0025, 0.01),
+    "gpt-4o-mini": (0.00015, 0.0006),
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gemini-1.5-pro": (0.00125, 0.005),
+}
+DEFAULT_LOOKBACK_DAYS = 90
+# Fields that describe the profile space the warmer enumerates
+ENUMERATED_FIELDS = {
+    "ckd_stage": CKD_STAGES,
+    "kidney_trend": KIDNEY_TRENDS,
+    "proteinuria_status": PROTEINURIA_OPTIONS,
+    "bp_status": BP_OPTIONS,
+    "diabetes_status": DIABETES_OPTIONS,
+}
+
+
+# --- Profiles mined from recent visits: identical prompts counted together ---
+def mine_profiles(history: VisitHistory, days: int, compact: bool) -> Counter:
+    start = (date.today() - timedelta(days=days)).isoformat()
+    counts, examples = Counter(), {}
+    for visit in history.iter_visits_between(start, date.today().isoformat()):
+        prompt = build_prompt(visit["inputs"], compact=compact)
+        counts[prompt] += 1
+        examples.setdefault(prompt, visit["inputs"])
+    return Counter({(prompt, _freeze(examples[prompt])): n for prompt, n in counts.items()})
+
+
+# --- Profiles enumerated from the widget options, scored by how often each value was seen ---
+# Labs not reviewed and no medication change, i.e. the shape of most routine follow-ups. BP above
+# goal and uncontrolled diabetes always come with a reading, so only mined visits can warm those.
+def enumerate_profiles(mined: Counter, compact: bool) -> Counter:
+    seen = {field: Counter() for field in ENUMERATED_FIELDS}
+    for (_, frozen), n in mined.items():
+        inputs = dict(frozen)
+        for field in ENUMERATED_FIELDS:
+            seen[field][inputs.get(field)] += n
+    scored = Counter()
+    for values in itertools.product(*ENUMERATED_FIELDS.values()):
+        inputs = dict(DEFAULT_INPUTS, **dict(zip(ENUMERATED_FIELDS, values)), egfr=None)
+        if inputs["bp_status"] == "Above Goal" or inputs["diabetes_status"] == "Uncontrolled":
+            continue
+        # Add-one smoothing keeps unseen values possible but behind anything clinics actually use
+        score = 1.0
+        for field, value in zip(ENUMERATED_FIELDS, values):
+            score *= (seen[field][value] + 1) / (sum(seen[field].values()) + len(ENUMERATED_FIELDS[field]))
+        scored[(build_prompt(inputs, compact=compact), _freeze(inputs))] = score
+    return scored
+
+
+def rank_profiles(history: VisitHistory, days: int = DEFAULT_LOOKBACK_DAYS, compact: bool = False,
+                  min_count: int = 2) -> list:
+    mined = mine_profiles(history, days, compact)
+    ranked = [(prompt, dict(frozen)) for (prompt, frozen), n in mined.most_common() if n >= min_count]
+    seen = {prompt for prompt, _ in ranked}
+    ranked += [(prompt, dict(frozen)) for (prompt, frozen), _ in enumerate_profiles(mined, compact).most_common()
+               if prompt not in seen]
+    return ranked
+
+
+def estimate_cost(prompt: str, model: str, max_tokens: int, count) -> float:
+    price_in, price_out = MODEL_PRICES.get(model, MODEL_PRICES["gpt-4"])
+    return count(build_json_prompt(prompt)) / 1000 * price_in + max_tokens / 1000 * price_out
+
+
+# --- Pre-generate and pre-render ranked profiles into the response cache within a budget ---
+# Mirrors the interactive structured path (sections, consistency repair, education, PDF), so
+# a morning visit with the same inputs hits the cache for both the reply and the PDF.
+def warm_cache(core, profiles: list, budget_usd: float, max_tokens: int, workers: int = 4,
+               deadline: float = None, report_progress=None) -> dict:
+    provider = core.provider
+    _, count = make_token_counter(provider.model)
+    keys = [response_key(provider.name, provider.model, build_json_prompt(p), True) for p, _ in profiles]
+    cached = core.cache.get_many(keys) if core.cache else [None] * len(keys)
+    stats = {"candidates": len(profiles), "already_cached": 0, "warmed": 0, "failed": 0, "estimated_usd": 0.0}
+    selected = []
+    for (prompt, inputs), hit in zip(profiles, cached):
+        if hit is not None:
+            stats["already_cached"] += 1
+            continue
+        cost = estimate_cost(prompt, provider.model, max_tokens, count) if provider.name != "local" else 0.0
+        if stats["estimated_usd"] + cost > budget_usd:
+            break
+        stats["estimated_usd"] += cost
+        selected.append((prompt, inputs))
+
+    def warm(profile):
+        prompt, inputs = profile
+        if deadline and time.time() > deadline:
+            return False
+        generate = lambda p: core.generate(p, json_mode=True, priority=BATCH, clinician="cache-warmer")
+        try:
+            sections = generate_sections(prompt, generate)
+            if not sections:
+                return False
+            sections, _ = verify_and_repair(prompt, sections, inputs, generate)
+            core.run(core.arender_pdf(splice_education(sections, inputs)))
+        except Exception:
+            return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for done, ok in enumerate(pool.map(warm, selected), start=1):
+            stats["warmed" if ok else "failed"] += 1
+            if report_progress:
+                report_progress(f"Warmed {done}/{len(selected)} profiles")
+    stats["estimated_usd"] = round(stats["estimated_usd"], 2)
+    return stats
+
+
+def _freeze(inputs: dict) -> tuple:
+    return tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in inputs.items()))
+
+
+# --- Off-hours CLI, e.g. from cron at 22:00: python cache_warmer.py --budget 5 --hours 8 ---
+if __name__ == "__main__":
+    from async_generation import AsyncGenerationCore
+    from cache_backend import make_backend
+    from providers import provider_from_config
+
+    parser = argparse.ArgumentParser(description="Pre-generate the most common AVS input profiles into the cache")
+    parser.add_argument("--budget", type=float, default=None, help="USD to spend (default: warm_budget_usd)")
+    parser.add_argument("--days", type=int, default=DEFAULT_LOOKBACK_DAYS)
+    parser.add_argument("--hours", type=float, default=8.0, help="stop starting new profiles after this long")
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    config = load_config()
+    if not config.cache_url:
+        sys.exit("cache_url is not set; a warmer process can only fill a shared (redis://) cache.")
+    core = AsyncGenerationCore(provider_from_config(config), cache=make_backend(config.cache_url),
+                               requests_per_minute=config.requests_per_minute, cache_ttl=config.cache_ttl_seconds)
+    profiles = rank_profiles(VisitHistory(), args.days, compact=config.prompt_mode == "compact")
+    budget = config.warm_budget_usd if args.budget is None else args.budget
+    print(warm_cache(core, profiles, budget, config.max_tokens, args.workers,
+                     deadline=time.time() + args.hours * 3600, report_progress=print))
@@ -0,0 +1,209 @@
+import logging
+import re
+import threading
+from avs_sections import SECTION_HEADINGS, generate_sections
+
+logger = logging.getLogger("avs.consistency")
+
+KIDNEY_HEADING, HTN_DM_HEADING = SECTION_HEADINGS[0], SECTION_HEADINGS[2]
+
+# Arabic and Roman stage spellings reduced to the selectbox values; bare "III" fits either IIIa or IIIb
+_STAGE_ALIASES = {"1": "I", "2": "II", "3": "III", "3A": "IIIa", "3B": "IIIb", "4": "IV", "5": "V",
+                  "I": "I", "II": "II", "III": "III", "IIIA": "IIIa", "IIIB": "IIIb", "IV": "IV", "V": "V"}
+_STAGE_PATTERN = re.compile(r"\b(?:CKD\s+stage|stage|CKD)\s+(IV|V|I{1,3}[ab]?|[1-5][ab]?)\b", re.IGNORECASE)
+_BP_PATTERN = re.compile(r"\b(\d{2,3})\s*/\s*(\d{2,3})\b(\s*mm\s*Hg)?", re.IGNORECASE)
+_BP_CONTEXT = re.compile(r"\b(?:BP|blood pressure|reading)\b", re.IGNORECASE)
+# An A1c value is a number with % later in the sentence, or a bare number straight after the phrase;
+# "reflects 3 months of sugars" is a time span, not the value
+_A1C_PATTERN = re.compile(r"\b(?:Hb)?A1c\b(?:(?:[^.]|\.(?=\d)){0,60}?\b(\d{1,2}(?:\.\d+)?)\s*%"
+                          r"|\s*(?:level\s*)?(?:is|was|of|:|=)?\s*(\d{1,2}(?:\.\d+)?)\b"
+                          r"(?!\.\d|\s*(?:months?|weeks?|days?|years?)\b))", re.IGNORECASE)
+_EGFR_PATTERN = re.compile(r"\beGFR\b[^.\d]{0,30}?(\d{1,3}(?:\.\d+)?)", re.IGNORECASE)
+# General guidance ("keep blood pressure below 130/80", "A1c under 7%") quotes targets, not this patient
+_GOAL_BEFORE = re.compile(r"(?:\b(?:below|under|less than|goal|target)|<|≤)\s*(?:of\s+|is\s+)?(?:<\s*)?$",
+                          re.IGNORECASE)
+FIELD_LABELS = {"ckd_stage": "CKD stage", "bp_reading": "blood pressure reading", "a1c_level": "A1c",
+                "egfr": "eGFR"}
+
+
+def _stage_matches(found: str, expected: str) -> bool:
+    return found == expected or (found == "III" and expected in ("IIIa", "IIIb"))
+
+
+def _expected_bp(inputs: dict) -> tuple:
+    match = re.fullmatch(r"\s*(\d{2,3})\s*/\s*(\d{2,3})\s*", str(inputs.get("bp_reading", "")))
+    return (int(match.group(1)), int(match.group(2))) if match else None
+
+
+def _expected_a1c(inputs: dict) -> float:
+    match = re.fullmatch(r"\s*(\d{1,2}(?:\.\d+)?)\s*%?\s*", str(inputs.get("a1c_level", "")))
+    return float(match.group(1)) if match else None
+
+
+def _is_goal(text: str, position: int) -> bool:
+    return bool(_GOAL_BEFORE.search(text[max(0, position - 20):position]))
+
+
+def _bp_mentions(text: str) -> list:
+    readings = []
+    for match in _BP_PATTERN.finditer(text):
+        if _is_goal(text, match.start()):
+            continue
+        systolic, diastolic = int(match.group(1)), int(match.group(2))
+        # Fractions and dates also look like "10/20"; only plausible pressures next to a BP word count
+        nearby = text[max(0, match.start() - 40):match.start()]
+        if 70 <= systolic <= 260 and 30 <= diastolic <= 160 and (match.group(3) or _BP_CONTEXT.search(nearby)):
+            readings.append((systolic, diastolic))
+    return readings
+
+
+def _a1c_mentions(text: str) -> list:
+    mentions = []
+    for m in _A1C_PATTERN.finditer(text):
+        group = 1 if m.group(1) else 2
+        if not _is_goal(text, m.start(group)):
+            mentions.append(float(m.group(group)))
+    return mentions
+
+
+# --- Cross-check the facts a summary states against the inputs it was generated from ---
+# Each fact is checked only in the section that owns it (stage and eGFR under kidney function,
+# BP and A1c under HTN & DM); Labs and Suggestions are free to quote general targets.
+# Returns one record per problem: {"section", "field", "expected", "found"}; found is None when missing.
+def check_summary(sections: dict, inputs: dict) -> list:
+    mismatches = []
+    stage = inputs.get("ckd_stage", "N/A")
+    bp = _expected_bp(inputs) if inputs.get("bp_status") == "Above Goal" else None
+    a1c = _expected_a1c(inputs) if inputs.get("diabetes_status") == "Uncontrolled" else None
+    egfr = inputs.get("egfr")
+    kidney_text, htn_text = sections.get(KIDNEY_HEADING, ""), sections.get(HTN_DM_HEADING, "")
+
+    if stage != "N/A":
+        stages = [_STAGE_ALIASES.get(raw.upper()) for raw in _STAGE_PATTERN.findall(kidney_text)]
+        for found in stages:
+            if found and not _stage_matches(found, stage):
+                mismatches.append({"section": KIDNEY_HEADING, "field": "ckd_stage", "expected": stage, "found": found})
+        if not any(found and _stage_matches(found, stage) for found in stages):
+            mismatches.append({"section": KIDNEY_HEADING, "field": "ckd_stage", "expected": stage, "found": None})
+    if egfr is not None:
+        for raw in _EGFR_PATTERN.findall(kidney_text):
+            if abs(float(raw) - egfr) > 1:
+                mismatches.append({"section": KIDNEY_HEADING, "field": "egfr", "expected": egfr, "found": float(raw)})
+
+    readings = _bp_mentions(htn_text)
+    for reading in readings:
+        if reading != bp:
+            mismatches.append({"section": HTN_DM_HEADING, "field": "bp_reading",
+                               "expected": "%d/%d" % bp if bp else None, "found": "%d/%d" % reading})
+    if bp and bp not in readings:
+        mismatches.append({"section": HTN_DM_HEADING, "field": "bp_reading", "expected": "%d/%d" % bp, "found": None})
+    values = _a1c_mentions(htn_text)
+    for value in values:
+        if a1c is None or abs(value - a1c) > 0.05:
+            mismatches.append({"section": HTN_DM_HEADING, "field": "a1c_level", "expected": a1c, "found": value})
+    if a1c is not None and not any(abs(value - a1c) <= 0.05 for value in values):
+        mismatches.append({"section": HTN_DM_HEADING, "field": "a1c_level", "expected": a1c, "found": None})
+    return mismatches
+
+
+def _shown(field: str, value) -> str:
+    if field == "a1c_level":
+        return f"{value:g}%"
+    if field == "egfr":
+        return f"{value:g}"
+    return str(value)
+
+
+# --- Unresolved mismatches as sentences for the clinician reviewing the summary ---
+# A wrong value and the matching "not stated" record describe one problem, so they share a sentence.
+def review_notes(mismatches: list) -> list:
+    notes = []
+    wrong = {(m["section"], m["field"]) for m in mismatches if m["found"] is not None}
+    for m in mismatches:
+        if m["found"] is None and (m["section"], m["field"]) in wrong:
+            continue
+        section = m["section"].split(". ", 1)[-1].rstrip(":")
+        label = FIELD_LABELS[m["field"]]
+        if m["found"] is None:
+            detail = f"it should give the {label} as {_shown(m['field'], m['expected'])} but does not mention it."
+        elif m["expected"] is None:
+            detail = f"it gives the {label} as {_shown(m['field'], m['found'])}, but none was entered."
+        else:
+            detail = (f"it gives the {label} as {_shown(m['field'], m['found'])}, "
+                      f"but {_shown(m['field'], m['expected'])} was entered.")
+        note = f"Please check the {section} section: {detail}"
+        if note not in notes:
+            notes.append(note)
+    return notes
+
+
+def correction_note(mismatches: list) -> str:
+    facts = []
+    for m in mismatches:
+        if m["field"] == "ckd_stage":
+            fact = f"The CKD stage is {m['expected']}; state it and no other stage."
+        elif m["field"] == "bp_reading":
+            fact = (f"The blood pressure reading is {m['expected']} mmHg; state it exactly."
+                    if m["expected"] else "No blood pressure reading was provided; do not state one.")
+        elif m["field"] == "a1c_level":
+            fact = (f"The A1c is {m['expected']:g}%; state it exactly."
+                    if m["expected"] is not None else "No A1c value was provided; do not state one.")
+        else:
+            fact = f"The eGFR is {m['expected']} mL/min/1.73m²; do not state another value."
+        if fact not in facts:
+            facts.append(fact)
+    return "Correct these facts in the rewritten sections:\n" + "\n".join(f"- {f}" for f in facts)
+
+
+# --- Rates across the process, logged as they change ---
+class ConsistencyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"checked": 0, "mismatched": 0, "repaired": 0, "unresolved": 0}
+
+    def record(self, mismatched: bool, repaired: bool):
+        with self._lock:
+            self.counts["checked"] += 1
+            self.counts["mismatched"] += int(mismatched)
+            self.counts["repaired"] += int(mismatched and repaired)
+            self.counts["unresolved"] += int(mismatched and not repaired)
+            counts = dict(self.counts)
+        logger.info("consistency: checked=%d mismatch_rate=%.3f repair_rate=%.3f",
+                    counts["checked"], counts["mismatched"] / counts["checked"],
+                    counts["repaired"] / max(1, counts["mismatched"]))
+
+    def rates(self) -> dict:
+        with self._lock:
+            checked, mismatched = self.counts["checked"], self.counts["mismatched"]
+            return {"checked": checked, "mismatch_rate": mismatched / checked if checked else 0.0,
+                    "repair_rate": self.counts["repaired"] / mismatched if mismatched else 0.0}
+
+
+STATS = ConsistencyStats()
+
+
+# --- Check, and rewrite only the sections that misstate an input (one repair attempt) ---
+# Returns (sections, report) with report {"mismatches", "repaired", "unresolved"}.
+def verify_and_repair(full_prompt: str, sections: dict, inputs: dict, generate) -> tuple:
+    mismatches = check_summary(sections, inputs)
+    report = {"mismatches": mismatches, "repaired": [], "unresolved": []}
+    if not mismatches:
+        STATS.record(False, False)
+        return sections, report
+    bad = [h for h in sections if any(m["section"] == h for m in mismatches)]
+    kept = {h: t for h, t in sections.items() if h not in bad}
+    logger.info("consistency: %d mismatch(es), repairing %s", len(mismatches), ", ".join(bad))
+    rewritten = generate_sections(full_prompt + "\n\n" + correction_note(mismatches), generate, bad, kept)
+    if rewritten:
+        candidate = {h: rewritten.get(h, t) for h, t in sections.items()}
+        remaining = check_summary(candidate, inputs)
+        if len(remaining) < len(mismatches):
+            sections = candidate
+            report["repaired"] = [h for h in bad if not any(m["section"] == h for m in remaining)]
+            report["unresolved"] = remaining
+        else:
+            report["unresolved"] = mismatches
+    else:
+        report["unresolved"] = mismatches
+    STATS.record(True, not report["unresolved"])
+    return sections, report
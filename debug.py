@@ -1,22 +1,19 @@
 import streamlit as st
 import openai
+from avs_config import load_config
 
-# Debugging output to check secrets
-st.write("DEBUG: st.secrets content:")
-st.write(st.secrets)
+# Debugging output to check configuration (key values are never rendered)
+config = load_config()
+st.write("DEBUG: configuration source:", config.source or "environment only")
+st.write(config.masked())
 
-if "general" in st.secrets:
-    st.write("DEBUG: 'general' section is present.")
-    if "OPENAI_API_KEY" in st.secrets["general"]:
-        key = st.secrets["general"]["OPENAI_API_KEY"]
-        st.write("DEBUG: OPENAI_API_KEY is present. Masked key:", key[:6] + "..." + key[-4:])
-    else:
-        st.write("DEBUG: OPENAI_API_KEY is NOT found under 'general'.")
+if config.openai_api_key:
+    st.write("DEBUG: OpenAI API key is present.")
 else:
-    st.write("DEBUG: 'general' section is NOT found in st.secrets.")
+    st.write("DEBUG: OpenAI API key is NOT found in [general], the top level or the environment.")
 
-# Set the API key using the nested key from the 'general' section
-openai.api_key = st.secrets["general"]["OPENAI_API_KEY"]
+# Set the API key from the resolved configuration
+openai.api_key = config.openai_api_key
 
 # Continue with the rest of your app
 st.title("AVS Summary Generator")
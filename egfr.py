@@ -0,0 +1,129 @@
+import threading
+from datetime import date
+import numpy as np
+import pandas as pd
+
+# --- CKD stage cut-offs on eGFR (mL/min/1.73m2), lower bound of each stage ---
+STAGE_BOUNDS = [(90.0, "I"), (60.0, "II"), (45.0, "IIIa"), (30.0, "IIIb"), (15.0, "IV"), (0.0, "V")]
+
+# --- Trend thresholds on the eGFR regression slope (mL/min/1.73m2 per year) ---
+WORSENING_SLOPE = -3.0
+IMPROVING_SLOPE = 3.0
+
+_DAYS_PER_YEAR = 365.25
+
+
+# --- CKD-EPI 2021 (race-free) creatinine equation; vectorized over arrays ---
+# creatinine in mg/dL, age in years, female as bool (or "F"/"M" strings).
+def compute_egfr(creatinine, age, female):
+    scr = np.asarray(creatinine, dtype=float)
+    age = np.asarray(age, dtype=float)
+    female = np.asarray(female)
+    if female.dtype.kind in "US" or female.dtype == object:
+        female = np.char.upper(female.astype(str)) == "F"
+    female = female.astype(bool)
+    kappa = np.where(female, 0.7, 0.9)
+    alpha = np.where(female, -0.241, -0.302)
+    ratio = scr / kappa
+    egfr = (142.0 * np.minimum(ratio, 1.0) ** alpha * np.maximum(ratio, 1.0) ** -1.200
+            * 0.9938 ** age * np.where(female, 1.012, 1.0))
+    return egfr
+
+
+def egfr_to_stage(egfr):
+    egfr = np.asarray(egfr, dtype=float)
+    thresholds = [bound for bound, _ in STAGE_BOUNDS]
+    labels = np.array([stage for _, stage in STAGE_BOUNDS] + ["N/A"], dtype=object)
+    # For each value, the first stage whose lower bound it reaches; NaN falls through to "N/A"
+    index = np.select([egfr >= t for t in thresholds], list(range(len(thresholds))), default=len(thresholds))
+    return labels[index]
+
+
+def slope_to_trend(slope) -> str:
+    if slope is None or np.isnan(slope):
+        return "N/A"
+    if slope <= WORSENING_SLOPE:
+        return "Worsening"
+    if slope >= IMPROVING_SLOPE:
+        return "Improving"
+    return "Stable"
+
+
+# --- Whole-cohort derivation ---
+# `labs` has patient_id, lab_date, creatinine, age, sex. Returns one row per patient with
+# the latest eGFR, its stage, the regression slope over all values and the trend label.
+def derive_cohort(labs: pd.DataFrame) -> pd.DataFrame:
+    df = labs.copy()
+    df["egfr"] = compute_egfr(df["creatinine"], df["age"], df["sex"])
+    t = (pd.to_datetime(df["lab_date"]) - pd.Timestamp("1970-01-01")).dt.days / _DAYS_PER_YEAR
+    df["t"], df["tt"], df["ty"] = t, t * t, t * df["egfr"]
+    # Sorted on the parsed date: raw MM/DD/YYYY strings do not sort chronologically
+    df = df.sort_values(["patient_id", "t"])
+    grouped = df.groupby("patient_id")
+    sums = grouped[["t", "egfr", "tt", "ty"]].sum()
+    n = grouped.size()
+    denom = n * sums["tt"] - sums["t"] ** 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = np.where((n > 1) & (denom > 0), (n * sums["ty"] - sums["t"] * sums["egfr"]) / denom, np.nan)
+    out = pd.DataFrame({"egfr": grouped["egfr"].last(), "egfr_slope": slope}, index=sums.index)
+    out["ckd_stage"] = egfr_to_stage(out["egfr"])
+    out["kidney_trend"] = [slope_to_trend(s) for s in out["egfr_slope"]]
+    return out.reset_index()
+
+
+# --- Per-patient incremental trend cache ---
+# Keeps running regression sums per patient, so adding a new lab updates the slope in O(1)
+# without rereading the patient's series.
+class EGFRTrendCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sums = {}
+
+    def __contains__(self, patient_id: str) -> bool:
+        return patient_id in self._sums
+
+    def add(self, patient_id: str, lab_date, egfr: float):
+        day = pd.Timestamp(lab_date).normalize()
+        t = (day - pd.Timestamp("1970-01-01")).days / _DAYS_PER_YEAR
+        with self._lock:
+            s = self._sums.setdefault(patient_id, {"n": 0, "t": 0.0, "y": 0.0, "tt": 0.0, "ty": 0.0, "points": {}})
+            # One value per lab date: a repeat (e.g. a Streamlit rerun) replaces rather than double counts
+            previous = s["points"].pop(day, None)
+            if previous is not None:
+                self._apply(s, t, previous, -1)
+            s["points"][day] = egfr
+            self._apply(s, t, egfr, 1)
+
+    @staticmethod
+    def _apply(s: dict, t: float, egfr: float, sign: int):
+        s["n"] += sign
+        s["t"] += sign * t
+        s["y"] += sign * egfr
+        s["tt"] += sign * t * t
+        s["ty"] += sign * t * egfr
+
+    def slope(self, patient_id: str) -> float:
+        with self._lock:
+            s = self._sums.get(patient_id)
+            if not s or s["n"] < 2:
+                return float("nan")
+            denom = s["n"] * s["tt"] - s["t"] ** 2
+            if denom <= 0:
+                return float("nan")
+            return (s["n"] * s["ty"] - s["t"] * s["y"]) / denom
+
+    def trend(self, patient_id: str) -> str:
+        return slope_to_trend(self.slope(patient_id))
+
+
+# --- Single patient: stage and trend with the new lab folded into the cache ---
+def derive_stage_and_trend(cache: EGFRTrendCache, patient_id: str, creatinine: float, age: float,
+                           sex: str, lab_date=None) -> dict:
+    egfr = float(compute_egfr(creatinine, age, sex))
+    stage = str(egfr_to_stage(egfr))
+    if patient_id:
+        cache.add(patient_id, lab_date or date.today(), egfr)
+        trend = cache.trend(patient_id)
+    else:
+        trend = "N/A"
+    return {"egfr": round(egfr, 1), "ckd_stage": stage, "kidney_trend": trend}
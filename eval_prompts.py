@@ -0,0 +1,95 @@
+import argparse
+import os
+import re
+import statistics
+import time
+from avs_prompt import build_prompt
+from avs_sections import SECTION_HEADINGS, build_json_prompt, generate_sections
+from bench_providers import SAMPLE_INPUTS
+from consistency_check import check_summary
+from providers import make_provider
+from visit_history import VisitHistory
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+# tiktoken gives exact counts for OpenAI models; without it, words plus punctuation is a close proxy
+def make_token_counter(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        return "approx", lambda text: len(_WORD_RE.findall(text))
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return "tiktoken", lambda text: len(encoding.encode(text))
+
+
+def load_inputs(history_path: str, limit: int) -> list:
+    if not history_path:
+        return list(SAMPLE_INPUTS)
+    history = VisitHistory(history_path)
+    visits = history.iter_visits_between("0000-01-01", "9999-12-31")
+    return [visit["inputs"] for _, visit in zip(range(limit), visits)]
+
+
+# --- Input tokens per request, as actually sent (JSON-mode suffix included) ---
+def compare_tokens(corpora: list, count) -> dict:
+    totals = {}
+    for compact in (False, True):
+        counts = [count(build_json_prompt(build_prompt(inputs, compact=compact))) for inputs in corpora]
+        totals["compact" if compact else "verbose"] = counts
+    return totals
+
+
+# --- Latency, heading coverage and consistency per prompt mode against a live provider ---
+def evaluate_provider(provider, corpora: list) -> dict:
+    results = {}
+    for compact in (False, True):
+        latencies, covered, mismatched = [], 0, 0
+        for inputs in corpora:
+            prompt = build_prompt(inputs, compact=compact)
+            start = time.perf_counter()
+            sections = generate_sections(prompt, lambda p: provider.generate(p, json_mode=True))
+            latencies.append(time.perf_counter() - start)
+            if sections and all(sections.get(h, "").strip() for h in SECTION_HEADINGS):
+                covered += 1
+                mismatched += bool(check_summary(sections, inputs))
+        results["compact" if compact else "verbose"] = {"latencies": latencies, "covered": covered,
+                                                        "mismatched": mismatched}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the verbose and compact structured prompts.")
+    parser.add_argument("--providers", default="", help="comma-separated: local, openai, gemini (omit for tokens only)")
+    parser.add_argument("--model", default="gpt-4")
+    parser.add_argument("--model-path", default=os.environ.get("LOCAL_MODEL_PATH", ""))
+    parser.add_argument("--history", default="", help="visit history database to draw real inputs from")
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    corpora = load_inputs(args.history, args.limit)
+    counter_name, count = make_token_counter(args.model)
+    tokens = compare_tokens(corpora, count)
+    verbose, compact = sum(tokens["verbose"]), sum(tokens["compact"])
+    print(f"input tokens ({counter_name}, n={len(corpora)}): verbose mean={verbose / len(corpora):.0f}  "
+          f"compact mean={compact / len(corpora):.0f}  reduction={1 - compact / verbose:.1%}")
+
+    for name in filter(None, args.providers.split(",")):
+        if name == "local":
+            provider = make_provider("local", model_path=args.model_path)
+        elif name == "openai":
+            provider = make_provider("openai", api_key=os.environ["OPENAI_API_KEY"], model=args.model)
+        else:
+            provider = make_provider("gemini", api_key=os.environ["GEMINI_API_KEY"])
+        for mode, result in evaluate_provider(provider, corpora).items():
+            latencies = sorted(result["latencies"])
+            p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+            print(f"{name:8s} {mode:8s} p50={statistics.median(latencies):6.2f}s  p95={p95:6.2f}s  "
+                  f"all headings={result['covered']}/{len(corpora)}  consistency mismatches={result['mismatched']}")
+
+
+if __name__ == "__main__":
+    main()
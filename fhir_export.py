@@ -0,0 +1,99 @@
+import argparse
+import base64
+import hashlib
+import json
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from avs_config import load_config
+from avs_pdf import generate_pdf
+from visit_history import VisitHistory
+
+# LOINC "Summary of episode note" with the AVS title shown in EHR document lists
+DOCUMENT_TYPE = {"coding": [{"system": "http://loinc.org", "code": "34133-9",
+                             "display": "Summary of episode note"}], "text": "After Visit Summary"}
+DOCUMENT_CATEGORY = {"coding": [{"system": "http://hl7.org/fhir/us/core/CodeSystem/us-core-documentreference-category",
+                                 "code": "clinical-note", "display": "Clinical Note"}]}
+# Encoding threads; a visit takes well under a millisecond (stored PDF) or a few (re-rendered),
+# so a few threads keep the output flowing while the next rows are read from SQLite
+DEFAULT_WORKERS = 4
+# Visits being encoded at once per worker; bounds memory to a few PDFs per thread
+IN_FLIGHT_PER_WORKER = 4
+
+
+def _attachment(content_type: str, data: bytes, title: str, created: str) -> dict:
+    return {"contentType": content_type, "data": base64.b64encode(data).decode("ascii"), "size": len(data),
+            "hash": base64.b64encode(hashlib.sha1(data).digest()).decode("ascii"), "title": title,
+            "creation": created}
+
+
+# --- One stored visit as an NDJSON line (runs on a pool thread) ---
+# Visits saved without a PDF are rendered from their summary text, as the ZIP export does.
+def document_reference(visit: dict, organization: str) -> str:
+    created = visit["created_at"].replace(" ", "T") + "Z"
+    pdf = visit.get("pdf") or generate_pdf(visit["summary"]).getvalue()
+    title = f"AVS_{visit['patient_id']}_{visit['visit_date']}"
+    resource = {
+        "resourceType": "DocumentReference",
+        "id": f"avs-{visit['id']}",
+        "status": "current",
+        "docStatus": "final",
+        "type": DOCUMENT_TYPE,
+        "category": [DOCUMENT_CATEGORY],
+        "subject": {"reference": f"Patient/{visit['patient_id']}"},
+        "date": created,
+        "author": [{"display": organization}],
+        "description": "After Visit Summary",
+        "content": [
+            {"attachment": _attachment("application/pdf", pdf, title + ".pdf", created)},
+            {"attachment": _attachment("text/plain; charset=utf-8", visit["summary"].encode("utf-8"),
+                                       title + ".txt", created)},
+        ],
+        "context": {"period": {"start": visit["visit_date"], "end": visit["visit_date"]}},
+    }
+    return json.dumps(resource, separators=(",", ":"), ensure_ascii=False)
+
+
+# --- Generator pipeline: stored visits -> pool threads -> ordered NDJSON lines ---
+# Threads, not processes: the export runs inside the multithreaded Streamlit server, where
+# forking is unsafe, and shipping each PDF to another process costs more than encoding it.
+# At most workers * IN_FLIGHT_PER_WORKER visits are held at a time, whatever the date range.
+def iter_document_references(visits, workers: int = DEFAULT_WORKERS, organization: str = None):
+    organization = organization or load_config().clinic_name
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="avs-fhir") as pool:
+        pending = deque()
+        for visit in visits:
+            pending.append(pool.submit(document_reference, visit, organization))
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def export_ndjson(history: VisitHistory, start_date: str, end_date: str, target,
+                  workers: int = DEFAULT_WORKERS) -> int:
+    count = 0
+    visits = history.iter_visits_between(start_date, end_date, include_pdf=True)
+    for line in iter_document_references(visits, workers):
+        target.write(line.encode("utf-8") + b"\n")
+        count += 1
+    return count
+
+
+# --- CLI, e.g. nightly: python fhir_export.py --start 2024-05-01 --output avs_2024-05-01.ndjson ---
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export stored AVS documents as FHIR DocumentReference NDJSON")
+    parser.add_argument("--start", default=date.today().isoformat())
+    parser.add_argument("--end", default=None, help="defaults to --start")
+    parser.add_argument("--output", default="-", help="file to write, or - for stdout")
+    parser.add_argument("--history", default=None, help="visit history database")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="encoding threads")
+    args = parser.parse_args()
+    history = VisitHistory(args.history) if args.history else VisitHistory()
+    if args.output == "-":
+        count = export_ndjson(history, args.start, args.end or args.start, sys.stdout.buffer, args.workers)
+    else:
+        with open(args.output, "wb") as target:
+            count = export_ndjson(history, args.start, args.end or args.start, target, args.workers)
+    print(f"Exported {count} DocumentReference resources", file=sys.stderr)
@@ -0,0 +1,218 @@
+import re
+import sys
+import time
+from input_validation import parse_a1c, parse_bp
+
+# --- Defaults match what the structured sidebar produces when nothing is selected ---
+DEFAULT_INPUTS = {
+    "ckd_stage": "N/A",
+    "kidney_trend": "N/A",
+    "proteinuria_status": "None",
+    "bp_status": "None",
+    "bp_reading": "At Goal",
+    "diabetes_status": "None",
+    "a1c_level": "",
+    "anemia_included": False,
+    "hemoglobin_status": "Not Reviewed",
+    "iron_status": "Not Reviewed",
+    "electrolyte_included": False,
+    "potassium_status": "Not Reviewed",
+    "bicarbonate_status": "Not Reviewed",
+    "sodium_status": "Not Reviewed",
+    "bone_included": False,
+    "pth_status": "Not Reviewed",
+    "vitamin_d_status": "Not Reviewed",
+    "calcium_status": "Not Reviewed",
+    "med_change": "No",
+    "med_change_types": [],
+    "additional_comments": "",
+}
+
+_STAGES = {"1": "I", "i": "I", "2": "II", "ii": "II", "3a": "IIIa", "iiia": "IIIa", "3b": "IIIb", "iiib": "IIIb",
+           "4": "IV", "iv": "IV", "5": "V", "v": "V"}
+# Bare "stage 3" does not say IIIa or IIIb, so it is left for the clinician rather than guessed
+_AMBIGUOUS_STAGES = {"3", "iii"}
+
+# Lab name -> (status field, group flag)
+_LABS = {
+    "hemoglobin": ("hemoglobin_status", "anemia_included"),
+    "hgb": ("hemoglobin_status", "anemia_included"),
+    "hb": ("hemoglobin_status", "anemia_included"),
+    "iron": ("iron_status", "anemia_included"),
+    "tsat": ("iron_status", "anemia_included"),
+    "ferritin": ("iron_status", "anemia_included"),
+    "potassium": ("potassium_status", "electrolyte_included"),
+    "k": ("potassium_status", "electrolyte_included"),
+    "bicarbonate": ("bicarbonate_status", "electrolyte_included"),
+    "bicarb": ("bicarbonate_status", "electrolyte_included"),
+    "co2": ("bicarbonate_status", "electrolyte_included"),
+    "sodium": ("sodium_status", "electrolyte_included"),
+    "na": ("sodium_status", "electrolyte_included"),
+    "pth": ("pth_status", "bone_included"),
+    "vitamin d": ("vitamin_d_status", "bone_included"),
+    "vit d": ("vitamin_d_status", "bone_included"),
+    "calcium": ("calcium_status", "bone_included"),
+    "ca": ("calcium_status", "bone_included"),
+}
+_LAB_GROUPS = {
+    "anemia_included": ["hemoglobin_status", "iron_status"],
+    "electrolyte_included": ["potassium_status", "bicarbonate_status", "sodium_status"],
+    "bone_included": ["pth_status", "vitamin_d_status", "calcium_status"],
+}
+_LEVELS = {"low": "Low", "decreased": "Low", "deficient": "Low", "normal": "Normal", "ok": "Normal",
+           "stable": "Normal", "high": "High", "elevated": "High", "increased": "High"}
+
+# Medication keyword -> sidebar medication category
+_MEDS = [
+    (r"potassium binder|lokelma|veltassa|patiromer|kayexalate|sodium zirconium", "Potassium Binder"),
+    (r"\besa\b|epo\b|epoetin|aranesp|darbepoetin|retacrit", "ESA Therapy"),
+    (r"iron supplement|ferrous|iv iron|venofer|injectafer|ferric", "Iron Supplement"),
+    (r"vitamin d supplement|ergocalciferol|cholecalciferol|calcitriol|vitamin d3", "Vitamin D Supplement"),
+    (r"bicarbonate supplement|sodium bicarb(?:onate)? tab|baking soda tab", "Bicarbonate Supplement"),
+    (r"diuretic|furosemide|lasix|torsemide|bumetanide|chlorthalidone|hctz|hydrochlorothiazide", "Diuretic"),
+    (r"insulin|metformin|glipizide|jardiance|empagliflozin|farxiga|dapagliflozin|ozempic|semaglutide|trulicity",
+     "Diabetes Medication"),
+    (r"lisinopril|losartan|amlodipine|valsartan|carvedilol|metoprolol|hydralazine|irbesartan|bp med(?:ication)?s?",
+     "BP Medication"),
+]
+
+_STAGE_RE = re.compile(r"\b(?:ckd|stage)\s*(?:stage\s*)?(3a|3b|[1-5]|iiia|iiib|iv|v|iii|ii|i)\b", re.I)
+_TREND_RE = re.compile(
+    r"\b(?:kidney function|renal function|gfr|egfr|creatinine|kidney)\b[^.;\n]{0,30}?\b(stable|worsening|declining|"
+    r"improving|improved|worse|better)\b|\b(stable|worsening|declining|improving)\b[^.;\n]{0,20}?"
+    r"\b(?:kidney|renal) function\b", re.I)
+_PROTEINURIA_RE = re.compile(
+    r"\bproteinuria\b[^.;\n]{0,20}?\b(improving|improved|worsening|worse|not present|absent|none|resolved)\b|"
+    r"\bno proteinuria\b", re.I)
+# A reading needs a BP word before it or mmHg after it; bare "12/10" is usually a date
+_BP_RE = re.compile(r"\b(?:bp|blood pressure)\b[^0-9\n]{0,15}?\b(\d{2,3})\s*/\s*(\d{2,3})\b|"
+                    r"\b(\d{2,3})\s*/\s*(\d{2,3})\s*mm\s*hg\b", re.I)
+_BP_GOAL_RE = re.compile(r"\b(?:bp|blood pressure)\b[^.;\n]{0,20}?\b(at goal|controlled|well controlled|"
+                         r"above goal|uncontrolled|elevated|high)\b", re.I)
+# The value and unit go to input_validation.parse_a1c, so a bare number above 20 reads as mmol/mol there too;
+# "3 months" after the phrase is a time span, not the value
+_A1C_RE = re.compile(r"\b(?:a1c|hba1c|hemoglobin a1c)\b\D{0,12}?(\d{1,3}(?:\.\d{1,2})?(?:\s*(?:%|mmol\s*/\s*mol))?)"
+                     r"(?!\d|\.\d|\s*(?:months?|weeks?|days?|years?)\b)", re.I)
+_DM_RE = re.compile(r"\b(?:diabetes|dm|blood sugars?|glucose)\b[^.;\n]{0,20}?\b(well controlled|controlled|"
+                    r"uncontrolled|poorly controlled)\b", re.I)
+_LAB_RE = re.compile(
+    r"\b(" + "|".join(sorted((re.escape(name) for name in _LABS), key=len, reverse=True)) + r")\b"
+    r"\s*(?:is|was|are|were|level|levels|:)?\s*(?:\d+(?:\.\d+)?\s*(?:g/dl|mmol/l|meq/l|mg/dl|pg/ml|ng/ml|%)?,?\s*)?"
+    r"(?:is |was |which is )?(?:mildly |slightly |very )?"
+    r"\b(" + "|".join(_LEVELS) + r")\b", re.I)
+_MED_VERB_RE = re.compile(r"\b(start|started|starting|increase|increased|decrease|decreased|stop|stopped|"
+                          r"discontinue|discontinued|add|added|switch|switched|adjust|adjusted|change|changed|"
+                          r"hold|held|reduce|reduced|begin|began|initiate|initiated)\b", re.I)
+# "No change in lisinopril", "not increasing", "continue losartan" and "lasix unchanged" are not changes
+_MED_NEGATION_RE = re.compile(r"\b(?:no|not|without|unchanged|continue|continued|continuing|don't|didn't)\b", re.I)
+_MED_RES = [(re.compile(pattern, re.I), category) for pattern, category in _MEDS]
+_SENTENCE_RE = re.compile(r"[^.;\n]+")
+# Clauses within a sentence, so "start lasix, continue lisinopril" keeps only the start
+_CLAUSE_RE = re.compile(r"[^,]+?(?=,|\bbut\b|\band\b|$)", re.I)
+
+# A systolic at or above 130, or diastolic at or above 80, reads as above goal for CKD
+BP_GOAL = (130, 80)
+A1C_GOAL = 7.0
+
+
+# --- Extract structured inputs from dictated/typed text ---
+# Returns the inputs dict that build_prompt consumes plus the list of fields actually found.
+def extract_inputs(text: str) -> tuple:
+    inputs = dict(DEFAULT_INPUTS, med_change_types=[])
+    found = []
+
+    match = _STAGE_RE.search(text)
+    if match and match.group(1).lower() not in _AMBIGUOUS_STAGES:
+        inputs["ckd_stage"] = _STAGES[match.group(1).lower()]
+        found.append("ckd_stage")
+
+    match = _TREND_RE.search(text)
+    if match:
+        word = (match.group(1) or match.group(2)).lower()
+        inputs["kidney_trend"] = ("Worsening" if word in ("worsening", "declining", "worse")
+                                  else "Improving" if word in ("improving", "improved", "better") else "Stable")
+        found.append("kidney_trend")
+
+    match = _PROTEINURIA_RE.search(text)
+    if match:
+        word = (match.group(1) or "none").lower()
+        inputs["proteinuria_status"] = ("Improving" if word.startswith("improv") or word == "resolved"
+                                        else "Worsening" if word.startswith("wors") else "Not Present")
+        found.append("proteinuria_status")
+
+    for match in _BP_RE.finditer(text):
+        systolic, diastolic = (int(v) for v in (match.group(1, 2) if match.group(1) else match.group(3, 4)))
+        reading, error = parse_bp(f"{systolic}/{diastolic}")
+        if not error:
+            above = systolic >= BP_GOAL[0] or diastolic >= BP_GOAL[1]
+            inputs["bp_status"] = "Above Goal" if above else "At Goal"
+            inputs["bp_reading"] = reading if above else "At Goal"
+            found += ["bp_status", "bp_reading"]
+            break
+    if "bp_status" not in found:
+        match = _BP_GOAL_RE.search(text)
+        if match:
+            word = match.group(1).lower()
+            inputs["bp_status"] = "At Goal" if word in ("at goal", "controlled", "well controlled") else "Above Goal"
+            found.append("bp_status")
+
+    match = _A1C_RE.search(text)
+    if match:
+        reading, error = parse_a1c(match.group(1))
+        if not error:
+            uncontrolled = float(reading.rstrip("%")) >= A1C_GOAL
+            inputs["diabetes_status"] = "Uncontrolled" if uncontrolled else "Controlled"
+            inputs["a1c_level"] = reading if uncontrolled else ""
+            found += ["diabetes_status", "a1c_level"]
+    if "diabetes_status" not in found:
+        match = _DM_RE.search(text)
+        if match:
+            word = match.group(1).lower()
+            inputs["diabetes_status"] = "Controlled" if word in ("controlled", "well controlled") else "Uncontrolled"
+            found.append("diabetes_status")
+
+    for match in _LAB_RE.finditer(text):
+        field, group = _LABS[match.group(1).lower()]
+        if not inputs[group]:
+            inputs[group] = True
+            for other in _LAB_GROUPS[group]:
+                inputs[other] = "Not Provided"
+        inputs[field] = _LEVELS[match.group(2).lower()]
+        found.append(field)
+
+    for sentence in _SENTENCE_RE.findall(text):
+        for clause in _CLAUSE_RE.findall(sentence):
+            if not _MED_VERB_RE.search(clause) or _MED_NEGATION_RE.search(clause):
+                continue
+            for pattern, category in _MED_RES:
+                if pattern.search(clause) and category not in inputs["med_change_types"]:
+                    inputs["med_change_types"].append(category)
+    if inputs["med_change_types"]:
+        inputs["med_change"] = "Yes"
+        found.append("med_change_types")
+
+    # The original wording always travels with the structured fields
+    inputs["additional_comments"] = text.strip()
+    return inputs, found
+
+
+# --- Enough was recognised to use the structured prompt instead of the raw text ---
+def is_structured_enough(found: list) -> bool:
+    return "ckd_stage" in found
+
+
+# --- Extraction throughput in lines/sec over a corpus of free-text commands ---
+def measure_throughput(lines: list, repeat: int = 1) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for line in lines:
+            extract_inputs(line)
+    elapsed = time.perf_counter() - start
+    return len(lines) * repeat / elapsed if elapsed else float("inf")
+
+
+if __name__ == "__main__":
+    # Usage: python freetext_parse.py commands.txt  (one free-text command per line)
+    with open(sys.argv[1], encoding="utf-8") as f:
+        corpus = [line for line in f if line.strip()]
+    print(f"{measure_throughput(corpus, repeat=5):,.0f} lines/sec over {len(corpus)} lines")
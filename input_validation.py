@@ -0,0 +1,63 @@
+import re
+
+# --- Plausible ranges for clinic entry (outside these is almost always a typo) ---
+SYSTOLIC_RANGE = (60, 260)
+DIASTOLIC_RANGE = (30, 160)
+A1C_PERCENT_RANGE = (4.0, 20.0)
+A1C_MMOL_MOL_RANGE = (20.0, 195.0)
+
+_BP_RE = re.compile(r"(?:bp|blood pressure)?\s*:?\s*(\d{2,3})\s*(?:/|\\|-|over)\s*(\d{2,3})\s*(?:mm\s*hg)?", re.I)
+_A1C_RE = re.compile(r"(?:(?:hb)?a1c)?\s*:?\s*(\d{1,3}(?:\.\d{1,2})?)\s*(%|mmol\s*/\s*mol)?", re.I)
+
+
+# IFCC mmol/mol to NGSP %, the master equation used by labs
+def mmol_mol_to_percent(value: float) -> float:
+    return round(value / 10.929 + 2.15, 1)
+
+
+# Canonical forms, so equal readings always produce the same prompt (and cache key)
+def format_bp(systolic: int, diastolic: int) -> str:
+    return f"{systolic}/{diastolic}"
+
+
+def format_a1c(percent: float) -> str:
+    return f"{percent:.1f}%"
+
+
+# --- Parsers: return (canonical value, error message); blank input is ("", None) ---
+def parse_bp(text: str) -> tuple:
+    text = (text or "").strip()
+    if not text:
+        return "", None
+    match = _BP_RE.fullmatch(text)
+    if not match:
+        if re.fullmatch(r"\d{5,6}", text):
+            return None, f"'{text}' is missing the slash; enter it as {text[:3]}/{text[3:]} if that is the reading."
+        return None, f"'{text}' is not a BP reading; enter systolic/diastolic, e.g. 150/90."
+    systolic, diastolic = int(match.group(1)), int(match.group(2))
+    if not SYSTOLIC_RANGE[0] <= systolic <= SYSTOLIC_RANGE[1]:
+        return None, f"Systolic {systolic} is outside {SYSTOLIC_RANGE[0]}-{SYSTOLIC_RANGE[1]} mmHg."
+    if not DIASTOLIC_RANGE[0] <= diastolic <= DIASTOLIC_RANGE[1]:
+        return None, f"Diastolic {diastolic} is outside {DIASTOLIC_RANGE[0]}-{DIASTOLIC_RANGE[1]} mmHg."
+    if systolic <= diastolic:
+        return None, f"Systolic {systolic} must be higher than diastolic {diastolic}."
+    return format_bp(systolic, diastolic), None
+
+
+def parse_a1c(text: str) -> tuple:
+    text = (text or "").strip()
+    if not text:
+        return "", None
+    match = _A1C_RE.fullmatch(text)
+    if not match:
+        return None, f"'{text}' is not an A1c value; enter a number such as 8.2 (%) or 66 mmol/mol."
+    value = float(match.group(1))
+    # Values past the % range are read as IFCC mmol/mol, which is what those numbers mean on a report
+    unit = (match.group(2) or "").lower()
+    if unit.startswith("mmol") or (not unit and value > A1C_PERCENT_RANGE[1]):
+        if not A1C_MMOL_MOL_RANGE[0] <= value <= A1C_MMOL_MOL_RANGE[1]:
+            return None, f"A1c {value:g} mmol/mol is outside {A1C_MMOL_MOL_RANGE[0]:g}-{A1C_MMOL_MOL_RANGE[1]:g}."
+        value = mmol_mol_to_percent(value)
+    if not A1C_PERCENT_RANGE[0] <= value <= A1C_PERCENT_RANGE[1]:
+        return None, f"A1c {value:g}% is outside {A1C_PERCENT_RANGE[0]:g}-{A1C_PERCENT_RANGE[1]:g}%."
+    return format_a1c(value), None
@@ -0,0 +1,239 @@
+import json
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+DEFAULT_DB_PATH = "avs_jobs.db"
+# A running job is owned for this long past its last heartbeat; then any process may requeue it
+LEASE_SECONDS = 60.0
+# A session link opens its jobs for this long after it was issued (about a clinic day)
+SESSION_TTL_SECONDS = 10 * 3600
+# Finished jobs (payloads, summaries, PDFs) are deleted this long after they finish; the
+# saved visit history keeps its own copy
+RETENTION_SECONDS = 24 * 3600
+
+# --- Job states ---
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    state TEXT NOT NULL,
+    progress TEXT NOT NULL DEFAULT '',
+    payload TEXT NOT NULL,
+    result TEXT,
+    pdf BLOB,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_state_created ON jobs (state, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_session_created ON jobs (session_id, created_at);
+CREATE TABLE IF NOT EXISTS sessions (
+    token TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+# --- Durable Local Job Queue ---
+# Every generation is a row that survives reruns, disconnects and restarts. Worker threads
+# claim queued jobs, run the handler registered for the job's kind, and persist the result
+# and rendered PDF. A handler takes (payload, report_progress) and returns (result, pdf_bytes).
+# Several processes may share one database: a job is claimed with a conditional UPDATE and
+# held under a lease that the owning process renews, so only abandoned jobs are run again.
+# Jobs are reattached by an unguessable session token that expires, and finished jobs are
+# purged after `retention_seconds`, so an old link from browser history opens nothing.
+class JobQueue:
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, workers: int = 4, background_workers: int = 1,
+                 poll_seconds: float = 0.2, session_ttl_seconds: float = SESSION_TTL_SECONDS,
+                 retention_seconds: float = RETENTION_SECONDS):
+        self.db_path = db_path
+        self.poll_seconds = poll_seconds
+        self.session_ttl_seconds = session_ttl_seconds
+        self.retention_seconds = retention_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._handlers = {}
+        self._background_kinds = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        # Databases created before leases existed gain the ownership columns
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, kind in (("owner", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {kind}")
+        self._conn.commit()
+        self._requeue_expired()
+        self._purge()
+        for i in range(workers):
+            threading.Thread(target=self._work, args=(False,), name=f"avs-job-worker-{i}", daemon=True).start()
+        for i in range(background_workers):
+            threading.Thread(target=self._work, args=(True,), name=f"avs-job-background-{i}", daemon=True).start()
+        threading.Thread(target=self._heartbeat, name="avs-job-heartbeat", daemon=True).start()
+
+    # Background kinds (long maintenance runs) get their own workers and never hold an interactive one
+    def register(self, kind: str, handler, background: bool = False):
+        self._handlers[kind] = handler
+        if background:
+            self._background_kinds.add(kind)
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    # --- Session tokens: the only handle that reattaches a browser to its jobs ---
+    def new_session(self) -> str:
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            self._conn.execute("INSERT INTO sessions (token, expires_at) VALUES (?, ?)",
+                               (token, time.time() + self.session_ttl_seconds))
+            self._conn.commit()
+        return token
+
+    def session_valid(self, token: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT expires_at FROM sessions WHERE token = ?", (token,)).fetchone()
+        return row is not None and row["expires_at"] > time.time()
+
+    # --- Submitting and inspecting jobs ---
+    def submit(self, kind: str, session_id: str, payload: dict) -> str:
+        job_id = uuid.uuid4().hex
+        with self._wakeup:
+            self._conn.execute(
+                "INSERT INTO jobs (id, session_id, kind, state, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, session_id, kind, QUEUED, json.dumps(payload), time.time()),
+            )
+            self._conn.commit()
+            # Interactive and background workers wait on the same condition
+            self._wakeup.notify_all()
+        return job_id
+
+    def get(self, job_id: str, include_pdf: bool = True) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row, include_pdf) if row else None
+
+    def wait(self, job_id: str, timeout: float = 180.0) -> dict:
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id, include_pdf=False)
+            if job is None or job["state"] in FINISHED_STATES or time.monotonic() >= deadline:
+                return self.get(job_id) if job else None
+            time.sleep(self.poll_seconds)
+
+    def jobs_for_session(self, session_id: str, limit: int = 20) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM jobs WHERE session_id = ? ORDER BY created_at DESC LIMIT ?", (session_id, limit)
+            ).fetchall()
+        return [_row_to_job(row, include_pdf=False) for row in rows]
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    # --- Worker side ---
+    # Running jobs whose owner stopped renewing the lease (crashed or restarted) go back in the queue
+    def _requeue_expired(self):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET state = ?, owner = NULL, lease_until = NULL, started_at = NULL "
+                "WHERE state = ? AND (lease_until IS NULL OR lease_until < ?)",
+                (QUEUED, RUNNING, time.time()),
+            )
+            self._conn.commit()
+
+    # Finished jobs past retention and expired session tokens are deleted
+    def _purge(self):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                f"DELETE FROM jobs WHERE state IN ({','.join('?' * len(FINISHED_STATES))}) AND finished_at < ?",
+                (*FINISHED_STATES, now - self.retention_seconds),
+            )
+            self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+            self._conn.commit()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(LEASE_SECONDS / 3)
+            with self._lock:
+                self._conn.execute("UPDATE jobs SET lease_until = ? WHERE owner = ? AND state = ?",
+                                   (time.time() + LEASE_SECONDS, self.owner, RUNNING))
+                self._conn.commit()
+            self._requeue_expired()
+            self._purge()
+
+    def _claim(self, background: bool) -> sqlite3.Row:
+        with self._wakeup:
+            while True:
+                kinds = [kind for kind in self._handlers if (kind in self._background_kinds) == background]
+                if kinds:
+                    row = self._conn.execute(
+                        f"SELECT id FROM jobs WHERE state = ? AND kind IN ({','.join('?' * len(kinds))}) "
+                        "ORDER BY created_at LIMIT 1",
+                        [QUEUED, *kinds],
+                    ).fetchone()
+                    if row:
+                        # Another process may have taken it since the SELECT; the state check decides
+                        now = time.time()
+                        claimed = self._conn.execute(
+                            "UPDATE jobs SET state = ?, owner = ?, lease_until = ?, started_at = ? "
+                            "WHERE id = ? AND state = ?",
+                            (RUNNING, self.owner, now + LEASE_SECONDS, now, row["id"], QUEUED),
+                        ).rowcount
+                        self._conn.commit()
+                        if claimed:
+                            return self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                        continue
+                self._wakeup.wait(timeout=self.poll_seconds * 10)
+
+    def _set_progress(self, job_id: str, message: str):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET progress = ? WHERE id = ? AND owner = ?",
+                               (message, job_id, self.owner))
+            self._conn.commit()
+
+    def _work(self, background: bool):
+        while True:
+            row = self._claim(background)
+            handler = self._handlers[row["kind"]]
+            try:
+                result, pdf_bytes = handler(json.loads(row["payload"]),
+                                            lambda message: self._set_progress(row["id"], message))
+                update = (SUCCEEDED, json.dumps(result), pdf_bytes, None)
+            except Exception as e:
+                update = (FAILED, None, None, f"{type(e).__name__}: {e}")
+            # A job whose lease lapsed has been handed to another worker; that run's result wins
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE jobs SET state = ?, result = ?, pdf = ?, error = ?, finished_at = ?, lease_until = NULL "
+                    "WHERE id = ? AND owner = ?",
+                    (*update, time.time(), row["id"], self.owner),
+                )
+                self._conn.commit()
+
+
+def _row_to_job(row: sqlite3.Row, include_pdf: bool) -> dict:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    if not include_pdf:
+        job.pop("pdf", None)
+    return job
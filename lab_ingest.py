@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+CKD_STAGES = ["I", "II", "IIIa", "IIIb", "IV", "V"]
+
+# --- Numeric lab column -> status field consumed by build_prompt ---
+LAB_STATUS_FIELDS = {
+    "hemoglobin": "hemoglobin_status",    # g/dL
+    "iron": "iron_status",                # transferrin saturation, %
+    "potassium": "potassium_status",      # mmol/L
+    "bicarbonate": "bicarbonate_status",  # mmol/L
+    "sodium": "sodium_status",            # mmol/L
+    "pth": "pth_status",                  # intact PTH, pg/mL
+    "vitamin_d": "vitamin_d_status",      # 25-OH vitamin D, ng/mL
+    "calcium": "calcium_status",          # mg/dL
+}
+
+# --- Lab group -> "*_included" flag and its analytes ---
+LAB_GROUPS = {
+    "anemia_included": ["hemoglobin", "iron"],
+    "electrolyte_included": ["potassium", "bicarbonate", "sodium"],
+    "bone_included": ["pth", "vitamin_d", "calcium"],
+}
+
+# --- Reference ranges (low, high) per CKD stage; "default" covers unknown/N/A stage ---
+# PTH uses the KDOQI stage targets and potassium tolerates a slightly higher ceiling in
+# advanced CKD. Hemoglobin keeps the lab normal range at every stage: the 10-11.5 g/dL
+# figure in CKD anemia guidance is an ESA dosing ceiling, not a normal range, so an
+# untreated 13 g/dL is Normal.
+REFERENCE_RANGES = {
+    "hemoglobin": {"default": (12.0, 16.0)},
+    "iron": {"default": (20.0, 50.0)},
+    "potassium": {"default": (3.5, 5.0), "IV": (3.5, 5.5), "V": (3.5, 5.5)},
+    "bicarbonate": {"default": (22.0, 29.0)},
+    "sodium": {"default": (135.0, 145.0)},
+    "pth": {"default": (15.0, 65.0), "IIIa": (35.0, 70.0), "IIIb": (35.0, 70.0), "IV": (70.0, 110.0),
+            "V": (150.0, 600.0)},
+    "vitamin_d": {"default": (30.0, 100.0)},
+    "calcium": {"default": (8.5, 10.2)},
+}
+
+_STAGE_INDEX = {stage: i + 1 for i, stage in enumerate(CKD_STAGES)}  # 0 is "default"
+
+
+# Per analyte, a (len(CKD_STAGES) + 1, 2) table so a stage code indexes straight into it
+def _range_tables() -> dict:
+    tables = {}
+    for analyte, ranges in REFERENCE_RANGES.items():
+        table = np.empty((len(CKD_STAGES) + 1, 2))
+        table[0] = ranges["default"]
+        for stage, i in _STAGE_INDEX.items():
+            table[i] = ranges.get(stage, ranges["default"])
+        tables[analyte] = table
+    return tables
+
+
+_RANGE_TABLES = _range_tables()
+
+
+# --- Vectorized classification of a whole panel export ---
+# `df` has a "ckd_stage" column plus any of the numeric lab columns. Returns a copy
+# with the *_status and *_included fields that build_prompt expects.
+def classify_labs(df: pd.DataFrame) -> pd.DataFrame:
+    out = df.copy()
+    stages = out["ckd_stage"] if "ckd_stage" in out else pd.Series("N/A", index=out.index)
+    stage_codes = stages.map(_STAGE_INDEX).fillna(0).to_numpy(dtype=np.intp)
+
+    numeric = {
+        analyte: pd.to_numeric(out[analyte], errors="coerce").to_numpy(dtype=float)
+        for analyte in LAB_STATUS_FIELDS if analyte in out
+    }
+    statuses = {}
+    for analyte, field in LAB_STATUS_FIELDS.items():
+        if analyte not in numeric:
+            statuses[field] = np.full(len(out), "Not Provided", dtype=object)
+            continue
+        values = numeric[analyte]
+        bounds = _RANGE_TABLES[analyte][stage_codes]
+        statuses[field] = np.select(
+            [np.isnan(values), values < bounds[:, 0], values > bounds[:, 1]],
+            ["Not Provided", "Low", "High"],
+            default="Normal",
+        ).astype(object)
+
+    for flag, analytes in LAB_GROUPS.items():
+        included = np.zeros(len(out), dtype=bool)
+        for analyte in analytes:
+            if analyte in numeric:
+                included |= ~np.isnan(numeric[analyte])
+        out[flag] = included
+        # Groups with no values at all read the same as an unticked checkbox in the sidebar
+        for analyte in analytes:
+            field = LAB_STATUS_FIELDS[analyte]
+            statuses[field] = np.where(included, statuses[field], "Not Reviewed")
+    for field, column in statuses.items():
+        out[field] = column
+    return out
+
+
+# --- A clinic's CSV export (one row per patient/panel) ---
+def load_lab_csv(source) -> pd.DataFrame:
+    df = pd.read_csv(source)
+    df.columns = [c.strip().lower().replace(" ", "_") for c in df.columns]
+    return classify_labs(df)
+
+
+# --- A single panel, e.g. from the sidebar; returns the inputs-dict fields ---
+def classify_panel(values: dict, ckd_stage: str) -> dict:
+    row = {"ckd_stage": ckd_stage}
+    row.update({k: (np.nan if v is None else v) for k, v in values.items()})
+    result = classify_labs(pd.DataFrame([row])).iloc[0]
+    fields = list(LAB_STATUS_FIELDS.values()) + list(LAB_GROUPS)
+    return {f: (bool(result[f]) if f in LAB_GROUPS else str(result[f])) for f in fields}
@@ -0,0 +1,89 @@
+EDUCATION_HEADING = "Medication Education:"
+
+# CKD stages grouped the way the education text differs
+STAGE_GROUPS = {"I": "early", "II": "early", "IIIa": "early", "IIIb": "advanced", "IV": "advanced", "V": "advanced"}
+
+# --- Vetted patient-education snippets per medication category and stage group ---
+# "default" is used when there is no stage-specific text (or the stage is N/A).
+MED_EDUCATION = {
+    "BP Medication": {
+        "default": "Your blood pressure medicine was changed. Take it at the same time each day and check your "
+                   "blood pressure at home if you can. Call us if you feel dizzy or light-headed when standing.",
+        "advanced": "Your blood pressure medicine was changed. Take it at the same time each day and check your "
+                    "blood pressure at home if you can. Some blood pressure medicines can raise potassium or "
+                    "change kidney numbers, so keep your next lab appointment. Call us if you feel dizzy.",
+    },
+    "Diabetes Medication": {
+        "default": "Your diabetes medicine was changed. Keep checking your blood sugar and write the numbers down "
+                   "for your next visit. Call us if your sugar is often below 70 or above 300.",
+        "advanced": "Your diabetes medicine was changed. With lower kidney function, some diabetes medicines stay "
+                    "in the body longer, so low blood sugar is more likely. Check your sugar more often for the "
+                    "next two weeks and call us if it is below 70.",
+    },
+    "Diuretic": {
+        "default": "Your water pill (diuretic) was changed. Take it in the morning so you are not up at night. "
+                   "Weigh yourself each morning and call us if you gain more than 3 pounds in a day or 5 pounds "
+                   "in a week, or if you feel very thirsty or dizzy.",
+    },
+    "Potassium Binder": {
+        "default": "You were started on or changed a potassium binder to lower your potassium. Take it at least "
+                   "3 hours apart from your other medicines. Limit high-potassium foods such as bananas, oranges, "
+                   "potatoes and tomatoes. We will recheck your potassium with your next labs.",
+    },
+    "Iron Supplement": {
+        "default": "Your iron supplement was changed. Iron pills work best on an empty stomach but may be taken "
+                   "with food if they upset your stomach. They can cause dark stools and constipation. Take them "
+                   "2 hours apart from phosphate binders or antacids.",
+    },
+    "ESA Therapy": {
+        "default": "Your anemia injection (ESA) was started or changed to help your body make red blood cells. "
+                   "We will check your hemoglobin regularly to adjust the dose. Tell us about any chest pain, "
+                   "new leg swelling, severe headache or high blood pressure readings.",
+    },
+    "Vitamin D Supplement": {
+        "default": "Your vitamin D supplement was changed to support bone health. Take it as directed and do not "
+                   "add extra over-the-counter vitamin D. We will recheck your vitamin D and calcium levels.",
+        "advanced": "Your vitamin D medicine was changed to protect your bones and control PTH. Do not take extra "
+                    "over-the-counter vitamin D or calcium unless we tell you to. We will recheck calcium, "
+                    "phosphorus and PTH with your next labs.",
+    },
+    "Bicarbonate Supplement": {
+        "default": "Your sodium bicarbonate was started or changed to correct acid buildup from your kidneys. "
+                   "Take it as directed, usually with meals. It contains sodium, so tell us if you notice more "
+                   "swelling or higher blood pressure.",
+    },
+}
+
+# Short codes used when the prompt only needs to reference a snippet
+MED_CODES = {category: f"EDU-{i + 1:02d}" for i, category in enumerate(MED_EDUCATION)}
+
+# --- Index built once at import: (category, stage) -> snippet ---
+_INDEX = {
+    (category, stage): texts.get(STAGE_GROUPS.get(stage, "default"), texts["default"])
+    for category, texts in MED_EDUCATION.items()
+    for stage in list(STAGE_GROUPS) + ["N/A"]
+}
+
+
+def education_for(med_change_types: list, ckd_stage: str) -> list:
+    return [_INDEX.get((category, ckd_stage), MED_EDUCATION[category]["default"])
+            for category in med_change_types if category in MED_EDUCATION]
+
+
+# --- Splice the snippets into generated sections as their own block ---
+def splice_education(sections: dict, inputs: dict) -> dict:
+    if inputs.get("med_change") != "Yes" or not inputs.get("med_change_types"):
+        return sections
+    snippets = education_for(inputs["med_change_types"], inputs.get("ckd_stage", "N/A"))
+    if not snippets:
+        return sections
+    return {**sections, EDUCATION_HEADING: "\n".join(f"- {s}" for s in snippets)}
+
+
+# --- Compact reference for the prompt, so the model does not rewrite the education ---
+def prompt_reference(med_change_types: list) -> str:
+    codes = [f"{MED_CODES[c]} ({c})" for c in med_change_types if c in MED_CODES]
+    if not codes:
+        return ""
+    return ("  - Patient education for " + ", ".join(codes)
+            + " is appended from the clinic's library; do not write medication education yourself.")
@@ -0,0 +1,131 @@
+import argparse
+import json
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# --- Local mock of the OpenAI Files + Batches API ---
+# Accepts the same upload/create/poll/download calls as batch_generation.OpenAIBatchClient
+# and answers every request with a canned summary in the requested JSON shape, so the
+# deferred pipeline can run end to end without network access or cost.
+
+_HEADINGS_PATTERN = re.compile(r"exactly these headings: (\[.*?\])\.")
+
+
+def mock_completion(body: dict) -> dict:
+    prompt = body["messages"][-1]["content"]
+    match = _HEADINGS_PATTERN.search(prompt)
+    if match:
+        headings = json.loads(match.group(1))
+        content = json.dumps({h: f"Mock text for {h.split('. ', 1)[-1].rstrip(':')}." for h in headings})
+    else:
+        content = "Mock after visit summary."
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "model": body.get("model", "mock"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+    }
+
+
+class MockBatchServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    # Batches report in_progress until complete_after seconds have passed since creation
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, complete_after: float = 0.0):
+        super().__init__((host, port), _Handler)
+        self.complete_after = complete_after
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockBatchServer":
+        threading.Thread(target=self.serve_forever, name="mock-batch-server", daemon=True).start()
+        return self
+
+    def refresh(self, batch: dict):
+        if batch["status"] != "in_progress" or time.time() - batch["created_at"] < self.complete_after:
+            return
+        output = []
+        for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines():
+            if line.strip():
+                request = json.loads(line)
+                output.append(json.dumps({
+                    "id": f"batch_req_{uuid.uuid4().hex[:12]}",
+                    "custom_id": request["custom_id"],
+                    "response": {"status_code": 200, "body": mock_completion(request["body"])},
+                    "error": None,
+                }))
+        file_id = f"file-{uuid.uuid4().hex[:12]}"
+        self.files[file_id] = ("\n".join(output) + "\n").encode("utf-8")
+        batch.update(status="completed", output_file_id=file_id, completed_at=int(time.time()),
+                     request_counts={"total": len(output), "completed": len(output), "failed": 0})
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/v1/files":
+            message = BytesParser().parsebytes(
+                f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("latin-1") + body)
+            content = next(part.get_payload(decode=True) for part in message.get_payload()
+                           if part.get_param("name", header="content-disposition") == "file")
+            file_id = f"file-{uuid.uuid4().hex[:12]}"
+            with server.lock:
+                server.files[file_id] = content
+            return self._reply(200, {"id": file_id, "object": "file", "purpose": "batch", "bytes": len(content)})
+        if self.path == "/v1/batches":
+            request = json.loads(body)
+            if request.get("input_file_id") not in server.files:
+                return self._reply(404, {"error": {"message": "input file not found"}})
+            batch = {"id": f"batch_{uuid.uuid4().hex[:12]}", "object": "batch", "endpoint": request["endpoint"],
+                     "input_file_id": request["input_file_id"], "status": "in_progress",
+                     "created_at": time.time(), "output_file_id": None, "error_file_id": None}
+            with server.lock:
+                server.batches[batch["id"]] = batch
+            return self._reply(200, batch)
+        self._reply(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            if self.path.startswith("/v1/batches/"):
+                batch = server.batches.get(self.path.rsplit("/", 1)[-1])
+                if batch:
+                    server.refresh(batch)
+                    return self._reply(200, batch)
+            elif self.path.startswith("/v1/files/") and self.path.endswith("/content"):
+                content = server.files.get(self.path.split("/")[3])
+                if content is not None:
+                    return self._reply(200, content)
+        self._reply(404, {"error": {"message": f"not found: {self.path}"}})
+
+    def _reply(self, status: int, payload):
+        data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream" if isinstance(payload, bytes) else "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenAI Batch API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--complete-after", type=float, default=5.0)
+    args = parser.parse_args()
+    server = MockBatchServer(port=args.port, complete_after=args.complete_after)
+    print(f"Mock batch API at {server.url} (set OPENAI_BATCH_API_BASE to use it)")
+    server.serve_forever()
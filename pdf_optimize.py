@@ -0,0 +1,116 @@
+import re
+import struct
+import zlib
+
+# Font name records kept in embedded subsets: copyright (0), family, subfamily, full name,
+# PostScript name, trademark (7) and license (13). The Bitstream Vera/DejaVu license requires
+# its notices to travel with the font; descriptions, URLs and the rest are dropped.
+KEPT_NAME_IDS = {0, 1, 2, 4, 6, 7, 13}
+
+_XREF_RE = re.compile(rb"startxref\s+(\d+)\s+%%EOF\s*$")
+_OBJ_RE = re.compile(rb"(\d+) 0 obj\n")
+_LENGTH_RE = re.compile(rb"/Length (\d+)")
+_LENGTH1_RE = re.compile(rb"/Length1 (\d+)")
+
+
+def _checksum(data: bytes) -> int:
+    data += b"\0" * (-len(data) % 4)
+    return sum(struct.unpack(f">{len(data) // 4}L", data)) & 0xFFFFFFFF
+
+
+def _strip_name_table(table: bytes) -> bytes:
+    _, count, string_offset = struct.unpack(">HHH", table[:6])
+    records, strings = [], b""
+    for i in range(count):
+        platform, encoding, language, name_id, length, offset = struct.unpack(">6H", table[6 + 12 * i:18 + 12 * i])
+        if name_id in KEPT_NAME_IDS:
+            value = table[string_offset + offset:string_offset + offset + length]
+            records.append((platform, encoding, language, name_id, len(value), len(strings)))
+            strings += value
+    header = struct.pack(">HHH", 0, len(records), 6 + 12 * len(records))
+    return header + b"".join(struct.pack(">6H", *r) for r in records) + strings
+
+
+# --- Rewrite a TrueType subset with a minimal name table (table directory and checksums rebuilt) ---
+def strip_font_tables(font: bytes) -> bytes:
+    version, count = struct.unpack(">IH", font[:6])
+    tables = {}
+    for i in range(count):
+        tag, _, offset, length = struct.unpack(">4sIII", font[12 + 16 * i:28 + 16 * i])
+        tables[tag] = font[offset:offset + length]
+    if b"name" in tables:
+        tables[b"name"] = _strip_name_table(tables[b"name"])
+    if b"head" in tables:
+        tables[b"head"] = tables[b"head"][:8] + b"\0\0\0\0" + tables[b"head"][12:]
+    entry_selector = max(1, len(tables)).bit_length() - 1
+    search_range = 16 << entry_selector
+    directory = struct.pack(">IHHHH", version, len(tables), search_range, entry_selector,
+                            16 * len(tables) - search_range)
+    offsets, body = {}, b""
+    for tag in sorted(tables):
+        data = tables[tag]
+        offsets[tag] = 12 + 16 * len(tables) + len(body)
+        directory += struct.pack(">4sIII", tag, _checksum(data), offsets[tag], len(data))
+        body += data + b"\0" * (-len(data) % 4)
+    font = directory + body
+    if b"head" in tables:
+        position = offsets[b"head"] + 8
+        adjustment = (0xB1B0AFBA - _checksum(font)) & 0xFFFFFFFF
+        font = font[:position] + struct.pack(">I", adjustment) + font[position + 4:]
+    return font
+
+
+def _optimize_stream(header: bytes, data: bytes, level: int) -> tuple:
+    if b"/Filter" in header and b"/Filter /FlateDecode" not in header:
+        return header, data
+    raw = zlib.decompress(data) if b"/FlateDecode" in header else data
+    font = b"/Length1" in header
+    if font:
+        raw = strip_font_tables(raw)
+        header = _LENGTH1_RE.sub(b"/Length1 %d" % len(raw), header)
+    packed = zlib.compress(raw, level)
+    if not font and len(packed) >= len(data):
+        return header, data
+    if b"/Filter" not in header:
+        header = header.replace(b"<<", b"<</Filter /FlateDecode ", 1)
+    return _LENGTH_RE.sub(b"/Length %d" % len(packed), header, count=1), packed
+
+
+# --- Recompress every stream at `level`, compress the ones FPDF leaves plain, slim embedded fonts ---
+# Works on FPDF's own output layout (one xref section, direct /Length values). All pages already
+# share one resource dictionary and one font object per face, so no object merging is needed.
+def optimize_pdf(pdf: bytes, level: int = 9) -> bytes:
+    xref_at = int(_XREF_RE.search(pdf).group(1))
+    trailer = pdf[pdf.index(b"trailer", xref_at):pdf.rindex(b"startxref")]
+    objects, position = {}, 0
+    # Objects are walked in order, so binary stream data is skipped by its /Length rather than searched
+    while True:
+        match = _OBJ_RE.search(pdf, position, xref_at)
+        if not match:
+            break
+        start, end = match.end(), pdf.index(b"\nendobj", match.end())
+        stream_at = pdf.find(b"\nstream\n", start, end)
+        if stream_at == -1:
+            objects[int(match.group(1))] = (pdf[start:end], None)
+            position = end
+            continue
+        header = pdf[start:stream_at]
+        data_at = stream_at + len(b"\nstream\n")
+        data = pdf[data_at:data_at + int(_LENGTH_RE.search(header).group(1))]
+        objects[int(match.group(1))] = _optimize_stream(header, data, level)
+        position = data_at + len(data)
+
+    out = [pdf[:pdf.index(b"\n") + 1]]
+    size, offsets = len(out[0]), {}
+    for number in sorted(objects):
+        header, data = objects[number]
+        chunk = b"%d 0 obj\n" % number + header
+        chunk += b"\nstream\n" + data + b"\nendstream\nendobj\n" if data is not None else b"\nendobj\n"
+        offsets[number] = size
+        out.append(chunk)
+        size += len(chunk)
+    count = max(offsets) + 1
+    xref = [b"xref\n0 %d\n0000000000 65535 f \n" % count]
+    xref += [b"%010d 00000 n \n" % offsets[n] if n in offsets else b"0000000000 65535 f \n" for n in range(1, count)]
+    out += xref + [trailer, b"startxref\n%d\n%%%%EOF\n" % size]
+    return b"".join(out)
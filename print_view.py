@@ -0,0 +1,75 @@
+import json
+import streamlit.components.v1 as components
+
+# --- Client-Side Print View ---
+# The summaries are sent to the browser once, as JSON, and both the on-screen view
+# and the print output are built there. Text is inserted with textContent, so the
+# summary is never interpreted as HTML.
+PRINT_VIEW_HTML = """
+<!DOCTYPE html>
+<html>
+  <head>
+    <meta charset="UTF-8">
+    <style>
+      body { font-family: Arial, sans-serif; margin: 0; }
+      .toolbar { margin-bottom: 10px; }
+      .toolbar button { background-color: #4CAF50; color: white; padding: 8px 16px; border: none; border-radius: 4px; cursor: pointer; }
+      .summary { border: 1px solid #ccc; padding: 10px; margin-bottom: 10px; white-space: pre-wrap; }
+      .summary h3 { margin-top: 0; }
+      .summary .letterhead { display: none; text-align: center; }
+      @media print {
+        .toolbar { display: none; }
+        .summary { border: none; page-break-after: always; }
+        .summary .letterhead { display: block; }
+        .summary:not(.queued-for-print) { display: none; }
+      }
+    </style>
+  </head>
+  <body>
+    <div class="toolbar">
+      <button id="printLatest">Print This Summary</button>
+      <button id="printAll">Print All Queued (<span id="count"></span>)</button>
+    </div>
+    <div id="summaries"></div>
+    <script>
+      const payload = __PAYLOAD__;
+      const container = document.getElementById("summaries");
+      document.getElementById("count").textContent = payload.summaries.length;
+      payload.summaries.forEach((item, i) => {
+        const block = document.createElement("div");
+        block.className = "summary";
+        const letterhead = document.createElement("h2");
+        letterhead.className = "letterhead";
+        letterhead.textContent = payload.clinic;
+        const title = document.createElement("h3");
+        title.textContent = item.title;
+        const body = document.createElement("div");
+        body.textContent = item.text;
+        block.append(letterhead, title, body);
+        // Only the selected summary is shown on screen; the rest wait in the queue
+        if (i !== payload.current) { block.style.display = "none"; }
+        container.appendChild(block);
+      });
+      function printBlocks(blocks) {
+        document.querySelectorAll(".summary").forEach(b => b.classList.remove("queued-for-print"));
+        blocks.forEach(b => b.classList.add("queued-for-print"));
+        window.print();
+      }
+      document.getElementById("printLatest").addEventListener("click", () => {
+        printBlocks([container.children[payload.current]]);
+      });
+      document.getElementById("printAll").addEventListener("click", () => {
+        printBlocks(Array.from(container.children));
+      });
+    </script>
+  </body>
+</html>
+"""
+
+
+def render_print_view(summaries: list, clinic: str, current: int, height: int = 420):
+    # `summaries` is a list of {"title": ..., "text": ...}; `current` indexes the one shown and printed
+    payload = json.dumps({"clinic": clinic, "summaries": summaries, "current": current})
+    # Keep "</script>" inside a summary from closing the script block early
+    payload = payload.replace("</", "<\\/")
+    components.html(PRINT_VIEW_HTML.replace("__PAYLOAD__", payload), height=height, scrolling=True)
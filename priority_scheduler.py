@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+# --- Request classes, most urgent first ---
+INTERACTIVE = "interactive"
+SPECULATIVE = "speculative"
+BATCH = "batch"
+PRIORITY_LEVELS = {INTERACTIVE: 0, SPECULATIVE: 1, BATCH: 2}
+
+# Share of the provider's in-flight capacity each class may hold at once; interactive may use all of it
+DEFAULT_CLASS_SHARES = {INTERACTIVE: 1.0, SPECULATIVE: 0.25, BATCH: 0.5}
+# A waiter is promoted one priority level for every this many seconds spent queued
+DEFAULT_AGING_SECONDS = 30.0
+DELAY_WINDOW = 1000
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+# --- Priority Scheduler ---
+# Admits provider calls in front of the per-provider limit. A free slot goes to the waiter
+# with the best aged priority level; within a level, to the clinician with the fewest calls
+# in flight, then first come first served. Per-class caps keep background work from filling
+# every slot, so an interactive checkout always finds one soon. Runs on one event loop only.
+class PriorityScheduler:
+    def __init__(self, capacity: int, class_shares: dict = None, aging_seconds: float = DEFAULT_AGING_SECONDS):
+        self.capacity = capacity
+        shares = dict(DEFAULT_CLASS_SHARES, **(class_shares or {}))
+        self.class_limits = {c: max(1, int(capacity * share)) for c, share in shares.items()}
+        self.aging_seconds = aging_seconds
+        self._waiters = []
+        self._in_flight = 0
+        self._class_in_flight = {c: 0 for c in PRIORITY_LEVELS}
+        self._clinician_in_flight = {}
+        self._delays = {c: deque(maxlen=DELAY_WINDOW) for c in PRIORITY_LEVELS}
+
+    @asynccontextmanager
+    async def slot(self, priority: str = INTERACTIVE, clinician: str = ""):
+        if priority not in PRIORITY_LEVELS:
+            raise ValueError(f"Unknown priority class: {priority}")
+        waiter = {"priority": priority, "clinician": clinician, "queued_at": time.monotonic(),
+                  "future": asyncio.get_running_loop().create_future()}
+        self._waiters.append(waiter)
+        self._dispatch()
+        try:
+            await waiter["future"]
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            elif not waiter["future"].cancelled():
+                self._release(priority, clinician)
+            raise
+        try:
+            yield
+        finally:
+            self._release(priority, clinician)
+
+    def _release(self, priority: str, clinician: str):
+        self._in_flight -= 1
+        self._class_in_flight[priority] -= 1
+        self._clinician_in_flight[clinician] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._in_flight < self.capacity:
+            now = time.monotonic()
+            eligible = [w for w in self._waiters
+                        if self._class_in_flight[w["priority"]] < self.class_limits[w["priority"]]]
+            if not eligible:
+                return
+            waiter = min(eligible, key=lambda w: (
+                PRIORITY_LEVELS[w["priority"]] - int((now - w["queued_at"]) / self.aging_seconds),
+                self._clinician_in_flight.get(w["clinician"], 0),
+                w["queued_at"],
+            ))
+            self._waiters.remove(waiter)
+            self._in_flight += 1
+            self._class_in_flight[waiter["priority"]] += 1
+            self._clinician_in_flight[waiter["clinician"]] = self._clinician_in_flight.get(waiter["clinician"], 0) + 1
+            self._delays[waiter["priority"]].append(now - waiter["queued_at"])
+            waiter["future"].set_result(None)
+
+    # --- Queueing delay per class over the last DELAY_WINDOW admissions ---
+    def stats(self) -> dict:
+        waiting = {c: 0 for c in PRIORITY_LEVELS}
+        for w in self._waiters:
+            waiting[w["priority"]] += 1
+        return {c: {"admitted": len(d), "waiting": waiting[c], "in_flight": self._class_in_flight[c],
+                    "p50_delay": percentile(list(d), 0.5), "p95_delay": percentile(list(d), 0.95)}
+                for c, d in self._delays.items()}
+
+
+# --- Simulation: interactive checkouts arriving while a large batch is queued ---
+async def simulate(batch_size: int, interactive: int, capacity: int, latency: float, scheduled: bool) -> list:
+    scheduler = PriorityScheduler(capacity) if scheduled else PriorityScheduler(capacity, {SPECULATIVE: 1.0, BATCH: 1.0},
+                                                                                aging_seconds=float("inf"))
+    latencies = []
+
+    async def call(priority: str, clinician: str):
+        start = time.monotonic()
+        # Without scheduling, everything is one first-come-first-served class
+        async with scheduler.slot(priority if scheduled else BATCH, clinician if scheduled else ""):
+            await asyncio.sleep(latency)
+        if priority == INTERACTIVE:
+            latencies.append(time.monotonic() - start)
+
+    batch = [asyncio.ensure_future(call(BATCH, "overnight")) for _ in range(batch_size)]
+    for i in range(interactive):
+        await asyncio.sleep(latency / 4)
+        batch.append(asyncio.ensure_future(call(INTERACTIVE, f"clinician-{i % 5}")))
+    await asyncio.gather(*batch)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Interactive latency while a batch is running, with and without priorities")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--interactive", type=int, default=40)
+    parser.add_argument("--capacity", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated provider call seconds")
+    args = parser.parse_args()
+    for scheduled in (False, True):
+        alone = asyncio.run(simulate(0, args.interactive, args.capacity, args.latency, scheduled))
+        loaded = asyncio.run(simulate(args.batch, args.interactive, args.capacity, args.latency, scheduled))
+        print(f"{'priority' if scheduled else 'fifo':8s} interactive p95: idle={percentile(alone, 0.95):.3f}s  "
+              f"during {args.batch}-visit batch={percentile(loaded, 0.95):.3f}s")
@@ -0,0 +1,197 @@
+import asyncio
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+SYSTEM_PROMPT = "You are a knowledgeable medical assistant."
+
+# Models without JSON-mode support (response_format)
+LEGACY_OPENAI_MODELS = {"gpt-4", "gpt-4-0314", "gpt-4-0613", "gpt-3.5-turbo-0613"}
+
+
+# --- OpenAI (openai==0.28 ChatCompletion API) ---
+class OpenAIProvider:
+    name = "openai"
+
+    def __init__(self, api_key: str, model: str = "gpt-4", max_tokens: int = 550, temperature: float = 0.6):
+        import openai
+        openai.api_key = api_key
+        self._openai = openai
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+
+    def generate(self, prompt: str, json_mode: bool = False) -> str:
+        extra = {}
+        # Base gpt-4 rejects response_format; the JSON shape is then requested by the prompt alone
+        if json_mode and self.model not in LEGACY_OPENAI_MODELS:
+            extra["response_format"] = {"type": "json_object"}
+        response = self._openai.ChatCompletion.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            **extra
+        )
+        return response.choices[0].message.content.strip()
+
+    # openai 0.28 ships an aiohttp-based acreate, so no thread is held while waiting
+    async def agenerate(self, prompt: str, json_mode: bool = False) -> str:
+        extra = {}
+        if json_mode and self.model not in LEGACY_OPENAI_MODELS:
+            extra["response_format"] = {"type": "json_object"}
+        response = await self._openai.ChatCompletion.acreate(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            **extra
+        )
+        return response.choices[0].message.content.strip()
+
+
+# --- Google Gemini (google-generativeai) ---
+class GeminiProvider:
+    name = "gemini"
+
+    def __init__(self, api_key: str, model: str = "gemini-1.5-pro"):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self._model = genai.GenerativeModel(model)
+        self.model = model
+
+    # google-generativeai 0.4 has no JSON response mode, so json_mode relies on the prompt
+    def generate(self, prompt: str, json_mode: bool = False) -> str:
+        return self._model.generate_content(prompt).text.strip()
+
+    async def agenerate(self, prompt: str, json_mode: bool = False) -> str:
+        response = await self._model.generate_content_async(prompt)
+        return response.text.strip()
+
+
+# --- Local Offline Model (llama.cpp via llama-cpp-python, CPU only) ---
+# Loaded models are shared by every session in the process, keyed by model path, and each
+# has exactly one worker thread: a Llama object is not thread-safe, and providers come and
+# go with config reloads while the model stays loaded.
+_LOCAL_MODELS = {}
+_LOCAL_WORKERS = {}
+_LOCAL_MODELS_LOCK = threading.Lock()
+
+
+def load_local_model(model_path: str, n_ctx: int = 4096, n_threads: int = None):
+    with _LOCAL_MODELS_LOCK:
+        if model_path not in _LOCAL_MODELS:
+            try:
+                from llama_cpp import Llama, LlamaRAMCache
+            except ImportError as e:
+                raise RuntimeError("The local provider needs llama-cpp-python: pip install llama-cpp-python") from e
+            if not os.path.exists(model_path):
+                raise RuntimeError(f"Local model file not found: {model_path}")
+            llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads or os.cpu_count(),
+                        n_gpu_layers=0, verbose=False)
+            # Keeps the KV state of the fixed system/instruction prefix between requests
+            llm.set_cache(LlamaRAMCache(capacity_bytes=512 << 20))
+            _LOCAL_MODELS[model_path] = llm
+        return _LOCAL_MODELS[model_path]
+
+
+# Concurrent callers enqueue and wait; the model's worker drains the queue in batches so
+# requests run back to back on a warm prefix cache instead of thrashing it.
+class LocalModelWorker:
+    def __init__(self, llm, max_batch: int = 8):
+        self._llm = llm
+        self.max_batch = max_batch
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="local-llm-worker", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: str, json_mode: bool, max_tokens: int, temperature: float) -> Future:
+        future = Future()
+        self._requests.put((prompt, json_mode, max_tokens, temperature, future))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self._requests.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._requests.get_nowait())
+                except queue.Empty:
+                    break
+            for prompt, json_mode, max_tokens, temperature, future in batch:
+                try:
+                    future.set_result(self._complete(prompt, json_mode, max_tokens, temperature))
+                except Exception as e:
+                    future.set_exception(e)
+
+    def _complete(self, prompt: str, json_mode: bool, max_tokens: int, temperature: float) -> str:
+        # llama.cpp constrains sampling to valid JSON with a grammar when asked
+        response = self._llm.create_chat_completion(
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            max_tokens=max_tokens,
+            temperature=temperature,
+            response_format={"type": "json_object"} if json_mode else None,
+        )
+        return response["choices"][0]["message"]["content"].strip()
+
+
+def local_model_worker(model_path: str, n_ctx: int = 4096, max_batch: int = 8) -> LocalModelWorker:
+    llm = load_local_model(model_path, n_ctx=n_ctx)
+    with _LOCAL_MODELS_LOCK:
+        if model_path not in _LOCAL_WORKERS:
+            _LOCAL_WORKERS[model_path] = LocalModelWorker(llm, max_batch=max_batch)
+        return _LOCAL_WORKERS[model_path]
+
+
+class LocalLlamaProvider:
+    name = "local"
+
+    def __init__(self, model_path: str, max_tokens: int = 550, temperature: float = 0.6,
+                 max_batch: int = 8, n_ctx: int = 4096):
+        self.model = os.path.basename(model_path)
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.max_batch = max_batch
+        self._worker = local_model_worker(model_path, n_ctx=n_ctx, max_batch=max_batch)
+
+    def generate(self, prompt: str, json_mode: bool = False) -> str:
+        return self._submit(prompt, json_mode).result()
+
+    # Awaits the worker's future directly, so no executor thread waits on the model
+    async def agenerate(self, prompt: str, json_mode: bool = False) -> str:
+        return await asyncio.wrap_future(self._submit(prompt, json_mode))
+
+    def _submit(self, prompt: str, json_mode: bool) -> Future:
+        return self._worker.submit(prompt, json_mode, self.max_tokens, self.temperature)
+
+
+# --- Provider Factory ---
+def make_provider(name: str, **settings):
+    if name == "openai":
+        return OpenAIProvider(**settings)
+    if name == "gemini":
+        return GeminiProvider(**settings)
+    if name == "local":
+        return LocalLlamaProvider(**settings)
+    raise ValueError(f"Unknown provider: {name}")
+
+
+# --- Provider for the loaded AVSConfig ("local" runs offline) ---
+def provider_from_config(config):
+    if config.provider == "local":
+        return make_provider("local", model_path=config.local_model_path,
+                             max_tokens=config.max_tokens, temperature=config.temperature)
+    if config.provider == "gemini":
+        return make_provider("gemini", api_key=config.gemini_api_key, model=config.gemini_model)
+    return make_provider("openai", api_key=config.openai_api_key, model=config.openai_model,
+                         max_tokens=config.max_tokens, temperature=config.temperature)
@@ -0,0 +1,137 @@
+import argparse
+import socketserver
+import threading
+import time
+
+# --- Local Redis stand-in ---
+# Speaks the subset of RESP2 that cache_backend.RedisBackend uses (GET/SET/MGET/DEL,
+# WATCH/MULTI/EXEC, AUTH/SELECT/PING/FLUSHDB), so several app replicas can share a cache
+# on a laptop or in CI without installing Redis. Not durable; one global keyspace.
+
+
+class _Store:
+    def __init__(self):
+        self.data = {}
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def get(self, key: bytes) -> bytes:
+        value, expires = self.data.get(key, (None, 0))
+        if value is not None and expires and expires <= time.time():
+            self._delete(key)
+            return None
+        return value
+
+    def set(self, key: bytes, value: bytes, ttl: float = None):
+        self.data[key] = (value, time.time() + ttl if ttl else 0)
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _delete(self, key: bytes) -> int:
+        existed = self.data.pop(key, None) is not None
+        self.versions[key] = self.versions.get(key, 0) + 1
+        return int(existed)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        store = self.server.store
+        watched, queued = {}, None
+        while True:
+            command = self._read_command()
+            if command is None:
+                return
+            name, args = command[0].upper(), command[1:]
+            if name == b"MULTI":
+                queued = []
+                self._write(b"+OK\r\n")
+            elif name == b"DISCARD":
+                queued, watched = None, {}
+                self._write(b"+OK\r\n")
+            elif name == b"EXEC":
+                with store.lock:
+                    if any(store.versions.get(k, 0) != v for k, v in watched.items()):
+                        self._write(b"*-1\r\n")
+                    else:
+                        replies = [self._run(store, c[0].upper(), c[1:]) for c in queued or []]
+                        self._write(b"*%d\r\n" % len(replies) + b"".join(replies))
+                queued, watched = None, {}
+            elif queued is not None:
+                queued.append(command)
+                self._write(b"+QUEUED\r\n")
+            elif name == b"WATCH":
+                with store.lock:
+                    watched.update({k: store.versions.get(k, 0) for k in args})
+                self._write(b"+OK\r\n")
+            elif name == b"UNWATCH":
+                watched = {}
+                self._write(b"+OK\r\n")
+            else:
+                with store.lock:
+                    self._write(self._run(store, name, args))
+
+    def _run(self, store: _Store, name: bytes, args: list) -> bytes:
+        if name in (b"PING", b"AUTH", b"SELECT"):
+            return b"+PONG\r\n" if name == b"PING" else b"+OK\r\n"
+        if name == b"GET":
+            return _bulk(store.get(args[0]))
+        if name == b"MGET":
+            return b"*%d\r\n" % len(args) + b"".join(_bulk(store.get(k)) for k in args)
+        if name == b"SET":
+            ttl = float(args[3]) if len(args) >= 4 and args[2].upper() == b"EX" else None
+            store.set(args[0], args[1], ttl)
+            return b"+OK\r\n"
+        if name == b"DEL":
+            return b":%d\r\n" % sum(store._delete(k) for k in args)
+        if name == b"FLUSHDB":
+            for key in list(store.data):
+                store._delete(key)
+            return b"+OK\r\n"
+        return b"-ERR unknown command '%s'\r\n" % name
+
+    def _read_command(self) -> list:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()
+        parts = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            parts.append(self.rfile.read(length + 2)[:-2])
+        return parts
+
+    def _write(self, data: bytes):
+        self.wfile.write(data)
+        self.wfile.flush()
+
+
+def _bulk(value: bytes) -> bytes:
+    return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+
+
+class RedisStandin(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _Handler)
+        self.store = _Store()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> "RedisStandin":
+        threading.Thread(target=self.serve_forever, name="redis-standin", daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local Redis-protocol stand-in for the AVS cache")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+    server = RedisStandin(args.host, args.port)
+    print(f"Serving {server.url}")
+    server.serve_forever()
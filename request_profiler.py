@@ -0,0 +1,168 @@
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Profiles running right now; empty almost always, so @profiled costs one truth test per call
+_ACTIVE = []
+_ACTIVE_LOCK = threading.Lock()
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+# The session whose work the current code is doing, and which threads are doing work for which session
+_SCOPE = contextvars.ContextVar("avs_profile_scope", default=None)
+_THREAD_SCOPES = {}
+
+
+# --- Mark the enclosed work (on this thread, and in tasks or contexts copied from it) as a session's ---
+@contextlib.contextmanager
+def profile_scope(scope: str):
+    token = _SCOPE.set(scope)
+    ident = threading.get_ident()
+    previous = _THREAD_SCOPES.get(ident)
+    _THREAD_SCOPES[ident] = scope
+    try:
+        yield
+    finally:
+        _SCOPE.reset(token)
+        if previous is None:
+            _THREAD_SCOPES.pop(ident, None)
+        else:
+            _THREAD_SCOPES[ident] = previous
+
+
+# --- Sampling profiler for one session, every `interval` seconds, from a daemon thread ---
+# Generation crosses threads (the rerun, job workers, PDF renderers), so every thread working
+# in the profiled session's scope is sampled and written as its own speedscope profile, alongside
+# the spans timed in that scope. Other sessions' threads and spans are left out.
+class RequestProfiler:
+    def __init__(self, name: str, scope: str, interval: float = 0.01):
+        self.name = name
+        self.scope = scope
+        self.interval = interval
+        self._frames, self._frame_index = [], {}
+        self._frames_lock = threading.Lock()
+        self._samples = {}
+        self._spans = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.started = self.finished = None
+
+    def _frame_id(self, name: str, file: str, line: int) -> int:
+        key = (name, file, line)
+        with self._frames_lock:
+            if key not in self._frame_index:
+                self._frame_index[key] = len(self._frames)
+                self._frames.append({"name": name, "file": file, "line": line})
+            return self._frame_index[key]
+
+    def _sample(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if _THREAD_SCOPES.get(ident) != self.scope:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(self._frame_id(code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                thread = names.get(ident, str(ident))
+                self._samples.setdefault(thread, []).append((stack[::-1], now - last))
+            last = now
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample, name="avs-profiler", daemon=True)
+        self._thread.start()
+        with _ACTIVE_LOCK:
+            _ACTIVE.append(self)
+
+    def stop(self):
+        with _ACTIVE_LOCK:
+            if self in _ACTIVE:
+                _ACTIVE.remove(self)
+        self._stop.set()
+        self._thread.join()
+        self.finished = time.perf_counter()
+
+    def record_span(self, label: str, start: float, end: float):
+        thread = threading.current_thread().name
+        frame = self._frame_id(label, "span", 0)
+        # A span already running when profiling began is clipped to the profile's start
+        self._spans.setdefault(thread, []).append((frame, max(0.0, start - self.started), end - self.started))
+
+    def span_totals(self) -> dict:
+        totals = {}
+        for spans in self._spans.values():
+            for frame, start, end in spans:
+                name = self._frames[frame]["name"]
+                totals[name] = totals.get(name, 0.0) + end - start
+        return totals
+
+    # --- speedscope file format: sampled profile per busy thread, evented profile per thread's spans ---
+    def to_speedscope(self) -> dict:
+        duration = self.finished - self.started
+        profiles = []
+        for thread, samples in sorted(self._samples.items()):
+            # Threads that only sat in one wait the whole time add nothing to the picture
+            if len({tuple(stack) for stack, _ in samples}) <= 1:
+                continue
+            profiles.append({"type": "sampled", "name": thread, "unit": "seconds", "startValue": 0,
+                             "endValue": duration, "samples": [stack for stack, _ in samples],
+                             "weights": [weight for _, weight in samples]})
+        for thread, spans in sorted(self._spans.items()):
+            # Spans on one thread nest (a PDF render inside a job): at equal times closes come
+            # before opens, outer spans open first and inner spans close first
+            keyed = []
+            for frame, start, end in spans:
+                keyed.append(((start, 1, -end), {"type": "O", "frame": frame, "at": start}))
+                keyed.append(((end, 0, -start), {"type": "C", "frame": frame, "at": end}))
+            events = [event for _, event in sorted(keyed, key=lambda k: k[0])]
+            profiles.append({"type": "evented", "name": f"spans: {thread}", "unit": "seconds",
+                             "startValue": 0, "endValue": duration, "events": events})
+        return {"$schema": SPEEDSCOPE_SCHEMA, "name": self.name, "exporter": "avs request_profiler",
+                "activeProfileIndex": 0, "shared": {"frames": self._frames}, "profiles": profiles}
+
+    def save(self, directory: str) -> str:
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        path = os.path.join(directory, f"{stamp}_{self.name}.speedscope.json")
+        with open(path, "w") as f:
+            json.dump(self.to_speedscope(), f)
+        return path
+
+
+# --- Decorator timing a call as a named span in the active profile of the caller's session ---
+def profiled(label: str):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            scope = _SCOPE.get()
+            if not _ACTIVE or scope is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                # A pool thread running in a copied context is sampled for the call's duration
+                with profile_scope(scope):
+                    return func(*args, **kwargs)
+            finally:
+                end = time.perf_counter()
+                for profiler in list(_ACTIVE):
+                    if profiler.scope == scope:
+                        profiler.record_span(label, start, end)
+        return wrapper
+    return decorate
+
+
+def list_profiles(directory: str, limit: int = 10) -> list:
+    if not os.path.isdir(directory):
+        return []
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".speedscope.json")]
+    return sorted(paths, key=os.path.getmtime, reverse=True)[:limit]
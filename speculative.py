@@ -0,0 +1,112 @@
+import asyncio
+import hashlib
+import time
+from collections import deque
+from priority_scheduler import SPECULATIVE
+
+DEFAULT_DEBOUNCE_SECONDS = 2.5
+DEFAULT_MAX_PER_HOUR = 200
+# A finished (or never started) speculation is kept this long for the Generate click, then dropped
+RESULT_TTL_SECONDS = 300.0
+
+
+def prompt_key(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+# --- Speculative Pre-Generation ---
+# Every rerun reports the prompt the sidebar would produce. Once it has been unchanged for
+# the debounce period a generation starts on the core's event loop; any change cancels the
+# pending timer or the in-flight task. When Generate is clicked with the same prompt the
+# finished (or nearly finished) result is taken instead of starting from scratch.
+# A session that never clicks Generate loses its entry RESULT_TTL_SECONDS after the result is ready.
+# All state is touched on the event loop thread only.
+class SpeculativeGenerator:
+    def __init__(self, core, debounce_seconds: float = DEFAULT_DEBOUNCE_SECONDS,
+                 max_per_hour: int = DEFAULT_MAX_PER_HOUR):
+        self.core = core
+        self.debounce_seconds = debounce_seconds
+        self.max_per_hour = max_per_hour
+        self._sessions = {}
+        self._started = deque()
+        self.stats = {"started": 0, "cancelled": 0, "hits": 0, "misses": 0, "capped": 0}
+
+    # --- Called from the script thread on every rerun ---
+    def observe(self, session_id: str, prompt: str):
+        self.core.call_soon(self._observe, session_id, prompt)
+
+    # --- Called on click: the speculative sections for this prompt, or None ---
+    def take(self, session_id: str, prompt: str, timeout: float = 60.0) -> dict:
+        return self.core.run(self._take(session_id, prompt_key(prompt), timeout))
+
+    def _observe(self, session_id: str, prompt: str):
+        key = prompt_key(prompt)
+        state = self._sessions.get(session_id)
+        if state and state["key"] == key:
+            return
+        self._cancel(state)
+        loop = asyncio.get_running_loop()
+        state = {"key": key, "prompt": prompt, "task": None, "timer": None}
+        state["timer"] = loop.call_later(self.debounce_seconds, self._start, session_id, state)
+        self._sessions[session_id] = state
+
+    def _start(self, session_id: str, state: dict):
+        state["timer"] = None
+        if self._sessions.get(session_id) is not state:
+            return
+        loop = asyncio.get_running_loop()
+        if not self._within_cap():
+            loop.call_later(RESULT_TTL_SECONDS, self._expire, session_id, state)
+            return
+        self.stats["started"] += 1
+        state["task"] = asyncio.ensure_future(
+            self.core.agenerate_sections(state["prompt"], priority=SPECULATIVE, clinician=session_id)
+        )
+        state["task"].add_done_callback(
+            lambda _: loop.call_later(RESULT_TTL_SECONDS, self._expire, session_id, state))
+
+    def _expire(self, session_id: str, state: dict):
+        if self._sessions.get(session_id) is state:
+            del self._sessions[session_id]
+
+    def _within_cap(self) -> bool:
+        now = time.monotonic()
+        while self._started and now - self._started[0] > 3600:
+            self._started.popleft()
+        if len(self._started) >= self.max_per_hour:
+            self.stats["capped"] += 1
+            return False
+        self._started.append(now)
+        return True
+
+    # --- Called when the config is reloaded: cancel every pending timer and in-flight task ---
+    def close(self):
+        self.core.call_soon(self._cancel_all)
+
+    def _cancel_all(self):
+        for state in self._sessions.values():
+            self._cancel(state)
+        self._sessions.clear()
+
+    def _cancel(self, state: dict):
+        if not state:
+            return
+        if state["timer"]:
+            state["timer"].cancel()
+        if state["task"] and not state["task"].done():
+            state["task"].cancel()
+            self.stats["cancelled"] += 1
+
+    async def _take(self, session_id: str, key: str, timeout: float) -> dict:
+        state = self._sessions.pop(session_id, None)
+        if not state or state["key"] != key or state["task"] is None:
+            self._cancel(state)
+            self.stats["misses"] += 1
+            return None
+        try:
+            sections = await asyncio.wait_for(state["task"], timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError, Exception):
+            self.stats["misses"] += 1
+            return None
+        self.stats["hits" if sections else "misses"] += 1
+        return sections
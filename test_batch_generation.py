@@ -0,0 +1,32 @@
+from avs_config import AVSConfig
+from avs_prompt import build_prompt
+from batch_generation import INGESTED, DeferredQueue, OpenAIBatchClient, poll_and_ingest, submit_pending
+from freetext_parse import DEFAULT_INPUTS
+from mock_batch_server import MockBatchServer
+from visit_history import VisitHistory
+
+
+def test_submit_then_ingest_against_mock_server(tmp_path):
+    server = MockBatchServer(complete_after=0).start()
+    try:
+        queue = DeferredQueue(str(tmp_path / "batches.db"))
+        history = VisitHistory(str(tmp_path / "history.db"))
+        inputs = dict(DEFAULT_INPUTS, ckd_stage="IV")
+        for i in range(3):
+            queue.defer(f"p{i}", "2026-10-20", inputs, build_prompt(inputs))
+        client = OpenAIBatchClient("sk-test", server.url)
+
+        batch_id = submit_pending(queue, client, AVSConfig(openai_model="gpt-4o"))
+        assert batch_id
+        # Nothing is left pending, so a second submit sends nothing
+        assert submit_pending(queue, client, AVSConfig(openai_model="gpt-4o")) is None
+
+        totals = poll_and_ingest(queue, client, history)
+        assert totals == {"ingested": 3, "failed": 0, "open": 0}
+        assert queue.counts() == {INGESTED: 3}
+        visits = history.visits_between("2026-10-20", "2026-10-20")
+        assert len(visits) == 3
+        assert history.get_pdf(visits[0]["id"]).startswith(b"%PDF")
+    finally:
+        server.shutdown()
+        server.server_close()
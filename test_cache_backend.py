@@ -0,0 +1,67 @@
+import threading
+import time
+from cache_backend import BUCKET_PREFIX, InProcessBackend, RedisBackend
+from redis_standin import RedisStandin
+
+
+def test_in_process_evicts_least_recently_used():
+    cache = InProcessBackend(max_entries=3)
+    cache.set_many({"a": b"1", "b": b"2", "c": b"3"})
+    assert cache.get("a") == b"1"
+    cache.set("d", b"4")
+    assert cache.get_many(["a", "b", "c", "d"]) == [b"1", None, b"3", b"4"]
+
+
+def test_in_process_caps_bytes():
+    cache = InProcessBackend(max_bytes=10)
+    cache.set_many({"a": b"12345", "b": b"12345"})
+    cache.set("c", b"123")
+    assert cache.get_many(["a", "b", "c"]) == [None, b"12345", b"123"]
+
+
+def test_in_process_sweeps_expired_entries_on_write(monkeypatch):
+    cache = InProcessBackend()
+    cache.set("old", b"x", ttl=1)
+    now = time.time() + 5
+    monkeypatch.setattr(time, "time", lambda: now)
+    cache._next_sweep = 0.0
+    cache.set("new", b"y")
+    assert list(cache._data) == ["new"]
+
+
+def test_redis_backend_pipelines_mget_and_set():
+    server = RedisStandin().start()
+    try:
+        backend = RedisBackend(server.url)
+        backend.set_many({"k1": b"v1", "k2": "v2", "k3": b"\x00\r\nbinary"}, ttl=60)
+        assert backend.get_many(["k1", "k2", "missing", "k3"]) == [b"v1", b"v2", None, b"\x00\r\nbinary"]
+        assert backend.get("k1") == b"v1"
+        backend.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_redis_token_bucket_is_shared_across_clients():
+    server = RedisStandin().start()
+    try:
+        backends = [RedisBackend(server.url) for _ in range(4)]
+        granted = []
+
+        def take(backend):
+            for _ in range(5):
+                granted.append(backend.acquire_tokens("provider", rate=0.001, capacity=10) == 0.0)
+
+        threads = [threading.Thread(target=take, args=(backend,)) for backend in backends]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 20 requests against a bucket of 10: WATCH/EXEC grants exactly the capacity
+        assert granted.count(True) == 10
+        assert server.store.get((BUCKET_PREFIX + "provider").encode()) is not None
+        for backend in backends:
+            backend.close()
+    finally:
+        server.shutdown()
+        server.server_close()
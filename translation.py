@@ -0,0 +1,117 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+
+DEFAULT_DB_PATH = "avs_translation.db"
+
+# Only scripts the PDF renderer can draw: DejaVu covers Latin, Vietnamese and Cyrillic, but has no
+# CJK glyphs, and FPDF 1.7.2 cannot lay out right-to-left text such as Arabic
+SUPPORTED_LANGUAGES = ["English", "Spanish", "Vietnamese", "French", "Swahili"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS translations (
+    language TEXT NOT NULL,
+    source_hash TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    PRIMARY KEY (language, source_hash)
+);
+"""
+
+# Sentence boundaries and line breaks; the separators are kept so layout survives translation
+_SEGMENT_RE = re.compile(r"(\s*\n\s*|(?<=[.!?])\s+)")
+
+
+def _key(sentence: str) -> str:
+    return hashlib.sha1(" ".join(sentence.split()).encode("utf-8")).hexdigest()
+
+
+# --- Sentence-level translation memory (SQLite on disk, dict in memory) ---
+# Boilerplate education sentences repeat across visits, so most of a summary is a hit.
+class TranslationMemory:
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, language: str, sentences: list) -> dict:
+        found = {}
+        missing = []
+        with self._lock:
+            for sentence in sentences:
+                cached = self._cache.get((language, _key(sentence)))
+                if cached is None:
+                    missing.append(sentence)
+                else:
+                    found[sentence] = cached
+            for sentence in missing:
+                row = self._conn.execute(
+                    "SELECT target FROM translations WHERE language = ? AND source_hash = ?",
+                    (language, _key(sentence)),
+                ).fetchone()
+                if row:
+                    found[sentence] = row[0]
+                    self._cache[(language, _key(sentence))] = row[0]
+            self.hits += len(found)
+            self.misses += len(sentences) - len(found)
+        return found
+
+    def store(self, language: str, pairs: dict):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO translations (language, source_hash, source, target) VALUES (?, ?, ?, ?)",
+                [(language, _key(source), source, target) for source, target in pairs.items()],
+            )
+            self._conn.commit()
+            for source, target in pairs.items():
+                self._cache[(language, _key(source))] = target
+
+
+# --- Translate text sentence by sentence; only sentences not in memory reach the model ---
+# `translate_batch(sentences, language)` returns the translations in the same order.
+def translate_texts(texts: list, language: str, memory: TranslationMemory, translate_batch) -> list:
+    split = [_SEGMENT_RE.split(text) for text in texts]
+    sentences = list(dict.fromkeys(part for parts in split for part in parts[::2] if part.strip()))
+    known = memory.lookup(language, sentences)
+    missing = [s for s in sentences if s not in known]
+    if missing:
+        translated = translate_batch(missing, language)
+        if len(translated) != len(missing):
+            raise ValueError("Translation returned a different number of sentences")
+        new_pairs = dict(zip(missing, translated))
+        memory.store(language, new_pairs)
+        known.update(new_pairs)
+    # Even indices are sentences, odd indices the separators between them
+    return ["".join(known.get(part, part) if i % 2 == 0 else part for i, part in enumerate(parts)) for parts in split]
+
+
+def translate_sections(sections: dict, language: str, memory: TranslationMemory, translate_batch) -> dict:
+    headings = list(sections)
+    translated = translate_texts(headings + [sections[h] for h in headings], language, memory, translate_batch)
+    return dict(zip(translated[:len(headings)], translated[len(headings):]))
+
+
+# --- One model call per batch of uncached sentences ---
+def make_llm_translator(generate):
+    def translate_batch(sentences: list, language: str) -> list:
+        prompt = (
+            f"Translate each English string in this JSON array into {language} for a patient handout. "
+            "Use plain, patient-friendly wording and keep numbers, units and medication names unchanged. "
+            'Respond with only a JSON object of the form {"translations": [...]} with the same number '
+            "of strings in the same order.\n" + json.dumps(sentences, ensure_ascii=False)
+        )
+        reply = generate(prompt, json_mode=True).strip()
+        if reply.startswith("```"):
+            reply = reply.strip("`")
+            reply = reply[reply.find("{"):]
+        parsed = json.loads(reply)
+        translations = parsed.get("translations") if isinstance(parsed, dict) else None
+        if not isinstance(translations, list):
+            raise ValueError("translation reply is not a JSON object with a translations list")
+        return [str(t) for t in translations]
+    return translate_batch
@@ -0,0 +1,125 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date
+
+# --- Default Location of the Local Visit Store ---
+DEFAULT_DB_PATH = "avs_history.db"
+
+# --- Schema: one row per visit, indexed by patient and date ---
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS visits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    patient_id TEXT NOT NULL,
+    visit_date TEXT NOT NULL,
+    inputs TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    pdf BLOB,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE INDEX IF NOT EXISTS idx_visits_patient_date ON visits (patient_id, visit_date);
+CREATE INDEX IF NOT EXISTS idx_visits_date ON visits (visit_date);
+"""
+
+
+class VisitHistory:
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, prefill_cache_size: int = 256):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        # Streamlit reruns happen on different threads, so share one connection behind a lock
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._prefill_cache = OrderedDict()
+        self._prefill_cache_size = prefill_cache_size
+
+    # --- Writes ---
+    def save_visit(self, patient_id: str, inputs: dict, prompt: str, summary: str,
+                   pdf_bytes: bytes = None, visit_date: str = None) -> int:
+        visit_date = visit_date or date.today().isoformat()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO visits (patient_id, visit_date, inputs, prompt, summary, pdf) VALUES (?, ?, ?, ?, ?, ?)",
+                (patient_id, visit_date, json.dumps(inputs), prompt, summary, pdf_bytes),
+            )
+            self._conn.commit()
+            self._prefill_cache.pop(patient_id, None)
+        return cursor.lastrowid
+
+    # --- Reads ---
+    def latest_visit(self, patient_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM visits WHERE patient_id = ? ORDER BY visit_date DESC, id DESC LIMIT 1",
+                (patient_id,),
+            ).fetchone()
+        return _row_to_visit(row) if row else None
+
+    def visits_for_patient(self, patient_id: str, start_date: str = None, end_date: str = None) -> list:
+        query = "SELECT * FROM visits WHERE patient_id = ?"
+        params = [patient_id]
+        if start_date:
+            query += " AND visit_date >= ?"
+            params.append(start_date)
+        if end_date:
+            query += " AND visit_date <= ?"
+            params.append(end_date)
+        query += " ORDER BY visit_date, id"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [_row_to_visit(row) for row in rows]
+
+    def visits_between(self, start_date: str, end_date: str, include_pdf: bool = False) -> list:
+        columns = "*" if include_pdf else "id, patient_id, visit_date, inputs, prompt, summary, created_at"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {columns} FROM visits WHERE visit_date BETWEEN ? AND ? ORDER BY visit_date, id",
+                (start_date, end_date),
+            ).fetchall()
+        return [_row_to_visit(row) for row in rows]
+
+    def iter_visits_between(self, start_date: str, end_date: str, include_pdf: bool = False):
+        # Streams rows from a dedicated read connection so large batches never sit in memory at once
+        columns = "*" if include_pdf else "id, patient_id, visit_date, inputs, prompt, summary, created_at"
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        try:
+            for row in conn.execute(
+                f"SELECT {columns} FROM visits WHERE visit_date BETWEEN ? AND ? ORDER BY visit_date, id",
+                (start_date, end_date),
+            ):
+                yield _row_to_visit(row)
+        finally:
+            conn.close()
+
+    def get_pdf(self, visit_id: int) -> bytes:
+        with self._lock:
+            row = self._conn.execute("SELECT pdf FROM visits WHERE id = ?", (visit_id,)).fetchone()
+        return row["pdf"] if row else None
+
+    # --- Prior-Visit Prefill (served from an in-memory LRU) ---
+    def prefill_inputs(self, patient_id: str) -> dict:
+        with self._lock:
+            if patient_id in self._prefill_cache:
+                self._prefill_cache.move_to_end(patient_id)
+                return self._prefill_cache[patient_id]
+        visit = self.latest_visit(patient_id)
+        inputs = visit["inputs"] if visit else {}
+        with self._lock:
+            self._prefill_cache[patient_id] = inputs
+            if len(self._prefill_cache) > self._prefill_cache_size:
+                self._prefill_cache.popitem(last=False)
+        return inputs
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _row_to_visit(row: sqlite3.Row) -> dict:
+    visit = dict(row)
+    visit["inputs"] = json.loads(visit["inputs"])
+    return visit